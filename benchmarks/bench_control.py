@@ -0,0 +1,102 @@
+import threading
+import time
+from typing import Iterable
+
+import numpy as np
+
+from benchmarks.common import summarize
+
+STEER_INPUTS = (0.5, -0.5)  # Alternating stick positions, so every input changes the steering target
+INPUT_INTERVAL_S = 0.1  # Longer than the output filter's minimum interval, so no input waits for the next tick
+COMMAND_TIMEOUT_S = 2.0
+
+
+def _timed_hub_factory(latency_s: float):
+    from odbot.fake_hub import FakeHub
+
+    class TimedFakeHub(FakeHub):
+        """FakeHub that timestamps when each steering target has been applied on the hub"""
+
+        def __init__(self, device=None):
+            super().__init__(device, latency_s)
+            self.applied = threading.Condition()
+            self.steer_applied = {}
+
+        def _eval(self, expr: str):
+            result = super()._eval(expr)
+            if expr.startswith("_odb("):
+                steer = expr[len("_odb("):-1].split(", ")[1]
+                with self.applied:
+                    self.steer_applied[steer] = time.perf_counter()
+                    self.applied.notify_all()
+            return result
+
+    return TimedFakeHub
+
+
+def _run_delay(latency_s: float, samples: int) -> dict:
+    from odbot.calibration import calculate_steering_middle
+    from odbot.control_worker import ControlWorker
+    from odbot.fake_hub import FakeHub
+    from odbot.input_thread import InputState
+    from odbot.telemetry import TelemetryService
+
+    worker = ControlWorker(f"BENCH-{latency_s * 1000:g}ms", "B", "A", 0, hub_factory=_timed_hub_factory(latency_s))
+    if not worker.init_bot():
+        return {"error": "Could not connect to the fake hub"}
+    hub = worker.bot.bot.hub
+
+    # The fake steering rack has known end stops, so calibration is skipped
+    left, right = FakeHub.DEFAULT_LIMITS[worker.motor_steer_str]
+    worker.left_steer_value, worker.right_steer_value = left, right
+    worker.middle_steer_value, worker.total_angle = calculate_steering_middle(left, right)
+
+    # Same threads as ControlWorker.run: telemetry reads compete with commands for the serial link
+    worker.telemetry = TelemetryService(worker.bot, worker.TELEMETRY_RATE_HZ)
+    worker.telemetry.start()
+    loop = threading.Thread(target=worker.scheduler.run, args=(lambda: worker.running,), name="control", daemon=True)
+    loop.start()
+
+    axes = [0.0] * 6
+    latencies, timeouts = [], 0
+    for i in range(samples):
+        axes[0] = STEER_INPUTS[i % len(STEER_INPUTS)]
+        steer = worker._map_inputs(axes)[2]
+        start = time.perf_counter()
+        worker._handle_input_change(InputState(tuple(axes), (), (), start, i + 1))
+        with hub.applied:
+            if hub.applied.wait_for(lambda: hub.steer_applied.get(str(steer), 0) >= start, COMMAND_TIMEOUT_S):
+                latencies.append(hub.steer_applied[str(steer)] - start)
+            else:
+                timeouts += 1
+        time.sleep(max(0.0, start + INPUT_INTERVAL_S - time.perf_counter()))
+
+    worker.running = False
+    loop.join()
+    timings = worker.scheduler.timings()
+    result = {
+        "serial_delay_ms": latency_s * 1000,
+        "command_latency": summarize(latencies),
+        "command_timeouts": timeouts,
+        "tick_duration": summarize(timings[:, 1]),
+        "tick_lateness": summarize(np.maximum(timings[:, 0], 0)),
+        "tick_overruns": worker.scheduler.overruns,
+        "telemetry": worker.telemetry.stats(),
+        "round_trips": hub.round_trips,
+    }
+    worker.close()
+    return result
+
+
+def run(serial_delays_ms: Iterable[float] = (0, 5, 20), samples: int = 100) -> dict:
+    """Input to hub command latency and control loop tick timing against a FakeHub per simulated serial delay.
+
+    Command latency runs from a controller input change to the steering target being applied on the hub, through the
+    output filter, AsyncBot and the serial round trip.
+    """
+    from odbot.hub_pool import HUB_POOL
+
+    try:
+        return {f"{delay:g}ms": _run_delay(delay / 1000, samples) for delay in serial_delays_ms}
+    finally:
+        HUB_POOL.close_all()
@@ -0,0 +1,33 @@
+import logging
+import time
+from typing import Iterable, Optional
+
+from benchmarks.common import RESOLUTIONS, synthetic_frame, time_calls
+
+log = logging.getLogger(__name__)
+
+
+def run(iterations: int = 30, backends: Optional[Iterable[str]] = None, out_of_process: bool = False) -> dict:
+    """Times BaseModel.get_predictions of every backend per source resolution, in the inference worker process
+    when out_of_process is set.
+
+    Backends whose runtime or weights are missing are reported with their load error instead of failing the run.
+    """
+    from odbot.models.factory import BACKENDS, create_model
+
+    results = {}
+    for backend in BACKENDS if backends is None else backends:
+        start = time.perf_counter()
+        try:
+            model = create_model(backend, out_of_process=out_of_process)
+        except Exception as e:
+            log.warning(f"Skipping {backend} backend: {e}")
+            results[backend] = {"error": f"{type(e).__name__}: {e}"}
+            continue
+
+        result = {"load_s": round(time.perf_counter() - start, 3), "resolutions": {}}
+        for name, (width, height) in RESOLUTIONS.items():
+            frame = synthetic_frame(width, height)
+            result["resolutions"][name] = time_calls(lambda: model.get_predictions(frame), iterations, warmup=3)
+        results[backend] = result
+    return results
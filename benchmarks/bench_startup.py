@@ -0,0 +1,71 @@
+import os
+import re
+import subprocess
+import sys
+
+from benchmarks.common import summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+STARTUP_LINE = re.compile(r"startup_s ([\d.]+) target_s ([\d.]+)")
+TIMEOUT_S = 60
+
+
+def _env() -> dict:
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get("QT_QPA_PLATFORM", "offscreen"))
+    env.pop("ODBOT_WARMUP_OD_MODEL", None)
+    return env
+
+
+def import_report(module: str = "odbot.main_window", top: int = 15, max_depth: int = 1) -> dict:
+    """Runs python -X importtime for module in a fresh interpreter and returns the total and the slowest imports.
+
+    Only the first max_depth + 1 levels of the import tree are listed, deeper imports are part of their parents'
+    cumulative time.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT,
+                            env=_env(),
+                            capture_output=True,
+                            text=True,
+                            timeout=TIMEOUT_S)
+    if result.returncode:
+        return {"error": result.stderr.strip().splitlines()[-1]}
+
+    imports = []
+    for match in IMPORT_LINE.finditer(result.stderr):
+        self_us, cumulative_us, indent, name = match.groups()
+        depth = len(indent) // 2
+        if depth <= max_depth:
+            imports.append({"module": name, "depth": depth, "self_ms": int(self_us) / 1000,
+                            "cumulative_ms": int(cumulative_us) / 1000})
+    total = sum(entry["cumulative_ms"] for entry in imports if entry["depth"] == 0)
+    imports.sort(key=lambda entry: -entry["cumulative_ms"])
+    return {"module": module, "total_ms": round(total, 1), "slowest": imports[:top]}
+
+
+def time_to_window(runs: int = 3) -> dict:
+    """Starts run.py --startup-time runs times and summarizes the time until its window is shown"""
+    samples, target_s = [], None
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "run.py", "--startup-time"],
+                                cwd=ROOT,
+                                env=_env(),
+                                capture_output=True,
+                                text=True,
+                                timeout=TIMEOUT_S)
+        match = STARTUP_LINE.search(result.stdout)
+        if match is None:
+            lines = result.stderr.strip().splitlines()
+            return {"error": lines[-1] if lines else f"run.py exited with {result.returncode}"}
+        samples.append(float(match.group(1)))
+        target_s = float(match.group(2))
+
+    stats = summarize(samples)
+    stats["target_ms"] = target_s * 1000
+    stats["within_target"] = stats["p95_ms"] <= stats["target_ms"]
+    return stats
+
+
+def run(runs: int = 3) -> dict:
+    return {"time_to_window": time_to_window(runs), "imports": import_report()}
@@ -0,0 +1,57 @@
+import os
+from types import SimpleNamespace
+
+from benchmarks.common import RESOLUTIONS, synthetic_frame, synthetic_predictions, time_calls
+
+DISPLAY_SIZE = (800, 600)  # label_video size in main_window.ui
+DETECTIONS = 10
+
+
+class _StaticDetections:
+    """Stands in for a running OdThread, so the overlay cost is measured without a model"""
+
+    def __init__(self, predictions, names):
+        self.predictions = predictions
+        self.predictions_seq = 1
+        self.model = SimpleNamespace(names=names)
+
+    def stop(self):
+        pass
+
+
+def run(iterations: int = 200) -> dict:
+    """Times VideoStream.convert_cv_qt and VideoStream._print_detections per source resolution"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtWidgets import QApplication, QLabel
+
+    from odbot.models.common import COCO_NAMES
+    from odbot.video_stream import VideoStream
+
+    app = QApplication.instance() or QApplication()
+    label = QLabel()
+    label.resize(*DISPLAY_SIZE)
+    stream = VideoStream(label)
+
+    results = {}
+    for name, (width, height) in RESOLUTIONS.items():
+        frame = synthetic_frame(width, height)
+        detections = _StaticDetections(synthetic_predictions(width, height, DETECTIONS), COCO_NAMES)
+
+        stream.od_thread = None
+        convert = time_calls(lambda: stream.convert_cv_qt(frame), iterations)
+        stream.od_thread = detections
+        convert_overlay = time_calls(lambda: stream.convert_cv_qt(frame), iterations)
+        # Full resolution drawing, as before overlays moved onto the display buffer
+        canvas = frame.copy()
+        draw = time_calls(lambda: stream._print_detections(canvas), iterations)
+
+        results[name] = {
+            "convert_cv_qt": convert,
+            "convert_cv_qt_with_detections": convert_overlay,
+            "print_detections": draw,
+        }
+
+    stream.od_thread = None
+    stream.deleteLater()
+    app.processEvents()
+    return {"display_size": list(DISPLAY_SIZE), "detections": DETECTIONS, "resolutions": results}
@@ -0,0 +1,53 @@
+import time
+from typing import Callable, Dict, Sequence
+
+import numpy as np
+
+RESOLUTIONS = {"480p": (640, 480), "720p": (1280, 720), "1080p": (1920, 1080)}
+
+
+def summarize(samples_s: Sequence[float]) -> Dict[str, float]:
+    """Latency percentiles in milliseconds for samples in seconds"""
+    samples = np.asarray(samples_s, dtype=float) * 1000
+    if len(samples) == 0:
+        return {"n": 0}
+    return {
+        "n": len(samples),
+        "mean_ms": round(float(samples.mean()), 4),
+        "p50_ms": round(float(np.percentile(samples, 50)), 4),
+        "p95_ms": round(float(np.percentile(samples, 95)), 4),
+        "p99_ms": round(float(np.percentile(samples, 99)), 4),
+        "max_ms": round(float(samples.max()), 4),
+    }
+
+
+def time_calls(fn: Callable[[], object], iterations: int, warmup: int = 5) -> Dict[str, float]:
+    """Calls fn warmup times untimed, then iterations times, and summarizes the per-call wall time"""
+    for _ in range(warmup):
+        fn()
+    samples = np.empty(iterations)
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples[i] = time.perf_counter() - start
+    return summarize(samples)
+
+
+def synthetic_frame(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """BGR camera-like frame: a smooth gradient with sensor noise, so resizing and encoding do representative work"""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frame = np.stack([np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width)), (x + y) / 2], axis=2)
+    frame = frame + rng.normal(0, 8, frame.shape).astype(np.float32)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def synthetic_predictions(width: int, height: int, count: int = 10, seed: int = 0) -> np.ndarray:
+    """count detections as (xmin, ymin, xmax, ymax, conf, class) rows inside a width x height frame"""
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, 0.7, (count, 2)) * (width, height)
+    wh = rng.uniform(0.05, 0.3, (count, 2)) * (width, height)
+    conf = rng.uniform(0.25, 1.0, (count, 1))
+    classes = rng.integers(0, 80, (count, 1))
+    return np.hstack([xy, xy + wh, conf, classes]).astype(np.float32)
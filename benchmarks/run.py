@@ -0,0 +1,115 @@
+"""Benchmarks for startup and the display, detection and control hot paths.
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --only video control --compare baseline.json
+
+Results are written as JSON with p50/p95/p99 latencies in milliseconds. With --compare, every p95 that got more than
+--threshold slower than in the baseline is reported and the exit code is 1, so the suite can gate changes in CI.
+"""
+import argparse
+import json
+import logging
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, Iterator, Tuple
+
+import cv2
+import numpy as np
+
+from benchmarks import bench_control, bench_models, bench_startup, bench_video
+
+SUITES = ("video", "models", "control", "startup")
+
+log = logging.getLogger(__name__)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip()
+    except Exception:
+        return ""
+
+
+def _environment() -> dict:
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+    }
+
+
+def _p95s(results: dict, path: str = "") -> Iterator[Tuple[str, float]]:
+    for key, value in results.items():
+        if isinstance(value, dict):
+            if "p95_ms" in value:
+                yield f"{path}{key}", value["p95_ms"]
+            else:
+                yield from _p95s(value, f"{path}{key}/")
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> Dict[str, Tuple[float, float]]:
+    """Returns {path: (baseline_p95, p95)} for every measurement whose p95 grew by more than threshold"""
+    before = dict(_p95s(baseline.get("results", {})))
+    regressions = {}
+    for path, p95 in _p95s(results.get("results", {})):
+        if path in before and p95 > before[path] * (1 + threshold):
+            regressions[path] = (before[path], p95)
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=SUITES, default=list(SUITES), help="suites to run")
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per video measurement")
+    parser.add_argument("--model-iterations", type=int, default=30, help="timed calls per model measurement")
+    parser.add_argument("--backends", nargs="+", help="model backends to run, default all")
+    parser.add_argument("--out-of-process", action="store_true", help="run the models in the inference worker process")
+    parser.add_argument("--serial-delays-ms",
+                        nargs="+",
+                        type=float,
+                        default=[0, 5, 20],
+                        help="simulated hub round trip delays")
+    parser.add_argument("--samples", type=int, default=100, help="controller inputs per serial delay")
+    parser.add_argument("--startup-runs", type=int, default=3, help="application starts to time")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON results to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative p95 slowdown for --compare")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    results = {}
+    if "video" in args.only:
+        results["video"] = bench_video.run(args.iterations)
+    if "models" in args.only:
+        results["models"] = bench_models.run(args.model_iterations, args.backends, args.out_of_process)
+    if "control" in args.only:
+        results["control"] = bench_control.run(args.serial_delays_ms, args.samples)
+    if "startup" in args.only:
+        results["startup"] = bench_startup.run(args.startup_runs)
+
+    report = {"environment": _environment(), "results": results}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for path, (before, after) in regressions.items():
+            print(f"Regression in {path}: p95 {before:.3f} ms -> {after:.3f} ms", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
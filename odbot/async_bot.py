@@ -0,0 +1,157 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # odbot.bot imports mindstorms and pyserial, which the GUI only needs once a hub is connected
+    from odbot.bot import Bot
+
+log = logging.getLogger(__name__)
+
+
+class AsyncBot:
+    """Non-blocking command layer around a Bot.
+
+    All hub traffic runs on a dedicated serial I/O thread. Actuator commands are coalesced, so only the newest steer
+    target and speed are ever sent, and other calls go through a bounded queue and return futures. Callers never wait
+    on the serial link unless they block on a future themselves.
+    """
+
+    QUEUE_SIZE = 16
+    STEER = "steer"
+    SPEED = "speed"
+    ACTUATORS = {STEER: "steer", SPEED: "accelerate"}
+
+    def __init__(self, bot: "Bot"):
+        self.bot = bot
+        self._cond = threading.Condition()
+        self._latest = {}
+        self._queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self._running = True
+
+        self.sent = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.telemetry = None
+        self.telemetry_time = 0.0
+        self.commanded = {}  # Last steer target and speed handed to the hub
+
+        self._thread = threading.Thread(target=self._run, name="hub-io", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._latest or not self._queue.empty() or not self._running)
+                if not self._running and not self._latest and self._queue.empty():
+                    break
+                latest, self._latest = self._latest, {}
+
+            # Actuator targets first, they are the most latency sensitive
+            if latest:
+                self._send_latest(latest)
+
+            try:
+                future, fn, args, kwargs = self._queue.get_nowait()
+            except queue.Empty:
+                continue
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                    self.sent += 1
+                except Exception as e:
+                    future.set_exception(e)
+
+        # Released here rather than in disconnect_hub, so a hub call outlasting its timeout still ends with the release
+        try:
+            self.bot.disconnect_hub()
+        except Exception as e:
+            log.error(f"Error releasing hub: {e}")
+
+    def _send_latest(self, latest: dict):
+        self.commanded.update(latest)
+        try:
+            if self.bot.batched:
+                # One round trip carries both targets and brings back motor telemetry
+                self._set_telemetry(self.bot.drive(speed=latest.get(self.SPEED), steer=latest.get(self.STEER)))
+                self.sent += 1
+                return
+
+            for key, value in latest.items():
+                getattr(self.bot, self.ACTUATORS[key])(value)
+                self.sent += 1
+        except Exception as e:
+            log.error(f"Error sending {list(latest)} command to hub: {e}")
+
+    def _set_telemetry(self, telemetry):
+        self.telemetry, self.telemetry_time = telemetry, time.monotonic()
+        return telemetry
+
+    def _set_latest(self, key: str, value):
+        with self._cond:
+            if key in self._latest:
+                self.coalesced += 1
+            self._latest[key] = value
+            self._cond.notify()
+
+    def call(self, fn, *args, **kwargs) -> Future:
+        """Queues fn(*args, **kwargs) for the I/O thread. If the queue is full the future fails immediately"""
+        future = Future()
+        if not self._running:
+            future.set_exception(RuntimeError("Hub command thread is stopped"))
+            return future
+        try:
+            self._queue.put_nowait((future, fn, args, kwargs))
+        except queue.Full:
+            self.rejected += 1
+            future.set_exception(queue.Full("Hub command queue is full"))
+            return future
+        with self._cond:
+            self._cond.notify()
+        return future
+
+    def steer(self, position: int):
+        self._set_latest(self.STEER, position)
+
+    def accelerate(self, speed: int):
+        self._set_latest(self.SPEED, speed)
+
+    def get_telemetry(self) -> Future:
+        """Reads (steer_values, speed_values) for both motors, in one round trip when the hub helper is loaded"""
+        return self.call(lambda: self._set_telemetry(self.bot.drive()))
+
+    def read_telemetry(self) -> Future:
+        """Reads motors, IMU and battery, see Bot.read_telemetry"""
+        return self.call(self.bot.read_telemetry)
+
+    def get_steer_position(self, relative: bool = True, absolute: bool = False) -> Future:
+        return self.call(self.bot.get_steer_position, relative, absolute)
+
+    def set_steer_middle(self, value: int) -> Future:
+        return self.call(self.bot.set_steer_middle, value)
+
+    def play_sound(self, path: str) -> Future:
+        return self.call(self.bot.play_sound, path)
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._latest) + self._queue.qsize()
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "coalesced": self.coalesced, "rejected": self.rejected, "pending": self.pending()}
+
+    def disconnect_hub(self, timeout: float = 1.0):
+        """Flushes pending commands, stops the I/O thread and closes the hub.
+
+        The I/O thread releases the hub when it exits. If it is still inside a hub call after timeout, this returns
+        and the release follows once that call is done, so a busy serial link is never handed back to the hub pool.
+        """
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            log.warning(f"Hub I/O thread still busy after {timeout}s, the hub is closed when its call returns")
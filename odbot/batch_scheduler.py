@@ -0,0 +1,92 @@
+import logging
+import time
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+from odbot.frame_buffer import FrameBuffer
+from odbot.models.base import BaseModel
+
+log = logging.getLogger(__name__)
+
+
+class BatchEntry(NamedTuple):
+    source: int
+    seq: int
+    timestamp: float
+    frame: np.ndarray
+
+
+class FrameDetections(NamedTuple):
+    source: int
+    seq: int
+    timestamp: float
+    predictions: object
+
+
+class BatchScheduler:
+    """Collects new frames from one or more FrameBuffers and runs them through the model together.
+
+    A batch is flushed once it holds batch_size frames, or batch_timeout_ms after its first frame arrived.
+    """
+
+    POLL_INTERVAL_S = 0.005  # Poll interval when waiting on more than one source
+    WAIT_TIMEOUT_S = 0.5
+
+    def __init__(self, sources: List[FrameBuffer], batch_size: int = 4, batch_timeout_ms: int = 50):
+        self.sources = sources
+        self.batch_size = batch_size
+        self.batch_timeout_ms = batch_timeout_ms
+        self.last_seqs = [0] * len(sources)
+        # Reused copy targets, one per batch position, so collecting never allocates per frame
+        self._frames: List[Optional[np.ndarray]] = [None] * batch_size
+        self.batches = 0
+        self.frames = 0
+
+    def _take(self, source: int, position: int) -> Optional[BatchEntry]:
+        buffer = self.sources[source]
+        with buffer.latest() as (seq, stamp, frame):
+            if frame is None or seq <= self.last_seqs[source]:
+                return None
+            out = self._frames[position]
+            if out is None or out.shape != frame.shape:
+                out = self._frames[position] = np.empty_like(frame)
+            np.copyto(out, frame)
+        self.last_seqs[source] = seq
+        return BatchEntry(source, seq, stamp, out)
+
+    def collect(self, running=lambda: True) -> List[BatchEntry]:
+        """Blocks until a batch is ready or running() turns False"""
+        batch = []
+        deadline = None
+        while running() and len(batch) < self.batch_size:
+            for source in range(len(self.sources)):
+                entry = self._take(source, len(batch))
+                if entry is not None:
+                    batch.append(entry)
+                    if len(batch) >= self.batch_size:
+                        break
+
+            now = time.monotonic()
+            if batch and deadline is None:
+                deadline = now + self.batch_timeout_ms / 1000
+            if len(batch) >= self.batch_size or (deadline is not None and now >= deadline):
+                break
+
+            timeout = self.WAIT_TIMEOUT_S if deadline is None else deadline - now
+            if len(self.sources) == 1:
+                self.sources[0].wait(self.last_seqs[0], timeout)
+            else:
+                time.sleep(min(timeout, self.POLL_INTERVAL_S))
+        return batch
+
+    def run_batch(self, model: BaseModel, batch: List[BatchEntry]) -> List[FrameDetections]:
+        """Runs a collected batch through the model and stamps each result with its frame sequence"""
+        if not batch:
+            return []
+        predictions = model.get_batch_predictions([entry.frame for entry in batch])
+        self.batches += 1
+        self.frames += len(batch)
+        return [
+            FrameDetections(entry.source, entry.seq, entry.timestamp, pred) for entry, pred in zip(batch, predictions)
+        ]
@@ -1,32 +1,129 @@
 import logging
+import time
 
 from mindstorms import Hub
-from PySide6.QtCore import QThread
+
+from odbot.hub_pool import HUB_POOL, HubPool, find_hub_port
+from odbot.metrics import METRICS
 
 log = logging.getLogger(__name__)
 
+DRIVE_TIME = METRICS.histogram("odbot_hub_drive_seconds",
+                               "Time to apply speed and steer on the hub, one serial round trip with the helper")
+TELEMETRY_TIME = METRICS.histogram("odbot_hub_telemetry_seconds",
+                                   "Time to read motors, IMU and battery, one serial round trip with the helper")
+
+# MicroPython helper uploaded to the hub on connect. One call applies a combined speed and steer update (None leaves
+# an actuator untouched) and replies with both motors' [speed_pct, rel_pos, abs_pos, pwm] readings. _odt reads the
+# motors, IMU and battery in one go.
+HUB_HELPER = """
+_odb_ms = hub.port.{speed_port}.motor
+_odb_mt = hub.port.{steer_port}.motor
+_odb_ms.mode([(1, 0), (2, 0), (3, 0), (0, 0)])
+def _odb(s, t):
+    if s is not None:
+        _odb_ms.run_at_speed(s)
+    if t is not None:
+        _odb_mt.run_to_position(t)
+    return (_odb_mt.get(), _odb_ms.get())
+def _odt():
+    return (_odb_mt.get(), _odb_ms.get(), hub.motion.accelerometer(), hub.motion.gyroscope(), hub.battery.voltage())
+"""
+
 
 class Bot:
 
-    def __init__(self, serial_port: str, motor_speed_port: str, motor_steer_port: str) -> None:
+    READY_TIMEOUT_S = 3.0
+    READY_RETRY_S = 0.05
+
+    def __init__(self,
+                 serial_port: str,
+                 motor_speed_port: str,
+                 motor_steer_port: str,
+                 hub_factory=Hub,
+                 use_helper: bool = True,
+                 hub_pool: HubPool = HUB_POOL) -> None:
         self.serial_port = serial_port
         self.motor_speed_port = motor_speed_port
         self.motor_steer_port = motor_steer_port
+        self.hub_factory = hub_factory
+        self.use_helper = use_helper
+        self.hub_pool = hub_pool
+        self.batched = False
 
         self.connect_hub()
 
     def connect_hub(self):
-        self.hub = Hub(device=self.serial_port)
+        self.device = self.serial_port
+        if self.device is None and self.hub_factory is Hub:
+            # Only real hubs need discovering, fake hubs accept any device
+            self.device = find_hub_port()
+        # Identifies the hub for stored calibrations
+        self.hub_id = self.device or "USB"
+
+        self.hub = self.hub_pool.acquire(self.device, self.hub_factory)
         self.motor_speed = eval(f"self.hub.port.{self.motor_speed_port}.motor")
         self.motor_steer = eval(f"self.hub.port.{self.motor_steer_port}.motor")
 
-        QThread.msleep(700)
-
-        self.motor_steer.mode([(1, 0), (2, 0), (3, 0), (0, 0)])
-        self.play_sound('/extra_files/Hello')
+        self._wait_ready()
+        if self.use_helper:
+            self.batched = self._upload_helper()
+
+    def _wait_ready(self):
+        """Retries the first motor command until the hub answers, instead of sleeping a fixed time"""
+        start = time.monotonic()
+        while True:
+            try:
+                self.motor_steer.mode([(1, 0), (2, 0), (3, 0), (0, 0)])
+                log.debug(f"Hub ready after {time.monotonic() - start:.2f}s")
+                return
+            except Exception as e:
+                if time.monotonic() - start > self.READY_TIMEOUT_S:
+                    self.hub_pool.discard(self.device)
+                    self.hub.close()
+                    raise ConnectionError(f"Hub on {self.device} did not respond: {e}")
+                time.sleep(self.READY_RETRY_S)
+
+    def _upload_helper(self):
+        try:
+            self.hub._pb.exec_(HUB_HELPER.format(speed_port=self.motor_speed_port, steer_port=self.motor_steer_port))
+        except Exception as e:
+            log.warning(f"Could not upload hub helper, falling back to one command per call: {e}")
+            return False
+        log.debug("Uploaded hub helper")
+        return True
+
+    def drive(self, speed: int = None, steer: int = None):
+        """Applies speed and steer (None keeps the current one) and returns (steer_values, speed_values) telemetry.
+
+        With the hub helper this is a single REPL round trip instead of up to four.
+        """
+        start = time.perf_counter()
+        if self.batched:
+            speed_arg = None if speed is None else int(speed)
+            steer_arg = None if steer is None else int(steer)
+            result = self.hub._eval(f"_odb({speed_arg}, {steer_arg})")
+        else:
+            if speed is not None:
+                self.accelerate(speed)
+            if steer is not None:
+                self.steer(steer)
+            result = self.motor_steer.get(), self.motor_speed.get()
+        DRIVE_TIME.observe(time.perf_counter() - start)
+        return result
+
+    def read_telemetry(self):
+        """Returns (steer_values, speed_values, accelerometer, gyroscope, battery_mv), one round trip with the helper"""
+        start = time.perf_counter()
+        if self.batched:
+            result = self.hub._eval("_odt()")
+        else:
+            result = (self.motor_steer.get(), self.motor_speed.get(), self.hub.motion.accelerometer(),
+                      self.hub.motion.gyroscope(), self.hub.battery.voltage())
+        TELEMETRY_TIME.observe(time.perf_counter() - start)
+        return result
 
     def steer(self, position: int):
-        log.debug(f"Steering to {position}")
         self.motor_steer.run_to_position(position)
 
     def accelerate(self, speed: int):
@@ -44,7 +141,8 @@ class Bot:
         self.motor_steer.preset(value)
 
     def disconnect_hub(self):
-        self.hub.close()
+        """Keeps the serial link open in the hub pool, so a reconnect is immediate"""
+        self.hub_pool.release(self.device, self.hub)
 
     def play_sound(self, path: str):
         self.hub.sound.play(path)
@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+import time
+from typing import NamedTuple, Optional
+
+from odbot.async_bot import AsyncBot
+
+log = logging.getLogger(__name__)
+
+
+class SteeringCalibration(NamedTuple):
+    left: int
+    right: int
+    middle: int
+    total_angle: int
+
+
+def calculate_steering_middle(left: int, right: int):
+    middle = int((left + right) / 2)
+    total_angle = int(abs(left) + abs(right))
+    return middle, total_angle
+
+
+class CalibrationStore:
+    """Steering calibrations persisted as JSON, keyed by hub and steering motor port"""
+
+    DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".odbot", "calibration.json")
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+
+    @staticmethod
+    def key(hub_id: str, port: str) -> str:
+        return f"{hub_id}:{port}"
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def load(self, hub_id: str, port: str) -> Optional[SteeringCalibration]:
+        values = self._read().get(self.key(hub_id, port))
+        return SteeringCalibration(**values) if values else None
+
+    def save(self, hub_id: str, port: str, calibration: SteeringCalibration):
+        data = self._read()
+        data[self.key(hub_id, port)] = calibration._asdict()
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w") as f:
+                json.dump(data, f, indent=2)
+        except OSError as e:
+            log.warning(f"Could not save steering calibration to {self.path}: {e}")
+
+
+class SteeringCalibrator:
+    """Finds the steering end stops by driving into them and watching the position stream for a stall.
+
+    Each limit is done as soon as the position stops changing, instead of after a fixed wait. A stored calibration is
+    reused after checking that a single end stop is still where it was.
+    """
+
+    POLL_INTERVAL_S = 0.02
+    STALL_SAMPLES = 4  # Consecutive unchanged readings that count as a stall
+    STALL_TOLERANCE = 1  # Degrees
+    MIN_MOVE_TIME_S = 0.15  # Grace period for the motor to start moving before an unchanged reading means a stall
+    TIMEOUT_S = 2.0
+    READ_TIMEOUT_S = 1.0  # A position read that takes longer means the hub stopped answering
+    VERIFY_TOLERANCE = 5  # Degrees a stored end stop may be off and still be trusted
+    LEFT_TARGET = -180
+    RIGHT_TARGET = 180
+
+    def __init__(self, bot: AsyncBot, store: CalibrationStore = None, clock=time.monotonic, sleep=time.sleep):
+        self.bot = bot
+        self.store = store
+        self.clock = clock
+        self.sleep = sleep
+
+    def _read_position(self) -> int:
+        """Raises concurrent.futures.TimeoutError when the hub does not answer within READ_TIMEOUT_S"""
+        return self.bot.get_steer_position().result(self.READ_TIMEOUT_S)
+
+    def find_end_stop(self, target: int) -> int:
+        """Steers towards target and returns the position where the motor stalls"""
+        self.bot.steer(target)
+        start = self.clock()
+        first = last = self._read_position()
+        unchanged = 0
+        while self.clock() - start < self.TIMEOUT_S:
+            self.sleep(self.POLL_INTERVAL_S)
+            position = self._read_position()
+            unchanged = unchanged + 1 if abs(position - last) <= self.STALL_TOLERANCE else 0
+            last = position
+
+            moved = abs(position - first) > self.STALL_TOLERANCE
+            if unchanged >= self.STALL_SAMPLES and (moved or self.clock() - start >= self.MIN_MOVE_TIME_S):
+                log.debug(f"End stop at {position} after {self.clock() - start:.2f}s")
+                return position
+
+        log.warning(f"No steering stall detected within {self.TIMEOUT_S}s, using {last}")
+        return last
+
+    def calibrate(self) -> SteeringCalibration:
+        left = self.find_end_stop(self.LEFT_TARGET)
+        right = self.find_end_stop(self.RIGHT_TARGET)
+        middle, total_angle = calculate_steering_middle(left, right)
+        self.bot.steer(middle)
+        return SteeringCalibration(left, right, middle, total_angle)
+
+    def verify(self, calibration: SteeringCalibration) -> bool:
+        """Checks a stored calibration by hitting only the left end stop"""
+        left = self.find_end_stop(self.LEFT_TARGET)
+        ok = abs(left - calibration.left) <= self.VERIFY_TOLERANCE
+        if ok:
+            self.bot.steer(calibration.middle)
+        else:
+            log.info(f"Stored calibration is stale: left end stop moved from {calibration.left} to {left}")
+        return ok
+
+    def run(self, hub_id: str, port: str) -> SteeringCalibration:
+        """Reuses and verifies the stored calibration for this hub and port, or calibrates from scratch"""
+        start = self.clock()
+        stored = self.store.load(hub_id, port) if self.store is not None else None
+        if stored is not None and self.verify(stored):
+            calibration = stored
+            log.info(f"Reusing stored steering calibration {calibration}")
+        else:
+            calibration = self.calibrate()
+            if self.store is not None:
+                self.store.save(hub_id, port, calibration)
+
+        log.info(f"Calibrated steering in {self.clock() - start:.2f}s: left={calibration.left}, "
+                 f"right={calibration.right}, middle={calibration.middle}")
+        return calibration
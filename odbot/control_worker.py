@@ -1,14 +1,28 @@
 import logging
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 import pygame
 from mindstorms import Hub
-from PySide6.QtCore import QObject, QThread, Signal
+from PySide6.QtCore import QObject, Signal
 
+from odbot.async_bot import AsyncBot
 from odbot.bot import Bot
+from odbot.calibration import CalibrationStore, SteeringCalibrator
 from odbot.controller import Controller, XboxOneControllerButtons
+from odbot.input_thread import InputState
+from odbot.loop_scheduler import LoopScheduler
+from odbot.metrics import METRICS
+from odbot.output_filter import ActuatorFilter, OutputFilter
+from odbot.telemetry import TelemetryService
 
 log = logging.getLogger(__name__)
 
+TICK_JITTER = METRICS.histogram("odbot_control_tick_jitter_seconds",
+                                "Deviation of the control loop tick interval from its period")
+COMMANDS_SENT = METRICS.counter("odbot_control_commands_total", "Actuator commands handed to the hub")
+
 LEFT_STEER_VALUE = 60
 RIGHT_STEER_VALUE = -60
 
@@ -28,56 +42,95 @@ class ControlWorkerSignals(QObject):
 class ControlWorker(QObject):
 
     signals = ControlWorkerSignals()
+    finished = Signal()  # run() returned and everything it started is released
 
-    LOOP_DELAY_MS = 200
+    LOOP_RATE_HZ = 50
+    INPUT_RATE_HZ = 50
+    COMMAND_RATE_HZ = 50
+    TELEMETRY_RATE_HZ = 20
+    TIMING_LOG_INTERVAL_S = 10
     STEER_BUFFER = 15  # Degrees to buffer the steering
 
-    def __init__(self, hub_port: str, motor_speed: str, motor_steer: str, controller_idx: int):
+    SPEED_DEADBAND = 2  # Percent of motor speed
+    STEER_DEADBAND = 2  # Degrees
+    COMMAND_MIN_INTERVAL_S = 0.04
+    COMMAND_KEEPALIVE_S = 0.5
+
+    def __init__(self,
+                 hub_port: str,
+                 motor_speed: str,
+                 motor_steer: str,
+                 controller_idx: int,
+                 hub_factory=Hub,
+                 controller_source=None,
+                 calibration_store: CalibrationStore = None,
+                 clock=None):
         super().__init__()
         self.motor_speed_str = motor_speed
         self.motor_steer_str = motor_steer
         self.controller_idx = controller_idx
         self.hub_port = hub_port
+        self.hub_factory = hub_factory
+        self.controller_source = controller_source
+        self.calibration_store = CalibrationStore() if calibration_store is None else calibration_store
         self.running = True
 
         self.bot = None
         self.controller = None
+        self.telemetry = None
+        self.recorder = None  # Optional SessionRecorder for controller input and hub commands
+        self._inputs = None
+        self._command_lock = threading.Lock()
+        self._lifecycle_lock = threading.Lock()  # Keeps stop() from slipping in while run() starts a thread
+
+        # A replay passes a virtual clock to make command filtering and loop timing reproducible
+        filter_clock = time.monotonic if clock is None else clock
+
+        # Only changed actuator values go out on the serial link, plus a periodic keepalive refresh
+        self.output_filter = OutputFilter(
+            ActuatorFilter("speed",
+                           self.SPEED_DEADBAND,
+                           self.COMMAND_MIN_INTERVAL_S,
+                           self.COMMAND_KEEPALIVE_S, [0],
+                           clock=filter_clock),
+            ActuatorFilter("steer",
+                           self.STEER_DEADBAND,
+                           self.COMMAND_MIN_INTERVAL_S,
+                           self.COMMAND_KEEPALIVE_S,
+                           clock=filter_clock),
+        )
+
+        self.scheduler = LoopScheduler(self.LOOP_RATE_HZ) if clock is None else LoopScheduler(self.LOOP_RATE_HZ, clock)
+        self.scheduler.add_stage("input", self.INPUT_RATE_HZ, self._poll_input)
+        self.scheduler.add_stage("command", self.COMMAND_RATE_HZ, self._send_commands)
+        self.scheduler.add_stage("timing", 1 / self.TIMING_LOG_INTERVAL_S, self._log_timing)
+        self.scheduler.add_stage("metrics", self.LOOP_RATE_HZ, self._observe_tick)
+        self._last_tick = None
 
         self.left_steer_value = LEFT_STEER_VALUE
         self.right_steer_value = RIGHT_STEER_VALUE
         self.middle_steer_value = None
         self.total_angle = None
 
-    def _calculate_steering_middle(self, left: int, right: int):
-        middle = int((left + right) / 2)
-        total_angle = int(abs(left) + abs(right))
-        return middle, total_angle
-
     def _map_steering(self, value: float):
         return self.middle_steer_value + int(value * (self.middle_steer_value -
                                                       (self.total_angle // 2 - self.STEER_BUFFER)))
 
     def _calibrate_steering(self):
-        self.bot.steer(-180)
-        QThread.msleep(1000)
-        left_steer_value = self.bot.get_steer_position()
-        self.bot.steer(180)
-        QThread.msleep(1000)
-        right_steer_value = self.bot.get_steer_position()
-        middle, total_angle = self._calculate_steering_middle(left_steer_value, right_steer_value)
-        self.bot.steer(middle)
-        QThread.msleep(1000)
-        # middle_abs = self.bot.get_steer_position(absolute=True, relative=False)
-        # self.bot.set_steer_middle(middle_abs)
-        # QThread.msleep(1000)
-
-        log.info(f"Calibrated steering: left={left_steer_value}, right={right_steer_value}, middle={middle}")
-        return left_steer_value, right_steer_value, middle, total_angle
+        """The steering calibration, or None when the hub stopped answering"""
+        calibrator = SteeringCalibrator(self.bot, self.calibration_store)
+        try:
+            return calibrator.run(self.bot.bot.hub_id, self.motor_steer_str)
+        except FutureTimeoutError:
+            log.error(f"Hub did not answer within {calibrator.READ_TIMEOUT_S}s while calibrating the steering")
+            self.signals.connection.emit(ControlWorkerSignalValues.HUB_CONNECTION_ERROR)
+            return None
 
     def init_bot(self):
         log.debug("Initializing bot")
         try:
-            self.bot = Bot(self.hub_port, self.motor_speed_str, self.motor_steer_str)
+            self.bot = AsyncBot(Bot(self.hub_port, self.motor_speed_str, self.motor_steer_str, self.hub_factory))
+            self.bot.play_sound('/extra_files/Hello')
         except Exception as e:
             log.error(f"Error initializing bot: {e}")
             self.signals.connection.emit(ControlWorkerSignalValues.HUB_CONNECTION_ERROR)
@@ -88,45 +141,99 @@ class ControlWorker(QObject):
     def init_controller(self):
         log.debug("Initializing controller")
         try:
-            self.controller = Controller(index=self.controller_idx)
+            self.controller = Controller(index=self.controller_idx,
+                                         source=self.controller_source,
+                                         on_change=self._handle_input_change)
         except Exception as e:
             log.error(f"Error initializing controller: {e}")
             self.controller = None
             self.signals.connection.emit(ControlWorkerSignalValues.CONTROLLER_CONNECTION_ERROR)
 
     def run(self):
+        """Connects, calibrates and runs the control loop until stop(), then releases everything on this thread"""
         log.debug("Starting control worker")
+        try:
+            self._run()
+        finally:
+            self.close()
+            self.finished.emit()
+
+    def _run(self):
         if not self.init_bot():
-            self.stop()
             return
 
         self.init_controller()
         self.signals.connection.emit(ControlWorkerSignalValues.CONNECTED)
 
-        self.left_steer_value, self.right_steer_value, self.middle_steer_value, self.total_angle = self._calibrate_steering(
-        )
-
-        while self.running:
-
-            if self.controller is not None:
-                trigger_right, trigger_left, right_x = self.check_control_events()
-                speed = trigger_right + trigger_left
-
-                if self.bot is not None:
-                    try:
-                        self.bot.accelerate(speed)
-                        if abs(right_x) > 0:
-                            self.bot.steer(right_x)
-                        else:
-                            self.bot.steer(self.middle_steer_value)
-                    except Exception as e:
-                        log.error(f"Error controlling bot: {e}")
+        calibration = self._calibrate_steering()
+        if calibration is None:
+            return
+        self.left_steer_value, self.right_steer_value, self.middle_steer_value, self.total_angle = calibration
+
+        with self._lifecycle_lock:
+            if not self.running:
+                log.debug("Control worker stopped during calibration")
+                return
+            # Sampling runs on its own thread, the control loop only handles input and commands
+            self.telemetry = TelemetryService(self.bot, self.TELEMETRY_RATE_HZ)
+            self.telemetry.start()
+
+        self.scheduler.run(lambda: self.running)
+
+    def _poll_input(self):
+        if self.controller is not None:
+            self._inputs = self.check_control_events()
+
+    def _handle_input_change(self, state: InputState):
+        """Called from the controller input thread, so stick movements reach the bot without waiting for a tick"""
+        if self.recorder is not None:
+            self.recorder.record_input(state)
+        if self.middle_steer_value is None or not self.running:
+            return
+        self._inputs = self._map_inputs(state.axes)
+        self._send_commands()
 
-            if self.bot is not None:
-                bot_pos = self.bot.get_steer_position(absolute=True)
-                log.info(f"Bot position: relative {bot_pos[0]}, absolute {bot_pos[1]}")
+    def _send_commands(self):
+        if self._inputs is None or self.bot is None:
+            return
 
-            QThread.msleep(self.LOOP_DELAY_MS)
+        trigger_right, trigger_left, right_x = self._inputs
+        speed = trigger_right + trigger_left
+        steer = right_x if abs(right_x) > 0 else self.middle_steer_value
+        with self._command_lock:
+            try:
+                if self.output_filter.update("speed", speed):
+                    self.bot.accelerate(speed)
+                    self._record_command("speed", speed)
+                if self.output_filter.update("steer", steer):
+                    self.bot.steer(steer)
+                    self._record_command("steer", steer)
+            except Exception as e:
+                log.error(f"Error controlling bot: {e}")
+
+    def _record_command(self, name: str, value: int):
+        COMMANDS_SENT.inc()
+        if self.recorder is not None:
+            self.recorder.record_command(name, value)
+
+    def _log_timing(self):
+        if self.scheduler.ticks:
+            log.debug(f"Control loop timing: {self.scheduler.stats()}")
+            log.debug(f"Redundant commands suppressed: {self.output_filter.stats()}")
+
+    def _observe_tick(self):
+        now = self.scheduler.clock()
+        if self._last_tick is not None:
+            TICK_JITTER.observe(abs(now - self._last_tick - self.scheduler.period))
+        self._last_tick = now
+
+    def get_output_stats(self) -> dict:
+        """Sent and suppressed command counts per actuator, see OutputFilter.stats"""
+        return self.output_filter.stats()
+
+    def get_timing(self) -> dict:
+        """Per-loop timing statistics, see LoopScheduler.stats"""
+        return self.scheduler.stats()
 
     def check_control_events(self):
         if self.controller is None:
@@ -145,18 +252,32 @@ class ControlWorker(QObject):
                 self.signals.controller_stopped_signal.emit()
                 self.stop()
 
-        trigger_right = self.controller.axis_data[XboxOneControllerButtons.AXIS_RIGHT_TRIGGER]
+        return self._map_inputs(self.controller.axis_data)
+
+    def _map_inputs(self, axes):
+        trigger_right = axes[XboxOneControllerButtons.AXIS_RIGHT_TRIGGER]
         trigger_right = 0 if trigger_right == 0 else int((trigger_right + 1) / 2 * -100)
 
-        trigger_left = self.controller.axis_data[XboxOneControllerButtons.AXIS_LEFT_TRIGGER]
+        trigger_left = axes[XboxOneControllerButtons.AXIS_LEFT_TRIGGER]
         trigger_left = 0 if trigger_left == 0 else int((trigger_left + 1) / 2 * 100)
 
-        right_x = self.controller.axis_data[XboxOneControllerButtons.AXIS_LEFT_X]
+        right_x = axes[XboxOneControllerButtons.AXIS_LEFT_X]
         right_x = 0 if abs(right_x) <= 0.1 else self._map_steering(right_x)
 
         return trigger_right, trigger_left, right_x
 
     def stop(self):
+        """Asks run() to return. Does not block, so it is safe to call from the GUI thread"""
+        with self._lifecycle_lock:
+            self.running = False
+
+    def close(self):
+        """Stops the controller input, telemetry and hub I/O threads and releases the hub. Blocks for up to a few
+        seconds while the threads finish, run() calls it on the control thread"""
+        self.stop()
+        if self.controller is not None:
+            self.controller.stop()
+        if self.telemetry is not None:
+            self.telemetry.stop()
         if self.bot is not None:
             self.bot.disconnect_hub()
-        self.running = False
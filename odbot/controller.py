@@ -1,6 +1,7 @@
 import logging
+from typing import Callable
 
-import pygame
+from odbot.input_thread import InputState, InputThread, PygameJoystickSource
 
 log = logging.getLogger(__name__)
 
@@ -27,11 +28,9 @@ class XboxOneControllerButtons:
 
 class Controller:
 
-    def __init__(self, index: int = 0):
-        pygame.init()
-        pygame.joystick.init()
-
-        self.controller = pygame.joystick.Joystick(index)
+    def __init__(self, index: int = 0, source=None, on_change: Callable[[InputState], None] = None):
+        self.source = PygameJoystickSource(index) if source is None else source
+        self.input_thread = InputThread(self.source, on_change=on_change)
 
         self.axis_data = {}
         self.button_data = {}
@@ -39,34 +38,31 @@ class Controller:
         self.events = []
 
         # Get the number of axes, buttons, and hats on the controller
-        self.axes = self.controller.get_numaxes()
-        self.buttons = self.controller.get_numbuttons()
-        self.hats = self.controller.get_numhats()
+        state = self.input_thread.state
+        self.axes = len(state.axes)
+        self.buttons = len(state.buttons)
+        self.hats = len(state.hats)
 
-        log.info(f"Controller: {self.controller.get_name()} connected")
+        log.info(f"Controller: {self.source.name} connected")
 
     def update(self):
-        self.events = pygame.event.get()
-
-        # Update the axis data
-        for i in range(self.axes):
-            self.axis_data[i] = self.controller.get_axis(i)
+        """Takes all events since the last update and the newest state snapshot from the input thread"""
+        self.events = [input_event.event for input_event in self.input_thread.drain_events()]
 
-        # Update the button data
-        for i in range(self.buttons):
-            self.button_data[i] = self.controller.get_button(i)
+        state = self.input_thread.state
+        self.axis_data = dict(enumerate(state.axes))
+        self.button_data = dict(enumerate(state.buttons))
+        self.hat_data = dict(enumerate(state.hats))
 
-        # Update the hat data
-        for i in range(self.hats):
-            self.hat_data[i] = self.controller.get_hat(i)
+    @property
+    def state(self) -> InputState:
+        return self.input_thread.state
 
     def get_axis_value(self, axis: int):
-        return self.controller.get_axis(axis)
+        return self.input_thread.state.axes[axis]
 
     def get_button_value(self, button: int):
-        return self.controller.get_button(button)
+        return self.input_thread.state.buttons[button]
 
     def stop(self):
-        self.controller.quit()
-        pygame.joystick.quit()
-        pygame.quit()
+        self.input_thread.stop()
@@ -0,0 +1,219 @@
+import ast
+import logging
+import math
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+PORT_NAMES = ["A", "B", "C", "D", "E", "F"]
+
+
+class FakeMotor:
+    """Simulated Spike Prime motor that moves towards its target at a fixed rate and stops at mechanical end stops"""
+
+    DEGREES_PER_SECOND = 600
+
+    def __init__(self, hub: "FakeHub", limits: Optional[Tuple[int, int]] = None):
+        self._hub = hub
+        self.limits = limits
+        self._lock = threading.Lock()
+        self._position = 0.0
+        self._offset = 0
+        self._target = None
+        self._speed = 0
+        self._stamp = time.monotonic()
+
+    def _update(self):
+        now = time.monotonic()
+        elapsed, self._stamp = now - self._stamp, now
+        if self._target is not None:
+            step = self.DEGREES_PER_SECOND * elapsed
+            delta = self._target - self._position
+            self._position += max(-step, min(step, delta))
+        elif self._speed:
+            self._position += self._speed / 100 * self.DEGREES_PER_SECOND * elapsed
+
+        if self.limits is not None:
+            self._position = max(self.limits[0], min(self.limits[1], self._position))
+
+    def _get(self) -> list:
+        with self._lock:
+            self._update()
+            relative = int(self._position) - self._offset
+            absolute = (int(self._position) + 180) % 360 - 180
+            if self._target is None:
+                pwm = self._speed
+            else:
+                # Full power while a position target is not reached, including when pushing against an end stop
+                remaining = self._target - self._position
+                pwm = 0 if abs(remaining) < 1 else int(math.copysign(100, remaining))
+            return [self._speed, relative, absolute, pwm]
+
+    def _run_at_speed(self, speed: int):
+        with self._lock:
+            self._update()
+            self._target, self._speed = None, speed
+
+    def _run_to_position(self, position: int):
+        with self._lock:
+            self._update()
+            self._target, self._speed = position + self._offset, 0
+
+    def get(self, *args, **kwargs) -> list:
+        self._hub._round_trip()
+        return self._get()
+
+    def mode(self, *args, **kwargs):
+        self._hub._round_trip()
+
+    def run_at_speed(self, speed: int, *args, **kwargs) -> None:
+        self._hub._round_trip()
+        self._run_at_speed(speed)
+
+    def run_to_position(self, position: int, *args, **kwargs) -> None:
+        self._hub._round_trip()
+        self._run_to_position(position)
+
+    def preset(self, position: int) -> None:
+        self._hub._round_trip()
+        with self._lock:
+            self._update()
+            self._offset = int(self._position) - position
+
+    def float(self) -> None:
+        self.run_at_speed(0)
+
+    brake = hold = float
+
+
+class FakePort:
+
+    def __init__(self, hub: "FakeHub", limits: Optional[Tuple[int, int]] = None):
+        self.motor = FakeMotor(hub, limits)
+
+
+class FakePorts:
+
+    def __init__(self, hub: "FakeHub", limits: Dict[str, Tuple[int, int]]):
+        for name in PORT_NAMES:
+            setattr(self, name, FakePort(hub, limits.get(name)))
+
+
+class FakeSound:
+
+    def __init__(self, hub: "FakeHub"):
+        self._hub = hub
+        self.played = []
+
+    def play(self, filename: str, rate=16000) -> None:
+        self._hub._round_trip()
+        self.played.append(filename)
+
+
+class FakeMotion:
+    """A hub lying still and level"""
+
+    def __init__(self, hub: "FakeHub"):
+        self._hub = hub
+
+    def _accelerometer(self):
+        return 0, 0, 981
+
+    def _gyroscope(self):
+        return 0, 0, 0
+
+    def accelerometer(self, filtered=False):
+        self._hub._round_trip()
+        return self._accelerometer()
+
+    def gyroscope(self, filtered=False):
+        self._hub._round_trip()
+        return self._gyroscope()
+
+
+class FakeBattery:
+
+    VOLTAGE_MV = 8200
+
+    def __init__(self, hub: "FakeHub"):
+        self._hub = hub
+
+    def voltage(self) -> int:
+        self._hub._round_trip()
+        return self.VOLTAGE_MV
+
+    def capacity_left(self) -> int:
+        self._hub._round_trip()
+        return 100
+
+
+class FakePyboard:
+    """Records code executed on the fake REPL, and recognises the Bot hub helper"""
+
+    HELPER_PORTS = re.compile(r"_odb_ms = hub\.port\.(\w)\.motor\s+_odb_mt = hub\.port\.(\w)\.motor")
+
+    def __init__(self, hub: "FakeHub"):
+        self._hub = hub
+        self.executed = []
+        self.helper_ports = None
+
+    def exec_(self, code: str) -> bytes:
+        self._hub._round_trip()
+        self.executed.append(code)
+        match = self.HELPER_PORTS.search(code)
+        if match:
+            self.helper_ports = match.groups()
+        return b""
+
+
+class FakeHub:
+    """In-process stand-in for mindstorms.Hub, for running the control stack without hardware.
+
+    Every call sleeps for latency_s to simulate a serial REPL round trip and is counted in round_trips.
+    """
+
+    DEFAULT_LIMITS = {"A": (-75, 70)}  # The M.V.P. steering rack end stops
+
+    def __init__(self, device: Optional[str] = None, latency_s: float = 0.0, limits: Dict[str, Tuple[int, int]] = None):
+        self.device = device
+        self.latency_s = latency_s
+        self.round_trips = 0
+        self.closed = False
+        self.port = FakePorts(self, self.DEFAULT_LIMITS if limits is None else limits)
+        self.sound = FakeSound(self)
+        self.motion = FakeMotion(self)
+        self.battery = FakeBattery(self)
+        self._pb = FakePyboard(self)
+        log.info(f"Fake hub created on {device} with {latency_s * 1000:.0f} ms latency")
+
+    def _round_trip(self):
+        if self.closed:
+            raise OSError("Fake hub is closed")
+        self.round_trips += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+
+    def _eval(self, expr: str):
+        """Evaluates calls to the uploaded hub helper in a single simulated round trip"""
+        match = re.fullmatch(r"_odb\((.*), (.*)\)", expr)
+        if self._pb.helper_ports is None or (match is None and expr != "_odt()"):
+            raise NotImplementedError(f"Fake hub cannot evaluate {expr}")
+
+        speed_motor, steer_motor = (getattr(self.port, name).motor for name in self._pb.helper_ports)
+        self._round_trip()
+        if match is None:
+            return (steer_motor._get(), speed_motor._get(), self.motion._accelerometer(), self.motion._gyroscope(),
+                    FakeBattery.VOLTAGE_MV)
+
+        speed, steer = (ast.literal_eval(arg) for arg in match.groups())
+        if speed is not None:
+            speed_motor._run_at_speed(speed)
+        if steer is not None:
+            steer_motor._run_to_position(steer)
+        return steer_motor._get(), speed_motor._get()
+
+    def close(self):
+        self.closed = True
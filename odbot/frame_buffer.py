@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class FrameBuffer:
+    """Fixed-capacity, latest-frame-wins ring of preallocated frame slots.
+
+    A single producer writes into free slots and commits them with an increasing sequence number. Consumers only ever
+    see the newest committed frame; frames that are superseded before anyone read them are dropped and counted.
+    """
+
+    DEFAULT_CAPACITY = 4
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        if capacity < 2:
+            raise ValueError("FrameBuffer needs at least two slots")
+        self.capacity = capacity
+
+        self._cond = threading.Condition()
+        self._slots = [None] * capacity
+        self._seqs = [0] * capacity
+        self._stamps = [0.0] * capacity
+        self._pins = [0] * capacity
+        self._latest = -1
+        self._latest_read = True
+        self._writing = -1
+
+        self.seq = 0
+        self.dropped = 0
+        self.closed = False
+
+    def _allocate(self, shape: Tuple[int, ...], dtype):
+        log.debug(f"Allocating {self.capacity} frame slots of shape {shape}")
+        self._slots = [np.empty(shape, dtype=dtype) for _ in range(self.capacity)]
+
+    def acquire(self, shape: Optional[Tuple[int, ...]] = None, dtype=np.uint8) -> Optional[np.ndarray]:
+        """Returns a free slot to write the next frame into, or None if every slot is in use"""
+        dtype = np.dtype(dtype)
+        with self._cond:
+            if shape is not None and (self._slots[0] is None or self._slots[0].shape != tuple(shape)
+                                      or self._slots[0].dtype != dtype):
+                if any(self._pins):
+                    return None
+                self._allocate(tuple(shape), dtype)
+                self._latest = -1
+
+            if self._slots[0] is None:
+                return None
+
+            for offset in range(1, self.capacity + 1):
+                idx = (self._latest + offset) % self.capacity
+                if idx != self._latest and self._pins[idx] == 0:
+                    self._writing = idx
+                    return self._slots[idx]
+        return None
+
+    def commit(self, frame: np.ndarray, timestamp: Optional[float] = None) -> int:
+        """Publishes a frame. If frame is not the acquired slot it is copied in, reallocating on shape changes"""
+        with self._cond:
+            idx = self._writing
+            if idx < 0 or frame is not self._slots[idx]:
+                slot = self.acquire(frame.shape, frame.dtype)
+                if slot is None:
+                    self.dropped += 1
+                    return self.seq
+                np.copyto(slot, frame)
+                idx = self._writing
+
+            if not self._latest_read:
+                self.dropped += 1
+
+            self.seq += 1
+            self._seqs[idx] = self.seq
+            self._stamps[idx] = time.monotonic() if timestamp is None else timestamp
+            self._latest = idx
+            self._latest_read = False
+            self._writing = -1
+            self._cond.notify_all()
+            return self.seq
+
+    @contextmanager
+    def latest(self, mark_read: bool = True):
+        """Pins the newest frame for zero-copy reading. Yields (seq, timestamp, frame) or (0, 0.0, None).
+
+        Passive readers such as a recorder pass mark_read=False, so superseded frames still count as dropped.
+        """
+        with self._cond:
+            idx = self._latest
+            if idx >= 0:
+                self._pins[idx] += 1
+                self._latest_read = self._latest_read or mark_read
+                seq, stamp, frame = self._seqs[idx], self._stamps[idx], self._slots[idx]
+
+        if idx < 0:
+            yield 0, 0.0, None
+            return
+
+        try:
+            yield seq, stamp, frame
+        finally:
+            with self._cond:
+                self._pins[idx] -= 1
+
+    def copy_latest(self, out: Optional[np.ndarray] = None) -> Tuple[int, Optional[np.ndarray]]:
+        """Copies the newest frame into out (allocated if missing or mismatched) and returns (seq, out)"""
+        with self.latest() as (seq, _, frame):
+            if frame is None:
+                return 0, None
+            if out is None or out.shape != frame.shape or out.dtype != frame.dtype:
+                out = frame.copy()
+            else:
+                np.copyto(out, frame)
+            return seq, out
+
+    def wait(self, after_seq: int, timeout: Optional[float] = None) -> int:
+        """Blocks until a frame newer than after_seq is committed or the buffer is closed. Returns the latest seq"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq > after_seq or self.closed, timeout)
+            return self.seq
+
+    def close(self):
+        """Wakes up all waiting consumers"""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"seq": self.seq, "dropped": self.dropped, "capacity": self.capacity}
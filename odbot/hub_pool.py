@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional
+
+log = logging.getLogger(__name__)
+
+SPIKE_USB_VID = 0x0694
+SPIKE_USB_PID = 0x0010
+BAUDRATE = 115200
+PROBE_TIMEOUT_S = 1.5
+
+
+def probe_port(device: str, timeout_s: float = PROBE_TIMEOUT_S) -> bool:
+    """Returns whether a MicroPython REPL answers on device, by interrupting it and waiting for a prompt"""
+    import serial
+
+    try:
+        with serial.Serial(device, BAUDRATE, timeout=0.05, write_timeout=timeout_s) as ser:
+            ser.write(b"\r\x03\x03")
+            deadline = time.monotonic() + timeout_s
+            data = b""
+            while time.monotonic() < deadline:
+                data += ser.read(ser.in_waiting or 1)
+                if b">>>" in data or b"raw REPL" in data:
+                    return True
+    except (OSError, serial.SerialException) as e:
+        log.debug(f"Probing {device} failed: {e}")
+    return False
+
+
+def find_hub_port(ports: Optional[List[str]] = None,
+                  timeout_s: float = PROBE_TIMEOUT_S,
+                  pool: Optional["HubPool"] = None) -> str:
+    """Finds the serial port of a Spike hub.
+
+    A USB hub is recognised by its vendor and product id without opening it. Otherwise all candidate ports, including
+    Bluetooth serial ports, are probed concurrently and the first one with a REPL handshake wins. Ports with a hub in
+    pool (default HUB_POOL) are never probed, the probe would interrupt whatever runs on the hub.
+    """
+    from serial.tools import list_ports
+
+    pool = HUB_POOL if pool is None else pool
+    comports = list_ports.comports()
+    for port in comports:
+        if port.vid == SPIKE_USB_VID and port.pid == SPIKE_USB_PID and not pool.in_use(port.device):
+            return port.device
+
+    candidates = [port.device for port in comports] if ports is None else ports
+    candidates = [device for device in candidates if not pool.holds(device)]
+    if candidates:
+        executor = ThreadPoolExecutor(max_workers=len(candidates), thread_name_prefix="hub-probe")
+        try:
+            futures = {executor.submit(probe_port, device, timeout_s): device for device in candidates}
+            for future in as_completed(futures):
+                if future.result():
+                    log.info(f"Found hub on {futures[future]}")
+                    return futures[future]
+        finally:
+            # Return as soon as one port answered, the other probes finish on their own
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    raise RuntimeError("Couldn't find a Spike hub on any serial port")
+
+
+class HubPool:
+    """Keeps opened hubs by device so reconnecting, e.g. with other motor ports, skips reopening the serial link"""
+
+    def __init__(self):
+        self._hubs = {}
+        self._in_use = set()
+        self._lock = threading.Lock()
+
+    def acquire(self, device: str, factory):
+        with self._lock:
+            hub = self._hubs.pop(device, None)
+            self._in_use.add(device)
+        if hub is not None:
+            log.debug(f"Reusing open hub on {device}")
+            return hub
+        try:
+            return factory(device=device)
+        except Exception:
+            with self._lock:
+                self._in_use.discard(device)
+            raise
+
+    def in_use(self, device: str) -> bool:
+        with self._lock:
+            return device in self._in_use
+
+    def holds(self, device: str) -> bool:
+        """Whether a hub on device is in use or kept open in the pool"""
+        with self._lock:
+            return device in self._in_use or device in self._hubs
+
+    def release(self, device: str, hub):
+        """Returns an open hub to the pool instead of closing it"""
+        with self._lock:
+            self._in_use.discard(device)
+            old = self._hubs.pop(device, None)
+            self._hubs[device] = hub
+        if old is not None and old is not hub:
+            old.close()
+
+    def discard(self, device: str):
+        with self._lock:
+            self._in_use.discard(device)
+            hub = self._hubs.pop(device, None)
+        if hub is not None:
+            hub.close()
+
+    def close_all(self):
+        with self._lock:
+            hubs, self._hubs = list(self._hubs.values()), {}
+        for hub in hubs:
+            try:
+                hub.close()
+            except Exception as e:
+                log.warning(f"Error closing hub: {e}")
+
+
+HUB_POOL = HubPool()
@@ -0,0 +1,239 @@
+"""Decides, per detection, which part of the frame the model sees and at which input size.
+
+Most of the time only the surroundings of already tracked objects need a detection, and a small crop runs much faster
+than the whole frame at full resolution. The whole frame is still detected every FULL_FRAME_INTERVAL_S, and whenever
+nothing is tracked, so new objects are found. The full-frame input size is adjusted to keep a detection within the
+latency budget, trading the size of the smallest detectable object for detections per second.
+"""
+import logging
+import os
+import time
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from odbot.metrics import METRICS
+from odbot.models.base import BaseModel
+
+log = logging.getLogger(__name__)
+
+DEFAULT_INFERENCE_SIZE = int(os.environ.get("ODBOT_INFERENCE_SIZE", 640))
+DEFAULT_LATENCY_BUDGET_S = float(os.environ.get("ODBOT_INFERENCE_BUDGET_MS", 100)) / 1000
+
+FULL_FRAMES = METRICS.counter("odbot_detection_full_frames_total", "Detections run on the whole frame")
+CROPS = METRICS.counter("odbot_detection_crops_total", "Detections run on a crop around tracked objects")
+INPUT_SIZE = METRICS.gauge("odbot_inference_input_size", "Network input size of full-frame detections")
+MIN_OBJECT_PX = METRICS.gauge("odbot_inference_min_object_px",
+                              "Approximate smallest detectable object in full-frame detections, in frame pixels")
+
+
+class Region(NamedTuple):
+    """Part of the frame to run the model on, in frame pixels, and the network input size to run it at"""
+    x: int
+    y: int
+    width: int
+    height: int
+    size: int
+
+
+class InferenceScheduler:
+    """Plans and runs the model calls for one frame, see the module docstring.
+
+    tracks returns the currently tracked boxes as (N, 4+) xyxy rows, e.g. TrackerThread.predictions, or None.
+    Backends with a fixed input size (BaseModel.dynamic_img_size False) gain nothing from smaller crops, so they
+    always detect on the whole frame, downsized to their input size.
+    """
+
+    SIZES = (160, 224, 320, 416, 512, 640)  # Input sizes to choose from, fewer distinct shapes keep runtimes warm
+    MIN_FULL_FRAME_SIZE = 320
+    FULL_FRAME_INTERVAL_S = 1.0
+    CROP_MARGIN = 0.5  # Added around each tracked box, relative to its size, for the motion until the next detection
+    MIN_CROP_PX = 64
+    MAX_CROP_COST = 0.5  # Crops are only worth it while their input area stays below this share of a full frame
+    GROW_MARGIN = 0.8  # Only grow when the larger size is expected to take less than this share of the budget
+    LATENCY_SMOOTHING = 0.2
+    MIN_OBJECT_INPUT_PX = 8  # YOLOv5's finest output stride, objects smaller than this at the input are mostly missed
+
+    def __init__(self,
+                 inference_size: int = DEFAULT_INFERENCE_SIZE,
+                 latency_budget_s: float = DEFAULT_LATENCY_BUDGET_S,
+                 tracks: Callable[[], Optional[np.ndarray]] = lambda: None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_size = max([s for s in self.SIZES if s <= inference_size] or self.SIZES[:1])
+        self.latency_budget_s = latency_budget_s
+        self.tracks = tracks
+        self.clock = clock
+        self.size = self.max_size
+        self.full_frames = 0
+        self.crops = 0
+        self._latency = {}  # Input size -> smoothed seconds per model call
+        self._last_full_frame = None
+        self._frame_shape = None
+        self._started = clock()
+
+    def _adapt_size(self, model: BaseModel):
+        """Picks the largest full-frame size whose expected latency fits the budget"""
+        if not model.dynamic_img_size:
+            self.size = model.img_size
+            return
+        if not self._latency:
+            return
+
+        sizes = [s for s in self.SIZES if min(self.MIN_FULL_FRAME_SIZE, self.max_size) <= s <= self.max_size]
+        fits = [s for s in sizes if self.expected_latency_s(s) <= self.latency_budget_s]
+        size = max(fits) if fits else sizes[0]
+        if size > self.size and self.expected_latency_s(size) > self.GROW_MARGIN * self.latency_budget_s:
+            size = self.size
+        if size != self.size:
+            self.size = size
+            self._log_tradeoff()
+
+    def _crop_size(self, width: int, height: int) -> int:
+        return next((s for s in self.SIZES if s >= max(width, height)), self.size)
+
+    def _crop_regions(self, boxes: np.ndarray, frame_width: int, frame_height: int) -> List[Region]:
+        """Expanded track boxes, merged where they overlap, as crops at the smallest size that fits them"""
+        rects = []
+        for x1, y1, x2, y2 in boxes[:, :4]:
+            mx, my = (x2 - x1) * self.CROP_MARGIN, (y2 - y1) * self.CROP_MARGIN
+            rects.append([max(0.0, x1 - mx), max(0.0, y1 - my), min(frame_width, x2 + mx), min(frame_height, y2 + my)])
+
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(rects)):
+                for j in range(i + 1, len(rects)):
+                    a, b = rects[i], rects[j]
+                    if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                        rects[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                        del rects[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+
+        regions = []
+        for x1, y1, x2, y2 in rects:
+            # Grow small crops around their centre, so the model sees some context
+            width, height = max(x2 - x1, self.MIN_CROP_PX), max(y2 - y1, self.MIN_CROP_PX)
+            x = int(np.clip((x1 + x2 - width) / 2, 0, max(0, frame_width - width)))
+            y = int(np.clip((y1 + y2 - height) / 2, 0, max(0, frame_height - height)))
+            width, height = int(min(width, frame_width - x)), int(min(height, frame_height - y))
+            regions.append(Region(x, y, width, height, min(self._crop_size(width, height), self.size)))
+        return regions
+
+    def plan(self, model: BaseModel, frame_shape: Tuple[int, ...]) -> List[Region]:
+        """The regions to detect on for the next frame, either one full-frame region or crops around the tracks"""
+        self._adapt_size(model)
+        height, width = frame_shape[:2]
+        full_frame = [Region(0, 0, width, height, self.size)]
+
+        now = self.clock()
+        if (not model.dynamic_img_size or self._last_full_frame is None
+                or now - self._last_full_frame >= self.FULL_FRAME_INTERVAL_S):
+            return full_frame
+        boxes = self.tracks()
+        if boxes is None or len(boxes) == 0:
+            return full_frame
+
+        regions = self._crop_regions(np.asarray(boxes, dtype=np.float32), width, height)
+        if sum(region.size ** 2 for region in regions) > self.MAX_CROP_COST * self.size ** 2:
+            return full_frame
+        return regions
+
+    def _run(self, model: BaseModel, frame: np.ndarray, region: Region) -> np.ndarray:
+        img = frame[region.y:region.y + region.height, region.x:region.x + region.width]
+        # Downsize here, the model's own letterboxing is slower on large frames
+        scale = min(1.0, region.size / max(region.width, region.height))
+        if scale < 1.0:
+            img = cv2.resize(img, (max(1, round(region.width * scale)), max(1, round(region.height * scale))),
+                             interpolation=cv2.INTER_AREA)
+        if model.dynamic_img_size:
+            model.set_img_size(region.size)
+
+        start = time.perf_counter()
+        predictions = model.get_predictions(img)
+        elapsed = time.perf_counter() - start
+        previous = self._latency.get(model.img_size)
+        self._latency[model.img_size] = elapsed if previous is None else (
+            previous + self.LATENCY_SMOOTHING * (elapsed - previous))
+
+        if predictions is None:
+            return np.zeros((0, 6), dtype=np.float32)
+        if hasattr(predictions, "cpu"):
+            predictions = predictions.cpu().numpy()
+        predictions = np.array(predictions, dtype=np.float32).reshape(-1, 6)
+        predictions[:, :4] /= scale
+        predictions[:, :4] += (region.x, region.y, region.x, region.y)
+        return predictions
+
+    def detect(self, model: BaseModel, frame: np.ndarray) -> np.ndarray:
+        """Runs model on the planned regions of frame and returns (N, 6) predictions in frame coordinates"""
+        regions = self.plan(model, frame.shape)
+        if self._frame_shape != frame.shape[:2]:
+            self._frame_shape = frame.shape[:2]
+            self._log_tradeoff()
+
+        if len(regions) == 1 and regions[0].width == frame.shape[1] and regions[0].height == frame.shape[0]:
+            self._last_full_frame = self.clock()
+            self.full_frames += 1
+            FULL_FRAMES.inc()
+        else:
+            self.crops += len(regions)
+            CROPS.inc(len(regions))
+        INPUT_SIZE.set(self.size)
+        MIN_OBJECT_PX.set(self.min_object_px())
+        return np.concatenate([self._run(model, frame, region) for region in regions])
+
+    def expected_latency_s(self, size: Optional[int] = None) -> Optional[float]:
+        """Latency of a model call at input size (default the full-frame size).
+
+        Measured directly when calls ran at that size. Otherwise it comes from a least squares fit of a fixed
+        per-call overhead plus a per-pixel cost over all measured sizes, so fast small crops do not make full frames
+        look slow. With only one measured size the overhead is unknown and latency is scaled by the pixel count.
+        """
+        size = self.size if size is None else size
+        if size in self._latency:
+            return self._latency[size]
+        if not self._latency:
+            return None
+
+        pixels = np.array([s * s for s in self._latency], dtype=np.float64)
+        latency = np.array(list(self._latency.values()))
+        if len(pixels) == 1:
+            return float(latency[0] * size * size / pixels[0])
+        per_px, overhead = np.polyfit(pixels, latency, 1)
+        if per_px <= 0:
+            # Noise swamps the size dependence, take the slowest measurement
+            return float(latency.max())
+        return float(max(overhead, 0.0) + per_px * size * size)
+
+    def min_object_px(self) -> float:
+        """Rough size in frame pixels below which full-frame detections miss objects at the current input size"""
+        if self._frame_shape is None:
+            return 0.0
+        return self.MIN_OBJECT_INPUT_PX * max(1.0, max(self._frame_shape) / self.size)
+
+    def stats(self) -> dict:
+        """The current speed and accuracy tradeoff"""
+        elapsed = max(self.clock() - self._started, 1e-6)
+        latency = self.expected_latency_s()
+        return {
+            "input_size": self.size,
+            "max_input_size": self.max_size,
+            "latency_budget_ms": self.latency_budget_s * 1000,
+            "expected_full_frame_ms": None if latency is None else round(latency * 1000, 1),
+            "full_frames_per_s": round(self.full_frames / elapsed, 2),
+            "crops_per_s": round(self.crops / elapsed, 2),
+            "min_object_px": round(self.min_object_px(), 1),
+        }
+
+    def _log_tradeoff(self):
+        latency = self.expected_latency_s()
+        expected = "" if latency is None else f", about {latency * 1000:.0f} ms per full frame"
+        objects = "" if self._frame_shape is None else (
+            f", objects under {self.min_object_px():.0f} px of the {self._frame_shape[1]}x{self._frame_shape[0]} "
+            f"frame may be missed")
+        log.info(f"Detecting at input size {self.size} of {self.max_size} for a "
+                 f"{self.latency_budget_s * 1000:.0f} ms budget{expected}{objects}")
@@ -0,0 +1,200 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple
+
+import pygame
+
+log = logging.getLogger(__name__)
+
+
+class InputState(NamedTuple):
+    """Immutable joystick snapshot. A new one replaces the old on every change, so readers never need a lock"""
+    axes: Tuple[float, ...]
+    buttons: Tuple[int, ...]
+    hats: Tuple[Tuple[int, int], ...]
+    timestamp: float
+    seq: int
+
+
+class InputEvent(NamedTuple):
+    timestamp: float
+    event: pygame.event.Event
+
+
+def apply_event(state: InputState, event: pygame.event.Event, timestamp: float) -> Optional[InputState]:
+    """The snapshot after event, or None when the event does not change axes, buttons or hats"""
+    axes, buttons, hats = state.axes, state.buttons, state.hats
+    if event.type == pygame.JOYAXISMOTION and event.axis < len(axes):
+        axes = axes[:event.axis] + (event.value, ) + axes[event.axis + 1:]
+    elif event.type in (pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP) and event.button < len(buttons):
+        pressed = int(event.type == pygame.JOYBUTTONDOWN)
+        buttons = buttons[:event.button] + (pressed, ) + buttons[event.button + 1:]
+    elif event.type == pygame.JOYHATMOTION and event.hat < len(hats):
+        hats = hats[:event.hat] + (tuple(event.value), ) + hats[event.hat + 1:]
+    else:
+        return None
+    return InputState(axes, buttons, hats, timestamp, state.seq + 1)
+
+
+class PygameJoystickSource:
+    """Blocks on pygame joystick events for one controller"""
+
+    def __init__(self, index: int = 0):
+        pygame.init()
+        pygame.joystick.init()
+        self.joystick = pygame.joystick.Joystick(index)
+        self.instance_id = self.joystick.get_instance_id()
+        self.name = self.joystick.get_name()
+        self._closed = False
+
+    def initial_state(self):
+        axes = tuple(self.joystick.get_axis(i) for i in range(self.joystick.get_numaxes()))
+        buttons = tuple(self.joystick.get_button(i) for i in range(self.joystick.get_numbuttons()))
+        hats = tuple(self.joystick.get_hat(i) for i in range(self.joystick.get_numhats()))
+        return axes, buttons, hats
+
+    def wait_event(self, timeout_s: float) -> Optional[pygame.event.Event]:
+        event = pygame.event.wait(int(timeout_s * 1000))
+        if event.type == pygame.NOEVENT:
+            return None
+        # Events of other controllers are not ours, device add/remove events are always passed on
+        if getattr(event, "instance_id", self.instance_id) != self.instance_id:
+            return None
+        return event
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        # Only this controller, the joystick module and pygame itself belong to the GUI thread, which lists controllers
+        self.joystick.quit()
+
+
+class ScriptedJoystickSource:
+    """Replays a script of (delay_s, event_type, attributes) steps as joystick events, for headless runs"""
+
+    def __init__(self,
+                 steps: Sequence[Tuple[float, int, dict]],
+                 num_axes: int = 6,
+                 num_buttons: int = 10,
+                 num_hats: int = 1,
+                 name: str = "Scripted controller",
+                 realtime: bool = True):
+        self.steps = list(steps)
+        self.num_axes, self.num_buttons, self.num_hats = num_axes, num_buttons, num_hats
+        self.name = name
+        self.realtime = realtime
+        self._next = 0
+        self._start = None
+        self._closed = threading.Event()
+
+    @staticmethod
+    def axis(delay_s: float, axis: int, value: float):
+        return delay_s, pygame.JOYAXISMOTION, {"axis": axis, "value": value, "instance_id": 0}
+
+    @staticmethod
+    def button(delay_s: float, button: int, pressed: bool = True):
+        return delay_s, pygame.JOYBUTTONDOWN if pressed else pygame.JOYBUTTONUP, {"button": button, "instance_id": 0}
+
+    @staticmethod
+    def hat(delay_s: float, hat: int, value: Tuple[int, int]):
+        return delay_s, pygame.JOYHATMOTION, {"hat": hat, "value": value, "instance_id": 0}
+
+    @staticmethod
+    def removed(delay_s: float):
+        return delay_s, pygame.JOYDEVICEREMOVED, {"instance_id": 0}
+
+    def initial_state(self):
+        # Everything centred, like a freshly connected controller before its first event
+        return (0.0, ) * self.num_axes, (0, ) * self.num_buttons, ((0, 0), ) * self.num_hats
+
+    def finished(self) -> bool:
+        return self._next >= len(self.steps)
+
+    def wait_event(self, timeout_s: float) -> Optional[pygame.event.Event]:
+        if self._start is None:
+            self._start = time.monotonic()
+        if self.finished():
+            self._closed.wait(timeout_s)
+            return None
+
+        delay_s, event_type, attributes = self.steps[self._next]
+        if self.realtime:
+            remaining = self._start + delay_s - time.monotonic()
+            if remaining > timeout_s:
+                self._closed.wait(timeout_s)
+                return None
+            if remaining > 0 and self._closed.wait(remaining):
+                return None
+        self._next += 1
+        return pygame.event.Event(event_type, attributes)
+
+    def close(self):
+        self._closed.set()
+
+
+class InputThread:
+    """Processes joystick events as they arrive instead of sampling them once per control tick.
+
+    Every change publishes a new InputState snapshot and appends the event to a timestamped queue, so button edges
+    between ticks are never lost. on_change is called from the input thread with each new snapshot.
+    """
+
+    WAIT_TIMEOUT_S = 0.1
+    STOP_TIMEOUT_S = 1.0
+
+    def __init__(self, source, on_change: Callable[[InputState], None] = None):
+        self.source = source
+        self.on_change = on_change
+        self.events = queue.SimpleQueue()
+
+        axes, buttons, hats = source.initial_state()
+        self.state = InputState(tuple(axes), tuple(buttons), tuple(hats), time.monotonic(), 0)
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="input", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while self._running:
+            try:
+                event = self.source.wait_event(self.WAIT_TIMEOUT_S)
+            except Exception as e:
+                log.error(f"Error reading controller events: {e}")
+                break
+            if event is None:
+                continue
+
+            timestamp = time.monotonic()
+            self.events.put(InputEvent(timestamp, event))
+            state = apply_event(self.state, event, timestamp)
+            if state is None:
+                continue
+            self.state = state
+            if self.on_change is not None:
+                try:
+                    self.on_change(state)
+                except Exception as e:
+                    log.error(f"Error handling controller input: {e}")
+
+    def drain_events(self) -> List[InputEvent]:
+        """Returns and removes all events received since the last call, oldest first"""
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def stop(self):
+        """Stops the input thread, then closes the source. Closing a pygame source closes its joystick, which must not
+        happen while the thread still waits for its events"""
+        self._running = False
+        if threading.current_thread() is not self._thread:
+            self._thread.join(self.STOP_TIMEOUT_S)
+            if self._thread.is_alive():
+                log.warning("Input thread did not stop, leaving the controller open")
+                return
+        self.source.close()
@@ -0,0 +1,125 @@
+import logging
+import time
+from typing import Callable, List
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class Stage:
+
+    def __init__(self, name: str, rate_hz: float, fn: Callable[[], None]):
+        self.name = name
+        self.period = 1.0 / rate_hz
+        self.fn = fn
+        self.next_run = 0.0
+        self.runs = 0
+
+
+class LoopScheduler:
+    """Fixed-rate, deadline-based loop.
+
+    Deadlines advance by exactly one period per tick, so time spent in the loop body is compensated for instead of
+    adding to the period. A tick that runs past the next deadline counts as an overrun, and once the loop is more than
+    a full period behind the schedule skips ahead rather than bursting to catch up. Each stage runs at its own rate,
+    at most once per tick.
+    """
+
+    HISTORY = 1024  # Number of ticks kept for timing statistics
+
+    def __init__(self, rate_hz: float, clock=time.perf_counter, sleep=time.sleep):
+        self.period = 1.0 / rate_hz
+        self.stages: List[Stage] = []
+        self.clock = clock
+        self.sleep = sleep
+
+        self.ticks = 0
+        self.overruns = 0
+        self._lateness = np.zeros(self.HISTORY)
+        self._durations = np.zeros(self.HISTORY)
+        self._intervals = np.zeros(self.HISTORY)
+        self._last_start = None
+
+    def add_stage(self, name: str, rate_hz: float, fn: Callable[[], None]) -> Stage:
+        stage = Stage(name, min(rate_hz, 1.0 / self.period), fn)
+        self.stages.append(stage)
+        return stage
+
+    def _run_stages(self, now: float):
+        for stage in self.stages:
+            # Small tolerance so a stage at the loop rate does not skip a tick due to float rounding
+            if now + self.period * 0.01 >= stage.next_run:
+                stage.fn()
+                stage.runs += 1
+                stage.next_run += stage.period
+                if stage.next_run < now:
+                    stage.next_run = now + stage.period
+
+    def tick(self, deadline: float) -> float:
+        """Runs one tick that was due at deadline and returns the next deadline"""
+        start = self.clock()
+        self._run_stages(start)
+        end = self.clock()
+
+        idx = self.ticks % self.HISTORY
+        self._lateness[idx] = start - deadline
+        self._durations[idx] = end - start
+        self._intervals[idx] = 0.0 if self._last_start is None else start - self._last_start
+        self._last_start = start
+        self.ticks += 1
+
+        next_deadline = deadline + self.period
+        if end > next_deadline:
+            self.overruns += 1
+            if end - next_deadline > self.period:
+                next_deadline = end
+        return next_deadline
+
+    def run(self, running: Callable[[], bool]):
+        deadline = self.clock()
+        for stage in self.stages:
+            stage.next_run = deadline
+        while running():
+            deadline = self.tick(deadline)
+            remaining = deadline - self.clock()
+            if remaining > 0:
+                self.sleep(remaining)
+
+    def stats(self) -> dict:
+        """Timing of the recent ticks in milliseconds: jitter is the deviation of tick intervals from the period"""
+        n = min(self.ticks, self.HISTORY)
+        if n < 2:
+            return {"ticks": self.ticks, "overruns": self.overruns}
+
+        intervals = self._intervals[:n] if self.ticks <= self.HISTORY else self._intervals
+        intervals = intervals[intervals > 0]
+        lateness = self._lateness[:n] * 1000
+        durations = self._durations[:n] * 1000
+        stats = {
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "rate_hz": 1.0 / self.period,
+            "lateness_p95_ms": float(np.percentile(lateness, 95)),
+            "duration_p95_ms": float(np.percentile(durations, 95)),
+            "stage_runs": {stage.name: stage.runs for stage in self.stages},
+        }
+        if intervals.size == 0:
+            # A clock that did not advance between the ticks, e.g. a coarse one, leaves no intervals to measure
+            return stats
+
+        jitter = np.abs(intervals - self.period) * 1000
+        stats.update({
+            "mean_period_ms": float(intervals.mean() * 1000),
+            "jitter_p50_ms": float(np.percentile(jitter, 50)),
+            "jitter_p95_ms": float(np.percentile(jitter, 95)),
+            "jitter_p99_ms": float(np.percentile(jitter, 99)),
+            "jitter_max_ms": float(jitter.max()),
+        })
+        return stats
+
+    def timings(self) -> np.ndarray:
+        """Per-tick (lateness, duration) in seconds for the recent ticks, oldest first"""
+        n = min(self.ticks, self.HISTORY)
+        order = np.arange(n) if self.ticks <= self.HISTORY else (np.arange(n) + self.ticks) % self.HISTORY
+        return np.stack([self._lateness[order], self._durations[order]], axis=1)
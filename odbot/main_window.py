@@ -1,67 +1,146 @@
 import logging
+import os
+import threading
+import time
 
-import pygame
-from PySide6.QtCore import Qt, QThread
+from PySide6.QtCore import QObject, Qt, QThread, QTimer, Signal
 from PySide6.QtGui import QCloseEvent
 from PySide6.QtUiTools import QUiLoader
 from PySide6.QtWidgets import QMainWindow, QMessageBox, QProgressDialog
-from serial.tools import list_ports
 
-from odbot.control_worker import ControlWorker, ControlWorkerSignalValues
+from odbot.hub_pool import HUB_POOL
+from odbot.metrics import MetricsServer
+from odbot.models import cache
+from odbot.models.factory import BACKENDS, DEFAULT_BACKEND, OUT_OF_PROCESS, create_model
+from odbot.sensors_panel import SensorsPanel
+from odbot.stats_overlay import StatsOverlay
 from odbot.utils import resource_path
-from odbot.video_stream import VideoStream
+
+# cv2 (video_stream, recorder), pygame (control_worker) and pyserial (hub_pool) are imported where they are first
+# needed, mostly on the startup thread below, so the window shows without waiting for them. torch is only imported
+# by the model factory once object detection is enabled.
 
 log = logging.getLogger(__name__)
 
 loader = QUiLoader()
 
 
+class StartupLoader(QObject):
+    """Imports the video stack and pygame and discovers serial ports on a background thread after the window is shown,
+    reporting each as soon as it is ready. Controllers are listed on the GUI thread, which owns pygame's joystick
+    module"""
+
+    video_ready = Signal()
+    ports_found = Signal(list)
+
+    def __init__(self, window: "MainWindow"):
+        super().__init__()
+        self.window = window
+        self.thread = threading.Thread(target=self._run, name="startup", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            import odbot.video_stream  # noqa: F401
+
+            # Only the import, initialising SDL's joystick support is left to the GUI thread
+            import pygame  # noqa: F401
+            self.video_ready.emit()
+            self.ports_found.emit(self.window._search_ports())
+        except Exception as e:
+            log.error(f"Error during background startup: {e}")
+        log.debug(f"Background startup took {time.perf_counter() - start:.2f}s")
+
+
 class MainWindow(QMainWindow):
 
     AUTO_CONNECTION_STR = "USB"
     CONNECTED_STR = "Connected"
     DISCONNECTED_STR = "Disconnected"
+    RECONNECTING_STR = "Reconnecting"
     MOTOR_OPTIONS = ["A", "B", "C", "D", "E", "F"]
     DEFAULT_ENGINE = "B"
     DEFAULT_STEERING = "A"
     MAINWINDOW_UI_PATH = resource_path("odbot/ui/main_window.ui")
+    SENSORS_UI_PATH = resource_path("odbot/ui/sensors.ui")
+    # Loading a model imports torch and takes seconds, so it is only warmed up at startup when asked for
+    WARMUP_OD_MODEL = os.environ.get("ODBOT_WARMUP_OD_MODEL", "0") == "1"
+    CONTROL_STOP_TIMEOUT_MS = 5000
+    RECORDINGS_DIR = os.path.join(os.path.expanduser("~"), ".odbot", "recordings")
+    METRICS_PORT = os.environ.get("ODBOT_METRICS_PORT")  # Serves Prometheus metrics on localhost when set
 
     def __init__(self) -> None:
         super().__init__()
         self.view = loader.load(self.MAINWINDOW_UI_PATH, self)
-        self.video_stream = self._start_video_stream()
+        self.video_stream = None
         self.control_thread = None
         self.control_worker = None
+        self.recorder = None
         self.motor_speed, self.motor_steer = self.DEFAULT_ENGINE, self.DEFAULT_STEERING
 
+        # Sensors panel next to the video
+        self.sensors_view = loader.load(self.SENSORS_UI_PATH, self.view)
+        self.view.horizontalLayout_4.addWidget(self.sensors_view)
+        self.sensors_panel = SensorsPanel(self.sensors_view, self._get_telemetry_buffer)
+        self.stats_overlay = StatsOverlay(self.view.image_label)
+
+        self.metrics_server = None
+        if self.METRICS_PORT:
+            try:
+                self.metrics_server = MetricsServer(port=int(self.METRICS_PORT))
+                self.metrics_server.start()
+            except (OSError, ValueError) as e:
+                log.error(f"Could not serve metrics on port {self.METRICS_PORT}: {e}")
+
         # Setup input fields
         self.view.input_engine_port.addItems(self.MOTOR_OPTIONS)
         self.view.input_engine_port.setCurrentText(self.DEFAULT_ENGINE)
         self.view.input_steering_port.addItems(self.MOTOR_OPTIONS)
         self.view.input_steering_port.setCurrentText(self.DEFAULT_STEERING)
-        self.view.input_connect.addItems(self._search_ports())
-        self.view.input_controller.addItems(self._search_controllers())
+        self.view.input_connect.addItems([self.AUTO_CONNECTION_STR])
+        self.view.input_od_backend.addItems(list(BACKENDS))
+        self.view.input_od_backend.setCurrentText(DEFAULT_BACKEND)
 
         # Assign button signals
         self.view.button_refresh.clicked.connect(self.button_refresh_clicked)
         self.view.button_controller_refresh.clicked.connect(self.button_controller_refresh_clicked)
         self.view.button_video_connect.clicked.connect(self.button_video_connect_clicked)
         self.view.checkbox_od.stateChanged.connect(self.handle_checkbox_od_changed)
+        self.view.checkbox_record.stateChanged.connect(self.handle_checkbox_record_changed)
+        self.view.checkbox_stats.stateChanged.connect(
+            lambda state: self.stats_overlay.set_enabled(Qt.CheckState(state) == Qt.Checked))
         self.view.button_connect_control.clicked.connect(self.button_connect_control_clicked)
         self.view.button_disconnect_control.clicked.connect(self.button_disconnect_control_clicked)
 
+        # The video stream, the device lists and the optional model warm-up follow once the window is up
+        self.view.checkbox_od.setEnabled(False)
+        self.startup_loader = StartupLoader(self)
+        self.startup_loader.video_ready.connect(self.handle_video_ready)
+        self.startup_loader.ports_found.connect(self.handle_ports_found)
+        QTimer.singleShot(0, self.startup_loader.start)
+
     """
     Qt functions
     """
 
     def closeEvent(self, event: QCloseEvent):
+        self.sensors_panel.stop()
+        self.stats_overlay.set_enabled(False)
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        self._stop_recording()
         if self.video_stream is not None:
             self.video_stream.stop()
         if self.control_worker is not None:
             self.control_worker.stop()
-        if self.control_thread is not None:
+        if self.control_thread is not None and not self.control_thread.wait(self.CONTROL_STOP_TIMEOUT_MS):
+            log.warning("Control thread did not stop, terminating it")
             self.control_thread.terminate()
             self.control_thread.wait()
+        HUB_POOL.close_all()
         event.accept()
 
     """
@@ -71,15 +150,16 @@ class MainWindow(QMainWindow):
     def button_refresh_clicked(self):
         log.info("Refreshing ports")
         self.view.input_connect.clear()
-        self._search_ports()
+        self.view.input_connect.addItems(self._search_ports())
 
     def button_disconnect_control_clicked(self):
+        # The control thread releases the controller and hub, handle_control_thread_finished re-enables connecting
         self.control_worker.stop()
-        self.control_worker = None
-        self.view.button_connect_control.setEnabled(True)
         self.view.button_disconnect_control.setEnabled(False)
 
     def button_controller_connect_clicked(self):
+        from odbot.control_worker import ControlWorker
+
         controller_index = self.view.input_controller.currentIndex()
         log.info(f"Connecting to controller {controller_index}")
         self.controller = self._connect_controller(controller_index)
@@ -94,13 +174,17 @@ class MainWindow(QMainWindow):
             self.video_stream.stop()
 
         self.video_stream = self._start_video_stream()
+        if self.recorder is not None:
+            self.video_stream.set_recorder(self.recorder)
 
     def button_controller_refresh_clicked(self):
         log.info("Refreshing controllers")
         self.view.input_controller.clear()
-        self._search_controllers()
+        self.view.input_controller.addItems(self._search_controllers())
 
     def button_connect_control_clicked(self):
+        from odbot.control_worker import ControlWorker
+
         hub_port = self._get_port()
         motor_speed = self.view.input_engine_port.currentText()
         motor_steer = self.view.input_steering_port.currentText()
@@ -108,10 +192,15 @@ class MainWindow(QMainWindow):
 
         self.control_thread = QThread()
         self.control_worker = ControlWorker(hub_port, motor_speed, motor_steer, controller_idx)
+        self.control_worker.recorder = self.recorder
         self.control_worker.signals.connection.connect(self.handle_control_connection)
         self.control_worker.moveToThread(self.control_thread)
         self.control_thread.started.connect(self.control_worker.run)
+        # Direct, so the thread also quits while the GUI thread waits for it in closeEvent
+        self.control_worker.finished.connect(self.control_thread.quit, Qt.DirectConnection)
+        self.control_thread.finished.connect(self.handle_control_thread_finished)
         self.control_thread.start()
+        self.view.button_connect_control.setEnabled(False)
 
         self.dialog = QProgressDialog("Connecting to hub...", None, 0, 0, self)
         self.dialog.show()
@@ -136,7 +225,16 @@ class MainWindow(QMainWindow):
         log.error("Hub Error")
         self.dialog.reject()
         _ = QMessageBox.critical(self, "Error", "Could not connect to hub. Please try again.")
-        self.control_worker.stop()
+        if self.control_worker is not None:
+            self.control_worker.stop()
+
+    def handle_control_thread_finished(self):
+        if self.control_thread is None or not self.control_thread.isFinished():
+            return
+        self.control_worker = None
+        self.control_thread = None
+        self.view.button_connect_control.setEnabled(True)
+        self.view.button_disconnect_control.setEnabled(False)
 
     def handle_controller_error(self):
         log.error("Controller Error")
@@ -153,6 +251,8 @@ class MainWindow(QMainWindow):
         self.view.button_disconnect_control.setEnabled(True)
 
     def handle_control_connection(self, ret):
+        from odbot.control_worker import ControlWorkerSignalValues
+
         if ret == ControlWorkerSignalValues.HUB_CONNECTION_ERROR:
             self.handle_hub_error()
         elif ret == ControlWorkerSignalValues.CONTROLLER_CONNECTION_ERROR:
@@ -160,10 +260,37 @@ class MainWindow(QMainWindow):
         elif ret == ControlWorkerSignalValues.CONNECTED:
             self.handle_control_connect_success()
 
+    def handle_video_ready(self):
+        # Connecting by hand before the video stack was imported already started a stream
+        if self.video_stream is None:
+            self.video_stream = self._start_video_stream()
+            if self.recorder is not None:
+                self.video_stream.set_recorder(self.recorder)
+        self.view.checkbox_od.setEnabled(True)
+        QTimer.singleShot(0, lambda: self.handle_controllers_found(self._search_controllers()))
+
+        # Load and warm up the detection model so ticking the checkbox is instant
+        if self.WARMUP_OD_MODEL:
+            backend = self.view.input_od_backend.currentText()
+            cache.warmup_in_background(lambda: create_model(backend, out_of_process=OUT_OF_PROCESS))
+
+    def handle_ports_found(self, ports: list):
+        current = self.view.input_connect.currentText()
+        self.view.input_connect.clear()
+        self.view.input_connect.addItems(ports)
+        self.view.input_connect.setCurrentText(current)
+
+    def handle_controllers_found(self, controllers: list):
+        self.view.input_controller.clear()
+        self.view.input_controller.addItems(controllers)
+
     def handle_video_stream_stopped(self):
         self.view.label_video.setText(self.DISCONNECTED_STR)
         _ = QMessageBox.critical(self, "Error", "Video Stream Error. Please try again.")
 
+    def handle_video_stream_reconnecting(self, reconnecting: bool):
+        self.view.label_video.setText(self.RECONNECTING_STR if reconnecting else self.CONNECTED_STR)
+
     def handle_checkbox_od_changed(self, state: int):
         state = Qt.CheckState(state)
         log.info(f"Checkbox state changed to {state}")
@@ -171,10 +298,25 @@ class MainWindow(QMainWindow):
             self.od_dialog = QProgressDialog("Starting object detection...", None, 0, 0, self)
             self.od_dialog.show()
 
-            self.video_stream.set_object_detection(True)
-            self.video_stream.od_thread.initialised.connect(self.od_dialog.accept)
+            self.view.input_od_backend.setEnabled(False)
+            self.video_stream.set_object_detection(True,
+                                                   backend=self.view.input_od_backend.currentText(),
+                                                   on_initialised=self.od_dialog.accept,
+                                                   on_load_failed=self.handle_od_load_failed)
         elif state == Qt.Unchecked:
             self.video_stream.set_object_detection(False)
+            self.view.input_od_backend.setEnabled(True)
+
+    def handle_checkbox_record_changed(self, state: int):
+        if Qt.CheckState(state) == Qt.Checked:
+            self._start_recording()
+        else:
+            self._stop_recording()
+
+    def handle_od_load_failed(self, error: str):
+        self.od_dialog.reject()
+        _ = QMessageBox.critical(self, "Error", f"Could not load object detection model: {error}")
+        self.view.checkbox_od.setChecked(False)
 
     """
     Helper functions
@@ -189,10 +331,13 @@ class MainWindow(QMainWindow):
         return video_label
 
     def _start_video_stream(self):
+        from odbot.video_stream import VideoStream
+
         video_label = self._parse_video_input()
         try:
             video_stream = VideoStream(self.view.image_label, video_label)
             video_stream.stream_stopped_signal.connect(self.handle_video_stream_stopped)
+            video_stream.stream_reconnecting_signal.connect(self.handle_video_stream_reconnecting)
             video_stream.start()
             self.view.label_video.setText(self.CONNECTED_STR)
         except ValueError:
@@ -201,7 +346,35 @@ class MainWindow(QMainWindow):
 
         return video_stream
 
+    def _start_recording(self):
+        from odbot.recorder import SessionRecorder
+
+        path = os.path.join(self.RECORDINGS_DIR, time.strftime("session-%Y%m%d-%H%M%S.odrec"))
+        log.info(f"Recording session to {path}")
+        self.recorder = SessionRecorder(path, meta={"source": self._parse_video_input()})
+        if self.video_stream is not None:
+            self.video_stream.set_recorder(self.recorder)
+        if self.control_worker is not None:
+            self.control_worker.recorder = self.recorder
+
+    def _stop_recording(self):
+        if self.recorder is None:
+            return
+        if self.video_stream is not None:
+            self.video_stream.set_recorder(None)
+        if self.control_worker is not None:
+            self.control_worker.recorder = None
+        self.recorder.stop()
+        self.recorder = None
+
+    def _get_telemetry_buffer(self):
+        if self.control_worker is None or self.control_worker.telemetry is None:
+            return None
+        return self.control_worker.telemetry.buffer
+
     def _search_ports(self):
+        from serial.tools import list_ports
+
         # list all available ports in string format
         ports = list_ports.comports()
         items = [self.AUTO_CONNECTION_STR] + [port.device for port in ports]
@@ -213,6 +386,8 @@ class MainWindow(QMainWindow):
         return port
 
     def _search_controllers(self):
+        import pygame
+
         # list all available ports in string format
         pygame.joystick.init()
         no_controllers = pygame.joystick.get_count()
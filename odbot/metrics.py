@@ -0,0 +1,207 @@
+"""Low-overhead counters and latency histograms for the video, detection and control pipeline.
+
+Metrics are declared once at module level and updated on the hot paths:
+
+    CONVERT_TIME = METRICS.histogram("odbot_display_convert_seconds", "Frame to pixmap conversion time")
+    CONVERT_TIME.observe(time.perf_counter() - start)
+
+An update is a few list operations under a lock. When the registry is disabled (ODBOT_METRICS=0) it returns right
+away. METRICS.render() gives the Prometheus text format, which MetricsServer serves on /metrics.
+"""
+import bisect
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+log = logging.getLogger(__name__)
+
+# Upper bounds in seconds, roughly x2 apart from 100 us to 5 s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Counter:
+    """Monotonically increasing count, e.g. frames captured or dropped"""
+
+    TYPE = "counter"
+
+    def __init__(self, registry: "Registry", name: str, help: str):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self.value += amount
+
+    def samples(self) -> List[Tuple[str, float]]:
+        return [(self.name, self.value)]
+
+
+class Gauge:
+    """Current value of something that goes up and down, e.g. the inference input size"""
+
+    TYPE = "gauge"
+
+    def __init__(self, registry: "Registry", name: str, help: str):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.value = 0.0
+
+    def set(self, value: float):
+        if not self.registry.enabled:
+            return
+        self.value = value
+
+    def samples(self) -> List[Tuple[str, float]]:
+        return [(self.name, self.value)]
+
+
+class Histogram:
+    """Counts of observations per fixed bucket, plus their total, so quantiles can be estimated without keeping
+    the observations"""
+
+    TYPE = "histogram"
+
+    def __init__(self, registry: "Registry", name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # The last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        if not self.registry.enabled:
+            return
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self) -> Tuple[List[int], int, float]:
+        with self._lock:
+            return list(self.counts), self.count, self.sum
+
+    def quantile(self, q: float, counts: Optional[Sequence[int]] = None) -> Optional[float]:
+        """Estimates the q quantile by linear interpolation inside its bucket, from counts (default all observations)"""
+        counts = self.snapshot()[0] if counts is None else counts
+        total = sum(counts)
+        if total == 0:
+            return None
+        rank = q * total
+        seen = 0
+        for idx, count in enumerate(counts):
+            if count and seen + count >= rank:
+                if idx == len(self.buckets):
+                    return self.buckets[-1]
+                low = self.buckets[idx - 1] if idx else 0.0
+                return low + (self.buckets[idx] - low) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def samples(self) -> List[Tuple[str, float]]:
+        counts, count, total = self.snapshot()
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"), ), counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            samples.append((f'{self.name}_bucket{{le="{le}"}}', cumulative))
+        samples.append((f"{self.name}_count", count))
+        samples.append((f"{self.name}_sum", total))
+        return samples
+
+
+class Registry:
+    """Named metrics of the application. Declaring a metric twice returns the existing one"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(self, name, *args)
+            metric = self._metrics[name]
+        if not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} is already declared as a {metric.TYPE}")
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get_or_create(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help)
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, buckets)
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+            lines.extend(f"{name} {value:g}" for name, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Registry(enabled=os.environ.get("ODBOT_METRICS", "1") != "0")
+
+
+class MetricsServer:
+    """Serves registry.render() on http://host:port/metrics for Prometheus or curl, on a daemon thread"""
+
+    def __init__(self, registry: Registry = METRICS, host: str = "127.0.0.1", port: int = 9464):
+        # Only imported when the endpoint is enabled, it is a noticeable part of the application's import time
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.registry = registry
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("/metrics", ""):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                log.debug(format % args)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-server", daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self._thread.start()
+        log.info(f"Serving metrics on http://{self.httpd.server_address[0]}:{self.port}/metrics")
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
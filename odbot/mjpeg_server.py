@@ -0,0 +1,149 @@
+"""Local stand-in for a phone IP camera, serving an MJPEG stream over HTTP.
+
+Usage:
+    python -m odbot.mjpeg_server --source 0 --port 8080
+    python -m odbot.mjpeg_server --source video.mp4 --fps 30
+
+Then connect the dashboard to http://127.0.0.1:8080/video. Without --source a synthetic test pattern is served.
+"""
+import argparse
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Union
+
+import cv2
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+BOUNDARY = "frame"
+
+
+class FrameSource:
+    """Produces JPEG frames at a fixed rate from a capture device, a video file (looped) or a test pattern"""
+
+    def __init__(self, source: Optional[Union[int, str]] = None, fps: float = 30, size=(640, 480), quality: int = 80):
+        self.cap = cv2.VideoCapture(source) if source is not None else None
+        self.period = 1.0 / fps
+        self.size = size
+        self.quality = quality
+        self.count = 0
+
+    def _pattern(self) -> np.ndarray:
+        width, height = self.size
+        img = np.zeros((height, width, 3), dtype=np.uint8)
+        x = int((self.count * 8) % width)
+        img[:, :, 1] = np.linspace(0, 255, width, dtype=np.uint8)
+        cv2.rectangle(img, (x, height // 3), (x + 60, height // 3 + 60), (0, 0, 255), -1)
+        cv2.putText(img, f"{self.count}", (10, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        return img
+
+    def next_jpeg(self) -> bytes:
+        img = None
+        if self.cap is not None:
+            ret, img = self.cap.read()
+            if not ret:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ret, img = self.cap.read()
+        if img is None:
+            img = self._pattern()
+        self.count += 1
+        _, jpeg = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return jpeg.tobytes()
+
+
+class MjpegServer:
+    """Serves multipart/x-mixed-replace JPEG frames on /video, like common phone IP camera apps"""
+
+    def __init__(self, source: FrameSource, host: str = "127.0.0.1", port: int = 8080):
+        self.source = source
+        self._cond = threading.Condition()
+        self._jpeg = None
+        self._seq = 0
+        self._running = False
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("/video", ""):
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+                self.end_headers()
+                seq = 0
+                try:
+                    while server._running:
+                        seq, jpeg = server.wait_frame(seq)
+                        if jpeg is None:
+                            continue
+                        self.wfile.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                         f"Content-Length: {len(jpeg)}\r\n\r\n".encode())
+                        self.wfile.write(jpeg)
+                        self.wfile.write(b"\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                log.debug(format % args)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}/video"
+
+    def wait_frame(self, after_seq: int, timeout: float = 1.0):
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq or not self._running, timeout)
+            return self._seq, self._jpeg if self._seq > after_seq else None
+
+    def _produce(self):
+        next_time = time.monotonic()
+        while self._running:
+            jpeg = self.source.next_jpeg()
+            with self._cond:
+                self._jpeg = jpeg
+                self._seq += 1
+                self._cond.notify_all()
+            next_time += self.source.period
+            time.sleep(max(0.0, next_time - time.monotonic()))
+
+    def start(self):
+        """Starts producing frames and serving in background threads"""
+        self._running = True
+        threading.Thread(target=self._produce, name="mjpeg-producer", daemon=True).start()
+        threading.Thread(target=self.httpd.serve_forever, name="mjpeg-server", daemon=True).start()
+        log.info(f"Serving MJPEG stream on {self.url}")
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local MJPEG stream for testing the dashboard")
+    parser.add_argument("--source", default=None, help="Capture device index or video file, test pattern if omitted")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--fps", type=float, default=30)
+    args = parser.parse_args()
+
+    source = int(args.source) if args.source is not None and args.source.isdigit() else args.source
+    logging.basicConfig(level=logging.INFO)
+    server = MjpegServer(FrameSource(source, fps=args.fps), host=args.host, port=args.port)
+    server.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,9 @@ class BaseModel:
 
 	CLASS_MAP = {}
 
+	img_size = 640  # Square network input size images are letterboxed to
+	dynamic_img_size = False  # Whether set_img_size can change img_size between calls
+
 	def __init__(self, model, names:dict) -> None:
 		self.model = model
 		self.names = names
@@ -11,4 +14,12 @@ class BaseModel:
 	def get_predictions(self, img):
 		raise NotImplementedError("Please subclass this method")
 
-	
\ No newline at end of file
+	def get_batch_predictions(self, imgs: list) -> list:
+		"""Returns one prediction array per image. Subclasses should override this with a single forward pass"""
+		return [self.get_predictions(img) for img in imgs]
+
+	def set_img_size(self, size: int):
+		"""Sets the network input size for the following calls, a multiple of 32"""
+		if not self.dynamic_img_size:
+			raise NotImplementedError(f"{type(self).__name__} has a fixed input size of {self.img_size}")
+		self.img_size = size
@@ -0,0 +1,44 @@
+import logging
+import threading
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+_models = {}
+_lock = threading.Lock()
+
+
+def get_or_load(key, loader):
+	"""Returns the process-wide model stored under key, calling loader() once to create it"""
+	with _lock:
+		if key not in _models:
+			log.info(f"Loading model {key}")
+			_models[key] = loader()
+		return _models[key]
+
+
+def is_loaded(key) -> bool:
+	with _lock:
+		return key in _models
+
+
+def evict(key):
+	with _lock:
+		_models.pop(key, None)
+
+
+def warmup_in_background(factory, img_size: int = 640) -> threading.Thread:
+	"""Builds a model with factory() on a daemon thread and runs one dummy inference so the first real one is fast"""
+
+	def _warmup():
+		try:
+			model = factory()
+			model.get_predictions(np.zeros((img_size, img_size, 3), dtype=np.uint8))
+			log.info(f"Warmed up {type(model).__name__}")
+		except Exception as e:
+			log.error(f"Error warming up model: {e}")
+
+	thread = threading.Thread(target=_warmup, name="model-warmup", daemon=True)
+	thread.start()
+	return thread
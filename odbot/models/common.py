@@ -0,0 +1,93 @@
+import cv2
+import numpy as np
+
+COCO_NAMES = [
+	'person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck', 'boat', 'traffic light',
+	'fire hydrant', 'stop sign', 'parking meter', 'bench', 'bird', 'cat', 'dog', 'horse', 'sheep', 'cow', 'elephant',
+	'bear', 'zebra', 'giraffe', 'backpack', 'umbrella', 'handbag', 'tie', 'suitcase', 'frisbee', 'skis', 'snowboard',
+	'sports ball', 'kite', 'baseball bat', 'baseball glove', 'skateboard', 'surfboard', 'tennis racket', 'bottle',
+	'wine glass', 'cup', 'fork', 'knife', 'spoon', 'bowl', 'banana', 'apple', 'sandwich', 'orange', 'broccoli',
+	'carrot', 'hot dog', 'pizza', 'donut', 'cake', 'chair', 'couch', 'potted plant', 'bed', 'dining table', 'toilet',
+	'tv', 'laptop', 'mouse', 'remote', 'keyboard', 'cell phone', 'microwave', 'oven', 'toaster', 'sink',
+	'refrigerator', 'book', 'clock', 'vase', 'scissors', 'teddy bear', 'hair drier', 'toothbrush'
+]
+COCO_NAMES = dict(enumerate(COCO_NAMES))
+
+LETTERBOX_COLOR = 114
+MAX_WH = 4096  # Per-class box offset so one NMS pass never merges boxes of different classes
+
+
+class Letterbox:
+	"""Resizes images into a reused, padded square canvas keeping the aspect ratio"""
+
+	def __init__(self, size: int = 640):
+		self.size = size
+		self.canvas = np.full((size, size, 3), LETTERBOX_COLOR, dtype=np.uint8)
+		self._last_shape = None
+
+	def __call__(self, img: np.ndarray):
+		h, w = img.shape[:2]
+		ratio = min(self.size / h, self.size / w)
+		new_w, new_h = round(w * ratio), round(h * ratio)
+		left, top = (self.size - new_w) // 2, (self.size - new_h) // 2
+
+		# Only repaint the border when the input shape changes
+		if self._last_shape != img.shape:
+			self.canvas[:] = LETTERBOX_COLOR
+			self._last_shape = img.shape
+		self.canvas[top:top + new_h, left:left + new_w] = cv2.resize(img, (new_w, new_h),
+		                                                             interpolation=cv2.INTER_LINEAR)
+		return self.canvas, ratio, (left, top)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+	"""Greedy non-maximum suppression with vectorized IoU. Returns the kept indices by descending score"""
+	x1, y1, x2, y2 = boxes.T
+	areas = (x2 - x1) * (y2 - y1)
+	order = scores.argsort()[::-1]
+
+	keep = []
+	while order.size:
+		i = order[0]
+		keep.append(i)
+		rest = order[1:]
+		w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+		h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+		inter = w * h
+		iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+		order = rest[iou <= iou_threshold]
+	return np.asarray(keep, dtype=np.int64)
+
+
+def postprocess(output: np.ndarray,
+                ratio: float,
+                pad: tuple,
+                img_shape: tuple,
+                conf_threshold: float = 0.25,
+                iou_threshold: float = 0.45,
+                max_det: int = 300) -> np.ndarray:
+	"""Converts a raw (1, N, 5 + classes) YOLOv5 output into an (M, 6) xyxy, conf, class array in image coordinates"""
+	pred = output.reshape(-1, output.shape[-1])
+	pred = pred[pred[:, 4] > conf_threshold]
+	if not len(pred):
+		return np.zeros((0, 6), dtype=np.float32)
+
+	scores = pred[:, 5:] * pred[:, 4:5]
+	classes = scores.argmax(1)
+	conf = scores[np.arange(len(scores)), classes]
+	mask = conf > conf_threshold
+	pred, classes, conf = pred[mask], classes[mask], conf[mask]
+
+	boxes = np.empty((len(pred), 4), dtype=np.float32)
+	boxes[:, :2] = pred[:, :2] - pred[:, 2:4] / 2
+	boxes[:, 2:] = pred[:, :2] + pred[:, 2:4] / 2
+
+	keep = nms(boxes + classes[:, None] * MAX_WH, conf, iou_threshold)[:max_det]
+	boxes, conf, classes = boxes[keep], conf[keep], classes[keep]
+
+	left, top = pad
+	boxes -= (left, top, left, top)
+	boxes /= ratio
+	boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, img_shape[1])
+	boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, img_shape[0])
+	return np.concatenate([boxes, conf[:, None], classes[:, None].astype(np.float32)], axis=1)
@@ -0,0 +1,33 @@
+import importlib
+import os
+
+from odbot.models import cache
+from odbot.models.base import BaseModel
+
+# Backend name -> (module, class, extra kwargs). Modules are imported on demand so that, for example, the ONNX
+# backends never pull in torch.
+BACKENDS = {
+	"PyTorch": ("odbot.models.yolov5", "YoloV5Model", {}),
+	"ONNX Runtime": ("odbot.models.onnx_runtime", "OnnxYoloV5Model", {}),
+	"ONNX Runtime INT8": ("odbot.models.onnx_runtime", "OnnxYoloV5Model", {"int8": True}),
+	"OpenCV DNN": ("odbot.models.opencv_dnn", "OpenCvDnnYoloV5Model", {}),
+}
+DEFAULT_BACKEND = os.environ.get("ODBOT_OD_BACKEND", "PyTorch")
+DEFAULT_VERSION = "yolov5s"
+# Runs the backend in a worker process instead of the GUI process, see odbot.models.process
+OUT_OF_PROCESS = os.environ.get("ODBOT_INFERENCE_PROCESS", "0") == "1"
+
+
+def create_model(backend: str = DEFAULT_BACKEND,
+                 version: str = DEFAULT_VERSION,
+                 out_of_process: bool = False) -> BaseModel:
+	if backend not in BACKENDS:
+		raise ValueError(f"Unknown object detection backend {backend}, choose from {list(BACKENDS)}")
+	if out_of_process:
+		from odbot.models.process import ProcessModel
+
+		# One worker per backend, kept running like the in-process models
+		return cache.get_or_load(('process', backend, version), lambda: ProcessModel(backend, version))
+	module, name, kwargs = BACKENDS[backend]
+	model_class = getattr(importlib.import_module(module), name)
+	return model_class(version=version, **kwargs)
@@ -0,0 +1,66 @@
+import ast
+import logging
+import os
+
+import numpy as np
+import onnxruntime as ort
+
+from odbot.models import cache
+from odbot.models.base import BaseModel
+from odbot.models.common import COCO_NAMES, Letterbox, postprocess
+from odbot.utils import resource_path
+
+log = logging.getLogger(__name__)
+
+
+def quantize(version: str) -> str:
+	"""Creates weights/<version>-int8.onnx from the float model with dynamic INT8 quantization"""
+	from onnxruntime.quantization import QuantType, quantize_dynamic
+
+	src = resource_path(f"weights/{version}.onnx")
+	dst = resource_path(f"weights/{version}-int8.onnx")
+	log.info(f"Quantizing {src} to {dst}")
+	quantize_dynamic(src, dst, weight_type=QuantType.QUInt8)
+	return dst
+
+
+def _load(version: str, int8: bool):
+	path = resource_path(f"weights/{version}-int8.onnx" if int8 else f"weights/{version}.onnx")
+	if int8 and not os.path.isfile(path):
+		path = quantize(version)
+
+	options = ort.SessionOptions()
+	options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+	return ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+
+
+class OnnxYoloV5Model(BaseModel):
+	"""YOLOv5 exported with `export.py --include onnx`, run on the ONNX Runtime CPU provider"""
+
+	def __init__(self, version='yolov5s', int8: bool = False, img_size: int = 640) -> None:
+		session = cache.get_or_load(('onnxruntime', version, int8), lambda: _load(version, int8))
+		names = session.get_modelmeta().custom_metadata_map.get('names')
+		super().__init__(session, ast.literal_eval(names) if names else COCO_NAMES)
+
+		model_input = session.get_inputs()[0]
+		self.input_name = model_input.name
+		# Exported with --dynamic the height and width are named dimensions instead of numbers
+		self.dynamic_img_size = not isinstance(model_input.shape[-1], int)
+		self.img_size = img_size if self.dynamic_img_size else model_input.shape[-1]
+		self._inputs = {}
+		self.set_img_size(self.img_size)
+
+	def set_img_size(self, size: int):
+		if size != self.img_size:
+			super().set_img_size(size)
+		# Letterbox canvas and input blob per size, as the scheduler switches between a few sizes
+		if size not in self._inputs:
+			self._inputs[size] = Letterbox(size), np.empty((1, 3, size, size), dtype=np.float32)
+		self.letterbox, self.blob = self._inputs[size]
+
+	def get_predictions(self, img):
+		canvas, ratio, pad = self.letterbox(img)
+		# BGR HWC uint8 -> RGB CHW float32, written into the reused input blob
+		np.multiply(canvas[..., ::-1].transpose(2, 0, 1), 1 / 255, out=self.blob[0], casting='unsafe')
+		output = self.model.run(None, {self.input_name: self.blob})[0]
+		return postprocess(output, ratio, pad, img.shape)
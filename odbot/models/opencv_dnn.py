@@ -0,0 +1,39 @@
+import logging
+import threading
+
+import cv2
+
+from odbot.models import cache
+from odbot.models.base import BaseModel
+from odbot.models.common import COCO_NAMES, Letterbox, postprocess
+from odbot.utils import resource_path
+
+log = logging.getLogger(__name__)
+
+# cv2.dnn.Net is not thread safe, and the cached net is shared between instances
+_forward_lock = threading.Lock()
+
+
+def _load(version: str):
+	net = cv2.dnn.readNetFromONNX(resource_path(f"weights/{version}.onnx"))
+	net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+	net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+	return net
+
+
+class OpenCvDnnYoloV5Model(BaseModel):
+	"""YOLOv5 ONNX export run through cv2.dnn, so no extra runtime is needed"""
+
+	def __init__(self, version='yolov5s', img_size: int = 640) -> None:
+		net = cache.get_or_load(('opencv', version), lambda: _load(version))
+		super().__init__(net, COCO_NAMES)
+		self.img_size = img_size
+		self.letterbox = Letterbox(img_size)
+
+	def get_predictions(self, img):
+		canvas, ratio, pad = self.letterbox(img)
+		blob = cv2.dnn.blobFromImage(canvas, 1 / 255, swapRB=True)
+		with _forward_lock:
+			self.model.setInput(blob)
+			output = self.model.forward()
+		return postprocess(output, ratio, pad, img.shape)
@@ -0,0 +1,251 @@
+"""Runs a detection backend in a separate worker process.
+
+Pre- and post-processing of the backends is Python code holding the GIL, which the GUI and the control loop then
+wait for. ProcessModel is a BaseModel that copies each image into a ring of shared memory frame slots, sends the
+worker a short request over a pipe, and gets back (N, 6) float32 prediction arrays. While it waits it only polls the
+pipe, so the GUI process keeps running at full speed however slow or stuck the model is.
+
+A worker that dies or does not answer within REQUEST_TIMEOUT_S is killed and started again, with growing back-off.
+Until the new one has loaded its model, images get empty predictions.
+"""
+import atexit
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from odbot.metrics import METRICS
+from odbot.models.base import BaseModel
+
+log = logging.getLogger(__name__)
+
+WORKER_RESTARTS = METRICS.counter("odbot_inference_worker_restarts_total", "Inference worker processes restarted")
+
+# Qt and torch threads do not survive a fork, so the worker starts from a fresh interpreter
+_context = multiprocessing.get_context('spawn')
+
+
+def _empty() -> np.ndarray:
+	return np.zeros((0, 6), dtype=np.float32)
+
+
+def _as_array(predictions) -> np.ndarray:
+	if predictions is None:
+		return _empty()
+	if hasattr(predictions, "cpu"):
+		predictions = predictions.cpu().numpy()
+	return np.ascontiguousarray(predictions, dtype=np.float32).reshape(-1, 6)
+
+
+def _serve(conn, backend: str, version: str, log_level: int):
+	"""Worker process main loop. Answers ("detect", ring name, [(offset, shape)], img_size) requests until the pipe
+	closes or a ("close",) request arrives"""
+	logging.basicConfig(level=log_level)
+	# Ctrl+C in the terminal is for the GUI process, which shuts the worker down itself
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	from odbot.models.factory import create_model
+
+	try:
+		model = create_model(backend, version)
+		model.get_predictions(np.zeros((model.img_size, model.img_size, 3), dtype=np.uint8))
+	except Exception as e:
+		conn.send(("error", f"{type(e).__name__}: {e}"))
+		return
+	conn.send(("ready", model.names, model.img_size, model.dynamic_img_size))
+
+	ring = None
+	while True:
+		try:
+			request = conn.recv()
+		except EOFError:
+			break
+		if request[0] == "close":
+			break
+
+		_, name, frames, img_size = request
+		if ring is None or ring.name != name:
+			if ring is not None:
+				ring.close()
+			# A spawned worker shares the GUI process' resource tracker, so attaching does not make it an owner
+			ring = shared_memory.SharedMemory(name=name)
+		if model.dynamic_img_size and img_size != model.img_size:
+			model.set_img_size(img_size)
+
+		results = []
+		for offset, shape in frames:
+			img = np.ndarray(shape, dtype=np.uint8, buffer=ring.buf, offset=offset)
+			results.append(_as_array(model.get_predictions(img)))
+			del img  # The ring can only be closed once no array points into it
+		conn.send(("ok", results))
+
+	if ring is not None:
+		ring.close()
+
+
+class ProcessModel(BaseModel):
+	"""A backend from odbot.models.factory running in a worker process, see the module docstring"""
+
+	SLOTS = 4
+	SLOT_BYTES = 1920 * 1080 * 3  # Grows on the first larger image
+	LOAD_TIMEOUT_S = 120.0
+	REQUEST_TIMEOUT_S = 5.0
+	POLL_INTERVAL_S = 0.05
+	RESTART_MIN_S = 1.0
+	RESTART_MAX_S = 30.0
+
+	def __init__(self, backend: str, version: str = 'yolov5s') -> None:
+		super().__init__(None, {})
+		self.backend = backend
+		self.version = version
+		self.restarts = 0
+		self._lock = threading.Lock()
+		self._closed = False
+		self._ring = None
+		self._slot_bytes = 0
+		self._next_slot = 0
+		self._process = None
+		self._conn = None
+		self._ready = False
+		self._backoff = 0.0
+		self._restart_at = 0.0
+
+		self._allocate(self.SLOT_BYTES)
+		self._start()
+		deadline = time.monotonic() + self.LOAD_TIMEOUT_S
+		while not self._ready:
+			if not self._poll_ready() or time.monotonic() > deadline:
+				error = self._load_error or f"worker did not load the model within {self.LOAD_TIMEOUT_S:.0f}s"
+				self.close()
+				raise RuntimeError(f"Inference worker for {backend} failed: {error}")
+			time.sleep(self.POLL_INTERVAL_S)
+		atexit.register(self.close)
+
+	def _allocate(self, slot_bytes: int):
+		if self._ring is not None:
+			# The worker keeps its own mapping until it attaches to the new ring
+			self._ring.close()
+			self._ring.unlink()
+		self._ring = shared_memory.SharedMemory(create=True, size=self.SLOTS * slot_bytes)
+		self._slot_bytes = slot_bytes
+		log.debug(f"Allocated {self.SLOTS} inference frame slots of {slot_bytes} bytes in {self._ring.name}")
+
+	def _start(self):
+		self._conn, child_conn = _context.Pipe()
+		self._process = _context.Process(target=_serve,
+		                                 args=(child_conn, self.backend, self.version, logging.getLogger().level),
+		                                 name=f"inference-{self.backend}",
+		                                 daemon=True)
+		self._process.start()
+		child_conn.close()
+		self._ready = False
+		self._load_error = None
+		log.info(f"Started inference worker {self._process.pid} for {self.backend}")
+
+	def _stop_worker(self):
+		if self._process is None:
+			return
+		if self._process.is_alive():
+			self._process.kill()
+		self._process.join(timeout=1.0)
+		self._conn.close()
+		self._process = None
+		self._ready = False
+
+	def _fail(self, reason: str):
+		"""Kills the worker and schedules a new one"""
+		self._backoff = min(max(self._backoff * 2, self.RESTART_MIN_S), self.RESTART_MAX_S)
+		self._restart_at = time.monotonic() + self._backoff
+		log.error(f"Inference worker for {self.backend} {reason}, restarting in {self._backoff:.0f}s")
+		self._stop_worker()
+
+	def _poll_ready(self) -> bool:
+		"""Reads the worker's load result if it has arrived. False when the worker failed or died"""
+		try:
+			if not self._conn.poll():
+				return self._process.is_alive()
+			message = self._conn.recv()
+		except (EOFError, OSError):
+			return False
+		if message[0] == "error":
+			self._load_error = message[1]
+			return False
+		_, self.names, self.img_size, self.dynamic_img_size = message
+		self._ready = True
+		return True
+
+	def _available(self) -> bool:
+		"""Whether a loaded worker is waiting for requests, restarting it when it is due"""
+		if self._process is None:
+			if self._closed or time.monotonic() < self._restart_at:
+				return False
+			self.restarts += 1
+			WORKER_RESTARTS.inc()
+			self._start()
+		if not self._ready and not self._poll_ready():
+			self._fail(f"failed to load: {self._load_error}" if self._load_error else "exited while loading")
+		return self._ready
+
+	def _write(self, img: np.ndarray):
+		if img.dtype != np.uint8:
+			raise ValueError(f"Expected an uint8 image, got {img.dtype}")
+		offset = self._next_slot * self._slot_bytes
+		self._next_slot = (self._next_slot + 1) % self.SLOTS
+		# Also copies crops, which are not contiguous, into the slot
+		np.ndarray(img.shape, dtype=np.uint8, buffer=self._ring.buf, offset=offset)[...] = img
+		return offset, img.shape
+
+	def _request(self, imgs: list) -> list:
+		largest = max(img.nbytes for img in imgs)
+		if largest > self._slot_bytes:
+			self._allocate(largest)
+		frames = [self._write(img) for img in imgs]
+		try:
+			self._conn.send(("detect", self._ring.name, frames, self.img_size))
+			deadline = time.monotonic() + self.REQUEST_TIMEOUT_S
+			while not self._conn.poll(self.POLL_INTERVAL_S):
+				if not self._process.is_alive():
+					self._fail(f"died with exit code {self._process.exitcode}")
+					return [_empty() for _ in imgs]
+				if time.monotonic() > deadline or self._closed:
+					self._fail(f"did not answer within {self.REQUEST_TIMEOUT_S:.0f}s")
+					return [_empty() for _ in imgs]
+			_, results = self._conn.recv()
+		except (EOFError, OSError):
+			self._process.join(timeout=1.0)
+			self._fail(f"closed its connection, exit code {self._process.exitcode}")
+			return [_empty() for _ in imgs]
+		self._backoff = 0.0
+		return results
+
+	def get_predictions(self, img):
+		return self.get_batch_predictions([img])[0]
+
+	def get_batch_predictions(self, imgs: list) -> list:
+		with self._lock:
+			if not self._available():
+				return [_empty() for _ in imgs]
+			results = []
+			for start in range(0, len(imgs), self.SLOTS):
+				chunk = imgs[start:start + self.SLOTS]
+				results.extend(self._request(chunk) if self._ready else [_empty() for _ in chunk])
+			return results
+
+	def close(self):
+		"""Stops the worker and frees the frame slots"""
+		self._closed = True
+		with self._lock:
+			if self._process is not None and self._process.is_alive():
+				try:
+					self._conn.send(("close", ))
+					self._process.join(timeout=1.0)
+				except OSError:
+					pass
+			self._stop_worker()
+			if self._ring is not None:
+				self._ring.close()
+				self._ring.unlink()
+				self._ring = None
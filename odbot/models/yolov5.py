@@ -1,20 +1,50 @@
-from odbot.models.base import BaseModel
+import logging
+import os
+
 import torch
 
+from odbot.models import cache
+from odbot.models.base import BaseModel
 from odbot.utils import resource_path
 
+log = logging.getLogger(__name__)
+
+YOLOV5_REPO = 'ultralytics/yolov5'
+YOLOV5_VENDORED_DIR = resource_path("yolov5")
+
+
+def _hub_source():
+	"""Prefers a vendored yolov5 checkout, then the torch.hub cache, and only then the network"""
+	if os.path.isdir(YOLOV5_VENDORED_DIR):
+		return YOLOV5_VENDORED_DIR, 'local'
+
+	cached = os.path.join(torch.hub.get_dir(), 'ultralytics_yolov5_master')
+	if os.path.isdir(cached):
+		return cached, 'local'
+
+	return YOLOV5_REPO, 'github'
+
+
+def _load(version: str):
+	repo, source = _hub_source()
+	log.debug(f"Loading {version} from {source} hub source {repo}")
+	return torch.hub.load(repo, 'custom', path=resource_path(f"weights/{version}.pt"), source=source, trust_repo=True)
+
 
 class YoloV5Model(BaseModel):
+
+	# AutoShape letterboxes to any size it is called with
+	dynamic_img_size = True
+
 	def __init__(self, version='yolov5s') -> None:
-		model = torch.hub.load(
-			'ultralytics/yolov5',
-			'custom',
-			path=resource_path(f"weights/{version}.pt"),
-			trust_repo=True,
-			force_reload=True
-		)
+		model = cache.get_or_load(('yolov5', version), lambda: _load(version))
 		super().__init__(model, model.names)
 
 	def get_predictions(self, img):
-		preds = self.model(img)
+		preds = self.model(img, size=self.img_size)
 		return preds.xyxy[0]
+
+	def get_batch_predictions(self, imgs: list) -> list:
+		# The hub AutoShape wrapper letterboxes a list of images into one batched forward pass
+		preds = self.model(list(imgs), size=self.img_size)
+		return list(preds.xyxy)
@@ -0,0 +1,234 @@
+import logging
+import threading
+import time
+import urllib.request
+from typing import List, Optional, Union
+
+import cv2
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+NETWORK_SCHEMES = ("http://", "https://", "rtsp://", "rtmp://", "udp://", "tcp://")
+
+
+def is_network_source(device: Union[int, str]) -> bool:
+    return isinstance(device, str) and device.lower().startswith(NETWORK_SCHEMES)
+
+
+class LowLatencyCapture:
+    """cv2.VideoCapture wrapper for network streams that always returns the newest frame.
+
+    The internal buffer is shrunk to one frame, and frames that were already queued are dropped by grabbing until a
+    grab actually has to wait for the network, then only that last frame is decoded.
+    """
+
+    STALE_GRAB_S = 0.005  # A grab returning faster than this came out of a buffer rather than off the wire
+    MAX_DRAIN = 30
+
+    def __init__(self, device: str):
+        self.cap = cv2.VideoCapture(device, cv2.CAP_FFMPEG)
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.dropped = 0
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def grab(self):
+        return self.cap.grab()
+
+    def read(self, image: Optional[np.ndarray] = None):
+        for _ in range(self.MAX_DRAIN):
+            start = time.monotonic()
+            if not self.cap.grab():
+                return False, None
+            if time.monotonic() - start >= self.STALE_GRAB_S:
+                break
+            self.dropped += 1
+        return self.cap.retrieve() if image is None else self.cap.retrieve(image)
+
+    def set(self, prop: int, value: float):
+        return self.cap.set(prop, value)
+
+    def release(self):
+        self.cap.release()
+
+
+class MjpegParser:
+    """Splits a multipart MJPEG byte stream into JPEGs.
+
+    Each part is cut by the Content-Length of its headers. Only parts without one fall back to searching for the JPEG
+    start and end markers, which takes the end marker of an embedded EXIF thumbnail for the end of the image.
+    """
+
+    MAX_PENDING = 8 * 1024 * 1024  # Drop the buffer if no complete JPEG shows up within this many bytes
+    MAX_HEADER_BYTES = 4096  # Without a blank line this early, the data is not part headers
+    HEADER_END = b"\r\n\r\n"
+    JPEG_START = b"\xff\xd8"
+    JPEG_END = b"\xff\xd9"
+
+    def __init__(self):
+        self._data = b""
+        self._length = None  # Body size of the current part, once its headers are read
+
+    @staticmethod
+    def _content_length(headers: bytes) -> Optional[int]:
+        for line in headers.split(b"\r\n"):
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"content-length":
+                try:
+                    return int(value)
+                except ValueError:
+                    return None
+        return None
+
+    def _split_markers(self) -> Optional[bytes]:
+        """Takes the newest complete JPEG out of the buffer by its markers"""
+        end = self._data.rfind(self.JPEG_END)
+        if end < 0:
+            if len(self._data) > self.MAX_PENDING:
+                self._data = b""
+            return None
+        start = self._data.rfind(self.JPEG_START, 0, end)
+        jpeg = self._data[start:end + 2] if start >= 0 else None
+        self._data = self._data[end + 2:]
+        return jpeg
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """Adds received bytes and returns the JPEGs they completed, oldest first"""
+        self._data += chunk
+        jpegs = []
+        while True:
+            if self._length is None:
+                # Servers differ in the line breaks between a body and the next boundary
+                self._data = self._data.lstrip(b"\r\n")
+                header_end = self._data.find(self.HEADER_END, 0, self.MAX_HEADER_BYTES)
+                if header_end < 0 and len(self._data) < self.MAX_HEADER_BYTES:
+                    return jpegs
+                length = None if header_end < 0 else self._content_length(self._data[:header_end])
+                if length is None or length > self.MAX_PENDING:
+                    jpeg = self._split_markers()
+                    if jpeg is not None:
+                        jpegs.append(jpeg)
+                    return jpegs
+                self._data = self._data[header_end + len(self.HEADER_END):]
+                self._length = length
+
+            if len(self._data) < self._length:
+                return jpegs
+            jpegs.append(self._data[:self._length])
+            self._data = self._data[self._length:]
+            self._length = None
+
+
+class MjpegCapture:
+    """Reads an HTTP multipart MJPEG stream (e.g. a phone IP camera) on its own thread.
+
+    The reader thread only keeps the most recent complete JPEG; read() decodes that one, so frames that arrive while
+    the consumer is busy are skipped rather than buffered.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    TIMEOUT_S = 5.0
+
+    def __init__(self, url: str):
+        self.url = url
+        self._cond = threading.Condition()
+        self._jpeg = None
+        self._grabbed = None
+        self._seq = 0
+        self._read_seq = 0
+        self._running = True
+        self.dropped = 0
+        self.is_mjpeg = False
+
+        try:
+            self._response = urllib.request.urlopen(url, timeout=self.TIMEOUT_S)
+        except OSError as e:
+            log.error(f"Could not open MJPEG stream {url}: {e}")
+            self._response = None
+            self._running = False
+            return
+
+        self.is_mjpeg = self._response.headers.get_content_type().startswith("multipart/")
+        if not self.is_mjpeg:
+            self.release()
+            return
+
+        self._thread = threading.Thread(target=self._reader, name="mjpeg-reader", daemon=True)
+        self._thread.start()
+
+    def _reader(self):
+        parser = MjpegParser()
+        try:
+            while self._running:
+                chunk = self._response.read1(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                jpegs = parser.feed(chunk)
+                if not jpegs:
+                    continue
+
+                # Keep only the newest complete JPEG in the chunk
+                with self._cond:
+                    self.dropped += len(jpegs) - 1 + (self._seq > self._read_seq)
+                    self._jpeg = jpegs[-1]
+                    self._seq += 1
+                    self._cond.notify_all()
+        except OSError as e:
+            log.warning(f"MJPEG stream {self.url} failed: {e}")
+        finally:
+            with self._cond:
+                self._running = False
+                self._cond.notify_all()
+
+    def isOpened(self):
+        return self._running
+
+    def grab(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > self._read_seq or not self._running, self.TIMEOUT_S)
+            if self._seq <= self._read_seq:
+                return False
+            self._read_seq = self._seq
+            self._grabbed = self._jpeg
+            return True
+
+    def read(self, image: Optional[np.ndarray] = None):
+        if not self.grab():
+            return False, None
+        img = cv2.imdecode(np.frombuffer(self._grabbed, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            return False, None
+        if image is not None and image.shape == img.shape:
+            np.copyto(image, img)
+            return True, image
+        return True, img
+
+    def set(self, prop: int, value: float):
+        return False
+
+    def release(self):
+        self._running = False
+        if self._response is not None:
+            self._response.close()
+
+
+def open_capture(device: Union[int, str]):
+    """Opens a capture for device, using the low-latency readers for network sources.
+
+    An object that already behaves like a capture, e.g. a replay source, is used as is.
+    """
+    if hasattr(device, "read"):
+        return device
+    if not is_network_source(device):
+        return cv2.VideoCapture(device)
+
+    if device.lower().startswith(("http://", "https://")):
+        cap = MjpegCapture(device)
+        if cap.is_mjpeg:
+            log.debug(f"Opened {device} as MJPEG stream")
+            return cap
+
+    log.debug(f"Opening {device} as low-latency network stream")
+    return LowLatencyCapture(device)
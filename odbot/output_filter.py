@@ -0,0 +1,78 @@
+import logging
+import time
+from typing import Dict, Iterable
+
+log = logging.getLogger(__name__)
+
+
+class ActuatorFilter:
+    """Decides whether a new actuator value is worth sending.
+
+    A value is sent when it differs from the last sent one by more than deadband and at least min_interval_s has
+    passed since the last send. Values in exact_values (e.g. a stop command) bypass the deadband. After keepalive_s
+    without a send the current value is always refreshed, so suppressed small changes still land eventually.
+    """
+
+    def __init__(self,
+                 name: str,
+                 deadband: float = 0,
+                 min_interval_s: float = 0,
+                 keepalive_s: float = 1.0,
+                 exact_values: Iterable[float] = (),
+                 clock=time.monotonic):
+        self.name = name
+        self.deadband = deadband
+        self.min_interval_s = min_interval_s
+        self.keepalive_s = keepalive_s
+        self.exact_values = set(exact_values)
+        self.clock = clock
+
+        self.last_value = None
+        self.last_sent = 0.0
+        self.sent = 0
+        self.suppressed = 0
+
+    def update(self, value: float) -> bool:
+        now = self.clock()
+        elapsed = now - self.last_sent
+        if self.last_value is None or elapsed >= self.keepalive_s:
+            send = True
+        elif value == self.last_value or elapsed < self.min_interval_s:
+            send = False
+        else:
+            send = abs(value - self.last_value) > self.deadband or value in self.exact_values
+
+        if send:
+            self.last_value, self.last_sent = value, now
+            self.sent += 1
+        else:
+            self.suppressed += 1
+        return send
+
+    def reset(self):
+        """Forces the next update to be sent"""
+        self.last_value = None
+
+
+class OutputFilter:
+    """A set of named ActuatorFilters with combined redundant-command reporting"""
+
+    def __init__(self, *filters: ActuatorFilter):
+        self.filters: Dict[str, ActuatorFilter] = {f.name: f for f in filters}
+
+    def __getitem__(self, name: str) -> ActuatorFilter:
+        return self.filters[name]
+
+    def update(self, name: str, value: float) -> bool:
+        return self.filters[name].update(value)
+
+    def reset(self):
+        for f in self.filters.values():
+            f.reset()
+
+    def stats(self) -> dict:
+        stats = {name: {"sent": f.sent, "suppressed": f.suppressed} for name, f in self.filters.items()}
+        sent = sum(f.sent for f in self.filters.values())
+        suppressed = sum(f.suppressed for f in self.filters.values())
+        stats["suppressed_ratio"] = suppressed / (sent + suppressed) if sent + suppressed else 0.0
+        return stats
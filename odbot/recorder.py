@@ -0,0 +1,351 @@
+import json
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+from typing import Iterator, NamedTuple, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from odbot.batch_scheduler import FrameDetections
+from odbot.frame_buffer import FrameBuffer
+from odbot.input_thread import InputState
+
+log = logging.getLogger(__name__)
+
+# File layout: MAGIC, then chunks of CHUNK header + payload, appended in arrival order. A clean close appends an INDEX
+# chunk and a TRAILER pointing at it. A file without a trailer, e.g. after a crash, is indexed by scanning the chunks.
+MAGIC = b"ODREC01\n"
+INDEX_MAGIC = b"ODRECIDX"
+CHUNK = struct.Struct("<4sdI")  # Kind, monotonic timestamp, payload size
+TRAILER = struct.Struct("<Q8s")  # Offset of the index chunk, INDEX_MAGIC
+
+META = b"META"
+FRAME = b"FRAM"
+DETECTIONS = b"DETS"
+INPUT = b"INPT"
+COMMAND = b"CMND"
+INDEX = b"INDX"
+
+FRAME_HEADER = struct.Struct("<Qi")  # Frame seq, mp4 sidecar frame number or -1 if the payload is a JPEG
+DETECTIONS_HEADER = struct.Struct("<Q")  # Seq of the frame the detections belong to
+INPUT_HEADER = struct.Struct("<QHHH")  # Input seq, number of axes, buttons and hats
+COMMAND_PAYLOAD = struct.Struct("<8sd")  # Actuator name, value
+
+INDEX_DTYPE = np.dtype([("kind", "S4"), ("timestamp", "<f8"), ("offset", "<u8")])
+
+
+class Record(NamedTuple):
+    kind: bytes
+    timestamp: float
+    data: object
+
+
+def _detections_array(predictions) -> np.ndarray:
+    if predictions is None:
+        return np.zeros((0, 6), dtype=np.float32)
+    if hasattr(predictions, "cpu"):
+        predictions = predictions.cpu().numpy()
+    return np.asarray(predictions, dtype=np.float32).reshape(-1, 6)
+
+
+def encode_input(state: InputState) -> bytes:
+    return (INPUT_HEADER.pack(state.seq, len(state.axes), len(state.buttons), len(state.hats)) +
+            np.asarray(state.axes, dtype=np.float32).tobytes() + np.asarray(state.buttons, dtype=np.uint8).tobytes() +
+            np.asarray(state.hats, dtype=np.int8).reshape(-1).tobytes())
+
+
+def decode_input(timestamp: float, payload: bytes) -> InputState:
+    seq, n_axes, n_buttons, n_hats = INPUT_HEADER.unpack_from(payload)
+    offset = INPUT_HEADER.size
+    axes = np.frombuffer(payload, np.float32, n_axes, offset)
+    buttons = np.frombuffer(payload, np.uint8, n_buttons, offset + 4 * n_axes)
+    hats = np.frombuffer(payload, np.int8, 2 * n_hats, offset + 4 * n_axes + n_buttons).reshape(-1, 2)
+    return InputState(tuple(axes.tolist()), tuple(buttons.tolist()), tuple(map(tuple, hats.tolist())), timestamp, seq)
+
+
+class SessionRecorder:
+    """Records a driving session to a chunked, append-only file.
+
+    Callers only enqueue records, which never blocks. A background thread writes them out, and a second one encodes
+    frames from a FrameBuffer. When a bounded queue is full the record is dropped and counted instead of stalling the
+    capture, detection or control loop. Frames are stored as JPEG chunks, or with video="mp4" in a sidecar video file
+    with one chunk per frame pointing into it.
+    """
+
+    QUEUE_SIZE = 1024
+    MAX_PENDING_FRAMES = 16  # Bounds the memory held by encoded frames waiting for the writer
+    FLUSH_INTERVAL_S = 1.0
+    JPEG_QUALITY = 80
+    MP4_FPS = 30
+    SOURCE_WAIT_S = 0.5
+
+    def __init__(self, path: str, video: str = "jpeg", max_fps: float = 30, meta: Optional[dict] = None):
+        if video not in ("jpeg", "mp4"):
+            raise ValueError(f"Unknown video format {video}")
+        self.path = path
+        self.video = video
+        self.max_fps = max_fps
+        self.written = 0
+        self.dropped = {}
+
+        self._queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self._index = []
+        self._running = True
+        self._frame_source = None
+        self._source_attached = threading.Event()
+        self._mp4 = None
+        self._mp4_frames = 0
+        # Changed by the encoder and the writer thread
+        self._pending_frames = 0
+        self._pending_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+        self._offset = len(MAGIC)
+        self._put(META, json.dumps({"video": video, "created": time.time(), **(meta or {})}).encode())
+
+        self._writer = threading.Thread(target=self._write_loop, name="recorder", daemon=True)
+        self._writer.start()
+        self._encoder = None
+
+    @property
+    def mp4_path(self) -> str:
+        return os.path.splitext(self.path)[0] + ".mp4"
+
+    def _put(self, kind: bytes, payload, timestamp: Optional[float] = None) -> bool:
+        if not self._running:
+            return False
+        try:
+            self._queue.put_nowait((kind, time.monotonic() if timestamp is None else timestamp, payload))
+        except queue.Full:
+            self.dropped[kind.decode()] = self.dropped.get(kind.decode(), 0) + 1
+            return False
+        return True
+
+    def attach_frames(self, frame_buffer: FrameBuffer):
+        """Records new frames from frame_buffer, at most max_fps of them. Replaces the previous frame buffer, e.g. of a
+        video stream that was reconnected"""
+        self._frame_source = frame_buffer
+        self._source_attached.set()
+        if self._encoder is None or not self._encoder.is_alive():
+            self._encoder = threading.Thread(target=self._encode_loop, name="recorder-frames", daemon=True)
+            self._encoder.start()
+
+    def record_detections(self, detections: Sequence[FrameDetections]):
+        for entry in detections:
+            array = _detections_array(entry.predictions)
+            self._put(DETECTIONS, DETECTIONS_HEADER.pack(entry.seq) + array.tobytes(), entry.timestamp)
+
+    def record_input(self, state: InputState):
+        self._put(INPUT, encode_input(state), state.timestamp)
+
+    def record_command(self, name: str, value: float, timestamp: Optional[float] = None):
+        self._put(COMMAND, COMMAND_PAYLOAD.pack(name.encode()[:8], float(value)), timestamp)
+
+    def _encode_frame(self, seq: int, frame: np.ndarray) -> bytes:
+        if self.video == "jpeg":
+            _, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.JPEG_QUALITY])
+            return FRAME_HEADER.pack(seq, -1) + jpeg.tobytes()
+
+        if self._mp4 is None:
+            height, width = frame.shape[:2]
+            self._mp4 = cv2.VideoWriter(self.mp4_path, cv2.VideoWriter_fourcc(*"mp4v"), self.MP4_FPS, (width, height))
+        self._mp4.write(frame)
+        self._mp4_frames += 1
+        return FRAME_HEADER.pack(seq, self._mp4_frames - 1)
+
+    def _encode_loop(self):
+        source, last_seq = None, 0
+        while self._running:
+            start = time.monotonic()
+            if self._frame_source is not source:
+                # Sequence numbers start over in a new frame buffer
+                source, last_seq = self._frame_source, 0
+            if source.closed:
+                # Keep recording the session once a new video stream is attached
+                self._source_attached.wait(self.SOURCE_WAIT_S)
+                self._source_attached.clear()
+                continue
+            if source.wait(last_seq, timeout=self.SOURCE_WAIT_S) <= last_seq:
+                continue
+            with self._pending_lock:
+                pending = self._pending_frames
+            if pending >= self.MAX_PENDING_FRAMES:
+                self.dropped["FRAM"] = self.dropped.get("FRAM", 0) + 1
+                last_seq = source.seq
+                continue
+            # Read without marking the frame as seen, so the buffer's dropped count still reflects the display
+            with source.latest(mark_read=False) as (seq, stamp, frame):
+                if frame is None or seq <= last_seq:
+                    continue
+                payload = self._encode_frame(seq, frame)
+            last_seq = seq
+            if self._put(FRAME, payload, stamp):
+                with self._pending_lock:
+                    self._pending_frames += 1
+
+            remaining = 1.0 / self.max_fps - (time.monotonic() - start) if self.max_fps else 0
+            if remaining > 0:
+                time.sleep(remaining)
+
+    def _write(self, kind: bytes, timestamp: float, payload: bytes):
+        self._index.append((kind, timestamp, self._offset))
+        self._file.write(CHUNK.pack(kind, timestamp, len(payload)))
+        self._file.write(payload)
+        self._offset += CHUNK.size + len(payload)
+        self.written += 1
+
+    def _write_loop(self):
+        last_flush = time.monotonic()
+        while self._running or not self._queue.empty():
+            try:
+                kind, timestamp, payload = self._queue.get(timeout=self.FLUSH_INTERVAL_S)
+                self._write(kind, timestamp, payload)
+                if kind == FRAME:
+                    with self._pending_lock:
+                        self._pending_frames -= 1
+            except queue.Empty:
+                pass
+            # Flush regularly so a crash loses at most about a second
+            if time.monotonic() - last_flush > self.FLUSH_INTERVAL_S:
+                self._file.flush()
+                last_flush = time.monotonic()
+
+    def stats(self) -> dict:
+        return {"written": self.written, "dropped": dict(self.dropped), "bytes": self._offset}
+
+    def stop(self):
+        """Writes out everything queued, appends the index and closes the file"""
+        if not self._running:
+            return
+        self._running = False
+        self._source_attached.set()
+        if self._encoder is not None:
+            self._encoder.join()
+        self._writer.join()
+        if self._mp4 is not None:
+            self._mp4.release()
+
+        index = np.array(self._index, dtype=INDEX_DTYPE)
+        index_offset = self._offset
+        self._write(INDEX, time.monotonic(), index.tobytes())
+        self._file.write(TRAILER.pack(index_offset, INDEX_MAGIC))
+        self._file.close()
+        log.info(f"Recorded {self.written} chunks to {self.path}, dropped {self.dropped}")
+
+
+class SessionReader:
+    """Random access to a recording through its timestamp-sorted index.
+
+    Files that were not closed cleanly have no index and are scanned once on open instead.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        if self._file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a session recording")
+        self.index = self._read_index()
+        self.meta = {}
+        for record in self.records([META]):
+            self.meta.update(record.data)
+        self._mp4 = None
+        self._mp4_position = -1
+
+    def _read_index(self) -> np.ndarray:
+        size = os.fstat(self._file.fileno()).st_size
+        if size >= len(MAGIC) + TRAILER.size:
+            self._file.seek(size - TRAILER.size)
+            index_offset, magic = TRAILER.unpack(self._file.read(TRAILER.size))
+            if magic == INDEX_MAGIC:
+                kind, _, length = self._read_header(index_offset)
+                return self._sorted(np.frombuffer(self._file.read(length), INDEX_DTYPE))
+
+        log.warning(f"{self.path} has no index, scanning it")
+        entries, offset = [], len(MAGIC)
+        while offset + CHUNK.size <= size:
+            kind, timestamp, length = self._read_header(offset)
+            if offset + CHUNK.size + length > size:
+                break  # Truncated last chunk
+            if kind != INDEX:
+                entries.append((kind, timestamp, offset))
+            offset += CHUNK.size + length
+        return self._sorted(np.array(entries, dtype=INDEX_DTYPE))
+
+    @staticmethod
+    def _sorted(index: np.ndarray) -> np.ndarray:
+        # Chunks are written in arrival order, frames for example arrive after their capture timestamp
+        return index[np.argsort(index["timestamp"], kind="stable")]
+
+    def _read_header(self, offset: int):
+        self._file.seek(offset)
+        return CHUNK.unpack(self._file.read(CHUNK.size))
+
+    def _decode(self, kind: bytes, timestamp: float, payload: bytes):
+        if kind == META:
+            return json.loads(payload)
+        if kind == FRAME:
+            seq, mp4_frame = FRAME_HEADER.unpack_from(payload)
+            if mp4_frame < 0:
+                jpeg = np.frombuffer(payload, np.uint8, offset=FRAME_HEADER.size)
+                return seq, cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+            return seq, self._read_mp4_frame(mp4_frame)
+        if kind == DETECTIONS:
+            (seq, ) = DETECTIONS_HEADER.unpack_from(payload)
+            return seq, np.frombuffer(payload, np.float32, offset=DETECTIONS_HEADER.size).reshape(-1, 6)
+        if kind == INPUT:
+            return decode_input(timestamp, payload)
+        if kind == COMMAND:
+            name, value = COMMAND_PAYLOAD.unpack(payload)
+            return name.rstrip(b"\0").decode(), value
+        return payload
+
+    def _read_mp4_frame(self, number: int) -> Optional[np.ndarray]:
+        if self._mp4 is None:
+            self._mp4 = cv2.VideoCapture(os.path.splitext(self.path)[0] + ".mp4")
+        if number != self._mp4_position + 1:
+            self._mp4.set(cv2.CAP_PROP_POS_FRAMES, number)
+        ok, frame = self._mp4.read()
+        self._mp4_position = number
+        return frame if ok else None
+
+    def read(self, position: int) -> Record:
+        """Reads the record at position in the index"""
+        kind, timestamp, offset = self.index[position]
+        timestamp = float(timestamp)
+        _, _, length = self._read_header(int(offset))
+        return Record(kind, timestamp, self._decode(kind, timestamp, self._file.read(length)))
+
+    def seek(self, timestamp: float) -> int:
+        """Returns the index position of the first record at or after timestamp"""
+        return int(np.searchsorted(self.index["timestamp"], timestamp))
+
+    def records(self,
+                kinds: Optional[Sequence[bytes]] = None,
+                start: Optional[float] = None,
+                end: Optional[float] = None) -> Iterator[Record]:
+        """Yields records of the given kinds between start and end, in timestamp order"""
+        positions = np.arange(len(self.index))
+        mask = np.ones(len(self.index), dtype=bool)
+        if kinds is not None:
+            mask &= np.isin(self.index["kind"], np.array(kinds, dtype="S4"))
+        if start is not None:
+            mask &= self.index["timestamp"] >= start
+        if end is not None:
+            mask &= self.index["timestamp"] <= end
+        for position in positions[mask]:
+            yield self.read(position)
+
+    def duration(self) -> float:
+        timestamps = self.index["timestamp"]
+        return float(timestamps[-1] - timestamps[0]) if len(timestamps) else 0.0
+
+    def close(self):
+        if self._mp4 is not None:
+            self._mp4.release()
+        self._file.close()
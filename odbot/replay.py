@@ -0,0 +1,546 @@
+"""Replays a recorded session, or a video file plus a scripted controller trace, through the real pipeline.
+
+Frames go through VideoWorker into a FrameBuffer and, optionally, OdThread. Controller input goes through the
+ControlWorker input handling, output filter and control loop ticks, to an AsyncBot on a FakeHub. Controller events
+take the same two paths as live input: every change reaches the immediate input handler, and the control loop's input
+stage sees the button and device events, so e.g. a removed controller stops the control. The commands and
+detections that come out are collected into a trace.
+
+With fast pacing the replay runs on a virtual clock as fast as the pipeline allows, in lockstep: every frame is
+detected before the replay moves on. The trace is then reproducible, and its digest can be checked in CI. Real-time
+pacing plays the session at recorded speed, which shows how the pipeline keeps up but is not reproducible.
+
+    python -m odbot.replay session.odrec --backend recorded --runs 2 --trace trace.json
+    python -m odbot.replay drive.mp4 --controller steps.json --expect baseline.json
+"""
+import argparse
+import hashlib
+import json
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+import pygame
+from PySide6.QtCore import QCoreApplication, Qt
+
+from odbot.calibration import calculate_steering_middle
+from odbot.control_worker import ControlWorker
+from odbot.fake_hub import FakeHub
+from odbot.frame_buffer import FrameBuffer
+from odbot.hub_pool import HUB_POOL
+from odbot.input_thread import InputEvent, InputState, ScriptedJoystickSource, apply_event
+from odbot.models.base import BaseModel
+from odbot.models.common import COCO_NAMES
+from odbot.recorder import DETECTIONS, FRAME, INPUT, SessionReader
+from odbot.video_stream import OdThread, VideoWorker
+
+log = logging.getLogger(__name__)
+
+RECORDED_BACKEND = "recorded"
+FAST = "fast"
+REALTIME = "realtime"
+
+# Neutral state of the Xbox controller the scripted traces are written for
+DEFAULT_AXES = 6
+DEFAULT_BUTTONS = 10
+DEFAULT_HATS = 1
+
+
+class VirtualClock:
+    """Time that only moves when slept, so the control loop runs as fast as possible and reproducibly"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += max(seconds, 0.0)
+
+
+class RealClock:
+    """Seconds since the replay started"""
+
+    def __init__(self):
+        self._start = time.perf_counter()
+
+    def __call__(self) -> float:
+        return time.perf_counter() - self._start
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class ReplayFrame(NamedTuple):
+    time: float  # Seconds since the start of the session
+    seq: int  # Frame number in the source
+    frame: np.ndarray
+
+
+def neutral_state(num_axes: int = DEFAULT_AXES, num_buttons: int = DEFAULT_BUTTONS, num_hats: int = DEFAULT_HATS):
+    return ScriptedJoystickSource([], num_axes, num_buttons, num_hats).initial_state()
+
+
+def state_events(previous: InputState, state: InputState) -> List[pygame.event.Event]:
+    """The joystick events that turn the previous snapshot into state"""
+    steps = [ScriptedJoystickSource.axis(0.0, axis, float(value))
+             for axis, (old, value) in enumerate(zip(previous.axes, state.axes)) if old != value]
+    steps += [ScriptedJoystickSource.button(0.0, button, bool(pressed))
+              for button, (old, pressed) in enumerate(zip(previous.buttons, state.buttons)) if old != pressed]
+    steps += [ScriptedJoystickSource.hat(0.0, hat, tuple(value))
+              for hat, (old, value) in enumerate(zip(previous.hats, state.hats)) if tuple(old) != tuple(value)]
+    return [pygame.event.Event(event_type, attributes) for _, event_type, attributes in steps]
+
+
+class ReplaySource:
+    """Frames, controller events and optionally recorded detections, with times relative to the session start.
+
+    initial_state is the (axes, buttons, hats) of the controller before its first event.
+    """
+
+    def __init__(self,
+                 name: str,
+                 events: List[InputEvent],
+                 initial_state: Optional[tuple] = None,
+                 detections: Optional[dict] = None):
+        self.name = name
+        self.events = events
+        self.initial_state = neutral_state() if initial_state is None else initial_state
+        self.detections = detections or {}
+        self.duration = 0.0
+
+    def frames(self) -> Iterator[ReplayFrame]:
+        raise NotImplementedError("Please subclass this method")
+
+
+class RecordingSource(ReplaySource):
+
+    def __init__(self, path: str):
+        self.reader = SessionReader(path)
+        self.start = float(self.reader.index["timestamp"][0]) if len(self.reader.index) else 0.0
+        states = [record.data._replace(timestamp=record.timestamp - self.start) for record in self.reader.records([INPUT])]
+        initial_state = neutral_state(*map(len, states[0][:3])) if states else None
+        detections = {seq: boxes for _, _, (seq, boxes) in self.reader.records([DETECTIONS])}
+        super().__init__(path, self._events(states, initial_state), initial_state, detections)
+        self.duration = self.reader.duration()
+
+    @staticmethod
+    def _events(states: List[InputState], initial_state: Optional[tuple]) -> List[InputEvent]:
+        """Recordings hold the controller snapshots, the events are the differences between them"""
+        events = []
+        if states:
+            previous = InputState(*initial_state, 0.0, 0)
+            for state in states:
+                events.extend(InputEvent(state.timestamp, event) for event in state_events(previous, state))
+                previous = state
+        return events
+
+    def frames(self) -> Iterator[ReplayFrame]:
+        for record in self.reader.records([FRAME]):
+            seq, frame = record.data
+            if frame is not None:
+                yield ReplayFrame(record.timestamp - self.start, seq, frame)
+
+
+class VideoFileSource(ReplaySource):
+    """A plain video file, with controller input from a JSON list of steps such as {"t": 0.5, "axis": 5, "value": 1},
+    {"t": 2.0, "button": 0, "pressed": true} or {"t": 9.0, "removed": true}"""
+
+    def __init__(self, path: str, controller_path: Optional[str] = None):
+        events = load_controller_script(controller_path) if controller_path else []
+        super().__init__(path, events)
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video {path}")
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        cap.release()
+        last_input = events[-1].timestamp if events else 0.0
+        self.duration = max(frame_count / self.fps, last_input)
+
+    def frames(self) -> Iterator[ReplayFrame]:
+        cap = cv2.VideoCapture(self.name)
+        seq = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            seq += 1
+            yield ReplayFrame((seq - 1) / self.fps, seq, frame)
+        cap.release()
+
+
+def load_controller_script(path: str) -> List[InputEvent]:
+    with open(path) as f:
+        steps = json.load(f)
+
+    events = []
+    for step in sorted(steps, key=lambda s: s["t"]):
+        if "axis" in step:
+            _, event_type, attributes = ScriptedJoystickSource.axis(0.0, step["axis"], float(step["value"]))
+        elif "button" in step:
+            _, event_type, attributes = ScriptedJoystickSource.button(0.0, step["button"], step.get("pressed", True))
+        elif "hat" in step:
+            _, event_type, attributes = ScriptedJoystickSource.hat(0.0, step["hat"], tuple(step["value"]))
+        elif step.get("removed"):
+            _, event_type, attributes = ScriptedJoystickSource.removed(0.0)
+        else:
+            raise ValueError(f"Unknown controller step {step}")
+        events.append(InputEvent(float(step["t"]), pygame.event.Event(event_type, attributes)))
+    return events
+
+
+class ReplayCapture:
+    """Capture-like frame source for VideoWorker that hands out one frame per release_frame() call"""
+
+    READ_TIMEOUT_S = 0.1
+
+    def __init__(self, frames: Iterator[ReplayFrame]):
+        self._frames = frames
+        self._next = next(frames, None)
+        self._permits = threading.Semaphore(0)
+        self._closed = False
+        self.current: Optional[ReplayFrame] = None
+
+    def peek(self) -> Optional[ReplayFrame]:
+        """The frame the next read returns, None at the end"""
+        return self._next
+
+    def release_frame(self):
+        self._permits.release()
+
+    def isOpened(self) -> bool:
+        return True
+
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        while not self._permits.acquire(timeout=self.READ_TIMEOUT_S):
+            if self._closed:
+                return False, None
+        if self._next is None:
+            return False, None
+
+        self.current, self._next = self._next, next(self._frames, None)
+        frame = self.current.frame
+        if image is not None and image.shape == frame.shape and image.dtype == frame.dtype:
+            np.copyto(image, frame)
+            frame = image
+        return True, frame
+
+    def grab(self) -> bool:
+        return self.read()[0]
+
+    def release(self):
+        self._closed = True
+
+
+class RecordedDetectionsModel(BaseModel):
+    """Returns the recorded detections of the frame the replay released last, instead of running a network"""
+
+    def __init__(self, replay: "Replay"):
+        super().__init__(None, COCO_NAMES)
+        self.replay = replay
+
+    def get_predictions(self, img):
+        current = self.replay.capture.current
+        return self.replay.source.detections.get(current.seq) if current is not None else None
+
+
+class _ReplayController:
+    """The part of Controller that ControlWorker uses, fed with events by the replay instead of an input thread"""
+
+    def __init__(self, initial_state: tuple):
+        self.state = InputState(*initial_state, 0.0, 0)
+        self.axis_data = {}
+        self.button_data = {}
+        self.hat_data = {}
+        self.events = []
+        self._pending = []
+
+    def push(self, input_event: InputEvent) -> Optional[InputState]:
+        """Applies an event like the input thread does, returns the new snapshot or None if it did not change"""
+        self._pending.append(input_event.event)
+        state = apply_event(self.state, input_event.event, input_event.timestamp)
+        if state is not None:
+            self.state = state
+        return state
+
+    def update(self):
+        self.events, self._pending = self._pending, []
+        self.axis_data = dict(enumerate(self.state.axes))
+        self.button_data = dict(enumerate(self.state.buttons))
+        self.hat_data = dict(enumerate(self.state.hats))
+
+    def stop(self):
+        pass
+
+
+class _ReplayStream:
+    """The part of VideoStream that OdThread uses"""
+
+    def __init__(self, frame_buffer: FrameBuffer):
+        self.frame_buffer = frame_buffer
+
+
+class _RecordedOdThread(OdThread):
+
+    def __init__(self, video_stream, model: BaseModel, **kwargs):
+        super().__init__(video_stream, backend=RECORDED_BACKEND, **kwargs)
+        self._model = model
+
+    def load_model(self):
+        self.model = self._model
+        self.initialised.emit()
+        return True
+
+
+class Trace:
+    """Commands and detections coming out of the pipeline. Stands in for a SessionRecorder on the ControlWorker"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.commands = []
+        self.detections = []
+
+    def record_input(self, state: InputState):
+        pass
+
+    def record_command(self, name: str, value: float, timestamp: Optional[float] = None):
+        self.commands.append([round(self.clock(), 3), name, value])
+
+    def add_detections(self, seq: int, frame_time: float, predictions):
+        boxes = np.zeros((0, 6)) if predictions is None else np.asarray(
+            predictions.cpu() if hasattr(predictions, "cpu") else predictions, dtype=float).reshape(-1, 6)
+        self.detections.append([seq, round(frame_time, 3), np.round(boxes, 1).tolist()])
+
+    def digest(self) -> str:
+        data = json.dumps({"commands": self.commands, "detections": self.detections}, sort_keys=True)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+
+class ReplayResult(NamedTuple):
+    trace: Trace
+    stats: dict
+
+    @property
+    def digest(self) -> str:
+        return self.trace.digest()
+
+    def to_json(self) -> dict:
+        return {
+            "digest": self.digest,
+            "stats": self.stats,
+            "commands": self.trace.commands,
+            "detections": self.trace.detections
+        }
+
+
+class Replay:
+    """Runs one replay of source through VideoWorker, OdThread (when backend is set) and ControlWorker on a FakeHub"""
+
+    DEVICE = "replay"
+    WAIT_TIMEOUT_S = 10.0
+
+    def __init__(self, source: ReplaySource, backend: Optional[str] = None, pacing: str = FAST,
+                 hub_latency_s: float = 0.0):
+        if pacing not in (FAST, REALTIME):
+            raise ValueError(f"Unknown pacing {pacing}")
+        self.source = source
+        self.backend = backend
+        self.pacing = pacing
+        self.hub_latency_s = hub_latency_s
+        self.capture = None
+
+        self._detected = threading.Condition()
+        self._detected_seq = 0
+        self._frames = {}  # Buffer seq -> (source seq, time) of released frames OdThread has not reported yet
+
+    def _handle_detections(self, results: list):
+        # Called from OdThread
+        with self._detected:
+            for result in results:
+                frame = self._frames.pop(result.seq, None)
+                if frame is not None:
+                    self.trace.add_detections(*frame, result.predictions)
+            self._detected_seq = max(self._detected_seq, results[-1].seq)
+            # Frames OdThread skipped are never reported
+            for seq in [seq for seq in self._frames if seq <= self._detected_seq]:
+                del self._frames[seq]
+            self._detected.notify_all()
+
+    def _start_detection(self, frame_buffer: FrameBuffer) -> Optional[OdThread]:
+        if not self.backend:
+            return None
+
+        target_fps = 0 if self.pacing == FAST else OdThread.DEFAULT_TARGET_FPS
+        stream = _ReplayStream(frame_buffer)
+        if self.backend == RECORDED_BACKEND:
+            od_thread = _RecordedOdThread(stream, RecordedDetectionsModel(self), target_fps=target_fps)
+        else:
+            od_thread = OdThread(stream, backend=self.backend, target_fps=target_fps)
+
+        loaded = threading.Event()
+        errors = []
+        od_thread.initialised.connect(loaded.set, Qt.DirectConnection)
+        od_thread.load_failed.connect(lambda error: (errors.append(error), loaded.set()), Qt.DirectConnection)
+        od_thread.detections_ready.connect(self._handle_detections, Qt.DirectConnection)
+        od_thread.start()
+        loaded.wait(self.WAIT_TIMEOUT_S * 6)
+        if errors:
+            raise RuntimeError(f"Could not load {self.backend} model: {errors[0]}")
+        return od_thread
+
+    def _start_control(self, clock) -> ControlWorker:
+        worker = ControlWorker(self.DEVICE,
+                               "B",
+                               "A",
+                               0,
+                               hub_factory=lambda device=None: FakeHub(device, self.hub_latency_s),
+                               clock=clock)
+        if not worker.init_bot():
+            raise RuntimeError("Could not connect to the fake hub")
+        worker.recorder = self.trace
+        worker.controller = _ReplayController(self.source.initial_state)
+
+        # The fake steering rack has known end stops, so calibration is skipped
+        left, right = FakeHub.DEFAULT_LIMITS[worker.motor_steer_str]
+        middle, total_angle = calculate_steering_middle(left, right)
+        worker.left_steer_value, worker.right_steer_value = left, right
+        worker.middle_steer_value, worker.total_angle = middle, total_angle
+        return worker
+
+    def _release_frame(self, frame_buffer: FrameBuffer, od_thread: Optional[OdThread], buffer_seq: int) -> int:
+        # Registered before the release, OdThread may report the frame before the wait below returns
+        frame = self.capture.peek()
+        if od_thread is not None:
+            with self._detected:
+                self._frames[buffer_seq + 1] = (frame.seq, frame.time)
+        self.capture.release_frame()
+        seq = frame_buffer.wait(buffer_seq, self.WAIT_TIMEOUT_S)
+        if seq != buffer_seq + 1:
+            raise RuntimeError("VideoWorker did not deliver the replayed frame")
+
+        if od_thread is not None and self.pacing == FAST:
+            # Lockstep, so every frame is detected exactly once whatever the model speed
+            with self._detected:
+                if not self._detected.wait_for(lambda: self._detected_seq >= seq, self.WAIT_TIMEOUT_S):
+                    raise RuntimeError(f"No detections for frame {frame.seq}")
+        return seq
+
+    def run(self) -> ReplayResult:
+        app = QCoreApplication.instance() or QCoreApplication([])  # noqa: F841, Qt objects need an application
+        clock = VirtualClock() if self.pacing == FAST else RealClock()
+        self.trace = Trace(clock)
+        wall_start = time.perf_counter()
+
+        frame_buffer = FrameBuffer()
+        self.capture = ReplayCapture(self.source.frames())
+        video_worker = VideoWorker(self.capture, frame_buffer)
+        video_thread = threading.Thread(target=video_worker.run, name="replay-video", daemon=True)
+        video_thread.start()
+        od_thread = self._start_detection(frame_buffer)
+        worker = self._start_control(clock)
+
+        events = deque(self.source.events)
+        buffer_seq = 0
+        frames = 0
+        deadline = clock()
+        try:
+            # A removed controller stops the worker, as it does live
+            while worker.running and clock() <= self.source.duration + worker.scheduler.period:
+                now = clock()
+                while self.capture.peek() is not None and self.capture.peek().time <= now:
+                    buffer_seq = self._release_frame(frame_buffer, od_thread, buffer_seq)
+                    frames += 1
+                while events and events[0].timestamp <= now:
+                    state = worker.controller.push(events.popleft())
+                    if state is not None:
+                        worker._handle_input_change(state)
+                deadline = worker.scheduler.tick(deadline)
+                clock.sleep(deadline - clock())
+        finally:
+            hub = worker.bot.bot.hub
+            controller_stopped = not worker.running
+            worker.close()
+            HUB_POOL.discard(self.DEVICE)
+            if od_thread is not None:
+                od_thread.stop()
+            video_worker.stop()
+            self.capture.release()
+            frame_buffer.close()
+            video_thread.join(self.WAIT_TIMEOUT_S)
+
+        wall_time = time.perf_counter() - wall_start
+        stats = {
+            "source": self.source.name,
+            "pacing": self.pacing,
+            "backend": self.backend,
+            "duration_s": round(self.source.duration, 3),
+            "wall_time_s": round(wall_time, 3),
+            "speedup": round(self.source.duration / wall_time, 2) if wall_time else None,
+            "frames": frames,
+            "detections": len(self.trace.detections),
+            "skipped_detections": od_thread.skipped_frames if od_thread is not None else 0,
+            "commands": len(self.trace.commands),
+            "input_events": len(self.source.events) - len(events),
+            "controller_stopped": controller_stopped,
+            "sounds": hub.sound.played[1:],  # After the greeting on connect
+            "hub_round_trips": hub.round_trips,
+            "loop": worker.get_timing(),
+        }
+        return ReplayResult(self.trace, stats)
+
+
+def open_source(path: str, controller_path: Optional[str] = None) -> ReplaySource:
+    if path.endswith(".odrec"):
+        return RecordingSource(path)
+    return VideoFileSource(path, controller_path)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Replay a session through the pipeline against a fake hub")
+    parser.add_argument("source", help="session recording (.odrec) or video file")
+    parser.add_argument("--controller", help="JSON controller script, for video file sources")
+    parser.add_argument("--backend", help=f"object detection backend, or '{RECORDED_BACKEND}' for recorded detections")
+    parser.add_argument("--pacing", choices=[FAST, REALTIME], default=FAST)
+    parser.add_argument("--hub-latency-ms", type=float, default=0.0, help="simulated serial round trip time")
+    parser.add_argument("--runs", type=int, default=1, help="replay this many times and check the traces match")
+    parser.add_argument("--trace", help="write the trace and stats to this JSON file")
+    parser.add_argument("--expect", help="fail unless the trace digest matches this earlier trace file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    source = open_source(args.source, args.controller)
+    results = [
+        Replay(source, args.backend, args.pacing, args.hub_latency_ms / 1000).run() for _ in range(max(args.runs, 1))
+    ]
+    result = results[0]
+    print(json.dumps(result.stats, indent=2))
+
+    if args.trace:
+        with open(args.trace, "w") as f:
+            json.dump(result.to_json(), f)
+
+    failed = False
+    digests = {r.digest for r in results}
+    if len(digests) > 1:
+        log.error(f"Replays are not deterministic, got {len(digests)} different traces")
+        failed = True
+    if args.expect:
+        with open(args.expect) as f:
+            expected = json.load(f)["digest"]
+        if expected != result.digest:
+            log.error(f"Trace digest {result.digest} does not match the expected {expected}")
+            failed = True
+    log.info(f"Trace digest {result.digest}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
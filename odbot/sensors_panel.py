@@ -0,0 +1,217 @@
+import logging
+from typing import Callable, Optional, Sequence, Tuple
+
+import numpy as np
+from PySide6.QtCore import QPointF, QRectF, Qt, QTimer
+from PySide6.QtGui import QColor, QPainter, QPen, QPolygonF
+from PySide6.QtWidgets import QLabel, QSizePolicy, QVBoxLayout, QWidget
+
+from odbot.telemetry import RingBuffer
+
+log = logging.getLogger(__name__)
+
+
+class SeriesBuffer:
+    """Preallocated plot history of capacity samples for n_series series sharing timestamps.
+
+    Every sample is written twice, capacity apart, so the newest samples are always one contiguous slice and reading
+    them never copies.
+    """
+
+    def __init__(self, capacity: int, n_series: int):
+        self.capacity = capacity
+        self._t = np.zeros(2 * capacity)
+        self._y = np.full((n_series, 2 * capacity), np.nan)
+        self.count = 0
+
+    def extend(self, timestamps: np.ndarray, values: np.ndarray):
+        """Appends timestamps with values of shape (len(timestamps), n_series)"""
+        timestamps, values = timestamps[-self.capacity:], values[-self.capacity:]
+        idx = (self.count + np.arange(len(timestamps))) % self.capacity
+        for offset in (0, self.capacity):
+            self._t[idx + offset] = timestamps
+            self._y[:, idx + offset] = values.T
+        self.count += len(timestamps)
+
+    def view(self) -> Tuple[np.ndarray, np.ndarray]:
+        n = min(self.count, self.capacity)
+        start = (self.count - n) % self.capacity
+        return self._t[start:start + n], self._y[:, start:start + n]
+
+    def clear(self):
+        self.count = 0
+
+
+def decimate_minmax(t: np.ndarray, y: np.ndarray, t0: float, t1: float,
+                    width: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Reduces sorted samples in [t0, t1] to the min and max of each of width pixel columns.
+
+    Returns (columns, mins, maxs) for the columns that have samples, mins and maxs are (n_series, len(columns)). The
+    result has at most 2 * width points per series no matter how many samples there are, and still shows every spike.
+    """
+    edges = np.searchsorted(t, np.linspace(t0, t1, width + 1))
+    edges[-1] = np.searchsorted(t, t1, side="right")
+    columns = np.flatnonzero(edges[1:] > edges[:-1])
+    if len(columns) == 0:
+        empty = np.empty((y.shape[0], 0))
+        return columns, empty, empty
+
+    y = y[:, :edges[-1]]
+    starts = edges[columns]
+    # fmin/fmax skip NaNs, e.g. a command that was not sent yet
+    return columns, np.fmin.reduceat(y, starts, axis=1), np.fmax.reduceat(y, starts, axis=1)
+
+
+class PlotWidget(QWidget):
+    """Scrolling time series plot of the last span_s seconds, drawn from min/max decimated columns"""
+
+    BACKGROUND = QColor("#21252b")
+    GRID = QColor("#3e4451")
+    TEXT = QColor("#abb2bf")
+    MARGIN = 4
+
+    def __init__(self,
+                 title: str,
+                 names: Sequence[str],
+                 colors: Sequence[str],
+                 capacity: int = 60000,
+                 span_s: float = 30.0,
+                 y_range: Optional[Tuple[float, float]] = None,
+                 parent: QWidget = None):
+        super().__init__(parent)
+        self.title = title
+        self.names = list(names)
+        self.colors = [QColor(c) for c in colors]
+        self.span_s = span_s
+        self.y_range = y_range
+        self.history = SeriesBuffer(capacity, len(self.names))
+        self.setMinimumSize(240, 120)
+
+    def extend(self, timestamps: np.ndarray, values: np.ndarray):
+        self.history.extend(timestamps, values)
+
+    def clear(self):
+        self.history.clear()
+        self.update()
+
+    def _value_range(self, mins: np.ndarray, maxs: np.ndarray) -> Tuple[float, float]:
+        if self.y_range is not None:
+            return self.y_range
+        finite_min, finite_max = mins[np.isfinite(mins)], maxs[np.isfinite(maxs)]
+        if len(finite_min) == 0:
+            return -1.0, 1.0
+        low, high = float(finite_min.min()), float(finite_max.max())
+        pad = max((high - low) * 0.1, 1.0)
+        return low - pad, high + pad
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        rect = QRectF(self.rect()).adjusted(self.MARGIN, self.MARGIN, -self.MARGIN, -self.MARGIN)
+        painter.fillRect(self.rect(), self.BACKGROUND)
+        painter.setPen(self.GRID)
+        painter.drawLine(QPointF(rect.left(), rect.center().y()), QPointF(rect.right(), rect.center().y()))
+
+        t, y = self.history.view()
+        labels = [self.title]
+        if len(t):
+            t1 = t[-1]
+            columns, mins, maxs = decimate_minmax(t, y, t1 - self.span_s, t1, max(int(rect.width()), 1))
+            low, high = self._value_range(mins, maxs)
+            x_scale = rect.width() / max(int(rect.width()), 1)
+            y_scale = rect.height() / (high - low)
+
+            painter.setRenderHint(QPainter.Antialiasing)
+            for i, color in enumerate(self.colors):
+                painter.setPen(QPen(color, 1.5))
+                xs = rect.left() + columns * x_scale
+                finite = np.isfinite(mins[i])
+                # Zigzag through each column's min and max, so the envelope of all samples is drawn
+                points = np.empty((2 * finite.sum(), 2))
+                points[0::2, 0] = points[1::2, 0] = xs[finite]
+                points[0::2, 1] = rect.bottom() - (mins[i][finite] - low) * y_scale
+                points[1::2, 1] = rect.bottom() - (maxs[i][finite] - low) * y_scale
+                painter.drawPolyline(QPolygonF([QPointF(px, py) for px, py in points]))
+
+                latest = y[i, -1]
+                labels.append(f"{self.names[i]} {latest:.0f}" if np.isfinite(latest) else self.names[i])
+
+        painter.setPen(self.TEXT)
+        painter.drawText(rect, Qt.AlignTop | Qt.AlignLeft, "   ".join(labels))
+        painter.end()
+
+
+class SensorsPanel:
+    """Feeds the sensors.ui panel from a telemetry RingBuffer.
+
+    New samples are pulled and the plots redrawn on a timer, independent of the sample rate. Nothing is drawn while the
+    panel is hidden.
+    """
+
+    REFRESH_FPS = 20
+    STEER_FIELDS = ("steer_position", "steer_command")
+    SPEED_FIELDS = ("speed_command", "drive_speed")
+
+    def __init__(self, view: QWidget, source: Callable[[], Optional[RingBuffer]]):
+        self.view = view
+        self.source = source
+        self._buffer = None
+        self._count = 0
+
+        self.steer_plot = PlotWidget("Steering", ["position", "command"], ["#61afef", "#e5c07b"])
+        self.speed_plot = PlotWidget("Speed", ["command", "actual"], ["#e5c07b", "#98c379"], y_range=(-110, 110))
+        motors_layout = QVBoxLayout(self.view.groupBox_8)
+        motors_layout.addWidget(self.steer_plot)
+        motors_layout.addWidget(self.speed_plot)
+
+        self.battery_label = QLabel()
+        self.accel_label = QLabel()
+        self.gyro_label = QLabel()
+        hub_layout = QVBoxLayout(self.view.groupBox_7)
+        for label in (self.battery_label, self.accel_label, self.gyro_label):
+            hub_layout.addWidget(label)
+        # The plots get the remaining height
+        self.view.groupBox_7.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Maximum)
+        self._set_hub_labels(None)
+
+        self.refresh_timer = QTimer(self.view)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(int(1000 / self.REFRESH_FPS))
+
+    def _set_hub_labels(self, row: Optional[np.ndarray]):
+        if row is None:
+            self.battery_label.setText("Battery: -")
+            self.accel_label.setText("Accel: -")
+            self.gyro_label.setText("Gyro: -")
+            return
+        values = dict(zip(self._buffer.fields, row))
+        self.battery_label.setText(f"Battery: {values['battery_mv'] / 1000:.2f} V")
+        self.accel_label.setText(f"Accel: {values['accel_x']:.0f}, {values['accel_y']:.0f}, {values['accel_z']:.0f}")
+        self.gyro_label.setText(f"Gyro: {values['gyro_x']:.0f}, {values['gyro_y']:.0f}, {values['gyro_z']:.0f}")
+
+    def refresh(self):
+        if not self.view.isVisible():
+            return
+
+        buffer = self.source()
+        if buffer is not self._buffer:
+            # A new connection starts a new history
+            self._buffer, self._count = buffer, 0
+            self.steer_plot.clear()
+            self.speed_plot.clear()
+            self._set_hub_labels(None)
+        if buffer is None:
+            return
+
+        self._count, timestamps, rows = buffer.since(self._count)
+        if len(timestamps) == 0:
+            return
+
+        columns = {name: i for i, name in enumerate(buffer.fields)}
+        self.steer_plot.extend(timestamps, rows[:, [columns[name] for name in self.STEER_FIELDS]])
+        self.speed_plot.extend(timestamps, rows[:, [columns[name] for name in self.SPEED_FIELDS]])
+        self._set_hub_labels(rows[-1])
+        self.steer_plot.update()
+        self.speed_plot.update()
+
+    def stop(self):
+        self.refresh_timer.stop()
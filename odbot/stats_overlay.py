@@ -0,0 +1,102 @@
+import time
+from typing import Dict, Optional
+
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtGui import QFont
+from PySide6.QtWidgets import QLabel, QWidget
+
+from odbot.metrics import METRICS, Counter, Gauge, Histogram, Registry
+
+# (row title, [(label, metric name, kind)]) where kind is "rate" for counters, "p50"/"p95" for histograms, or "value"
+# for gauges
+ROWS = (
+    ("Capture", [("fps", "odbot_frames_captured_total", "rate"), ("dropped/s", "odbot_frames_dropped_total", "rate")]),
+    ("Display", [("fps", "odbot_frames_displayed_total", "rate"), ("convert p50", "odbot_display_convert_seconds", "p50"),
+                 ("p95", "odbot_display_convert_seconds", "p95")]),
+    ("Detect", [("fps", "odbot_detection_frames_total", "rate"), ("infer p50", "odbot_inference_seconds", "p50"),
+                ("p95", "odbot_inference_seconds", "p95"), ("skipped/s", "odbot_detection_skipped_frames_total", "rate")]),
+    ("Schedule", [("size", "odbot_inference_input_size", "value"),
+                  ("full/s", "odbot_detection_full_frames_total", "rate"),
+                  ("crops/s", "odbot_detection_crops_total", "rate"),
+                  ("min object px", "odbot_inference_min_object_px", "value")]),
+    ("Track", [("fps", "odbot_tracker_frames_total", "rate"), ("step p50", "odbot_tracker_step_seconds", "p50"),
+               ("p95", "odbot_tracker_step_seconds", "p95")]),
+    ("Control", [("jitter p95", "odbot_control_tick_jitter_seconds", "p95"),
+                 ("cmds/s", "odbot_control_commands_total", "rate")]),
+    ("Hub", [("drive p50", "odbot_hub_drive_seconds", "p50"), ("p95", "odbot_hub_drive_seconds", "p95"),
+             ("telemetry p95", "odbot_hub_telemetry_seconds", "p95")]),
+)
+
+
+class StatsOverlay(QLabel):
+    """Semi-transparent text box over the video with pipeline rates and latencies of the last refresh interval"""
+
+    REFRESH_MS = 1000
+
+    def __init__(self, parent: QWidget, registry: Registry = METRICS):
+        super().__init__(parent)
+        self.registry = registry
+        self._previous: Dict[str, object] = {}
+        self._previous_time = time.monotonic()
+
+        self.setFont(QFont("monospace", 8))
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 160); color: #98c379; padding: 4px;")
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.move(8, 8)
+        self.hide()
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def set_enabled(self, enabled: bool):
+        if enabled:
+            self._previous, self._previous_time = {}, time.monotonic()
+            self.refresh()
+            self.show()
+            self.refresh_timer.start(self.REFRESH_MS)
+        else:
+            self.refresh_timer.stop()
+            self.hide()
+
+    def _value(self, name: str, kind: str, elapsed: float, snapshots: dict) -> Optional[float]:
+        metric = self.registry.get(name)
+        if isinstance(metric, Counter):
+            if name not in snapshots:
+                snapshots[name] = metric.value
+            previous = self._previous.get(name)
+            return None if previous is None else (snapshots[name] - previous) / elapsed
+        if isinstance(metric, Histogram):
+            if name not in snapshots:
+                snapshots[name] = metric.snapshot()[0]
+            previous = self._previous.get(name, [0] * len(snapshots[name]))
+            window = [now - before for now, before in zip(snapshots[name], previous)]
+            quantile = metric.quantile(0.5 if kind == "p50" else 0.95, window)
+            return None if quantile is None else quantile * 1000
+        if isinstance(metric, Gauge):
+            return metric.value
+        return None
+
+    def refresh(self):
+        if not self.registry.enabled:
+            self.setText("Metrics disabled (ODBOT_METRICS=0)")
+            self.adjustSize()
+            return
+
+        now = time.monotonic()
+        elapsed = max(now - self._previous_time, 1e-6)
+        snapshots = {}
+        lines = []
+        for title, fields in ROWS:
+            parts = []
+            for label, name, kind in fields:
+                value = self._value(name, kind, elapsed, snapshots)
+                unit = " ms" if kind in ("p50", "p95") else ""
+                if value is None:
+                    parts.append(f"{label} -{unit}")
+                else:
+                    parts.append(f"{label} {value:.0f}{unit}" if kind == "value" else f"{label} {value:.1f}{unit}")
+            lines.append(f"{title:<9}" + "  ".join(parts))
+
+        self._previous, self._previous_time = snapshots, now
+        self.setText("\n".join(lines))
+        self.adjustSize()
@@ -0,0 +1,170 @@
+import logging
+import threading
+import time
+from concurrent.futures import TimeoutError
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from odbot.async_bot import AsyncBot
+
+log = logging.getLogger(__name__)
+
+
+class TelemetrySample(NamedTuple):
+    timestamp: float
+    steer_position: float
+    steer_speed: float
+    steer_load: float  # Motor PWM in percent, the closest to a load reading the hub offers
+    drive_position: float
+    drive_speed: float
+    drive_load: float
+    steer_command: float
+    speed_command: float
+    accel_x: float
+    accel_y: float
+    accel_z: float
+    gyro_x: float
+    gyro_y: float
+    gyro_z: float
+    battery_mv: float
+
+
+FIELDS = TelemetrySample._fields[1:]
+
+
+class RingBuffer:
+    """Fixed-size history of timestamped rows. Memory is allocated once and the oldest rows are overwritten"""
+
+    def __init__(self, fields: Tuple[str, ...] = FIELDS, capacity: int = 6000):
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self._index = {name: i for i, name in enumerate(self.fields)}
+        self._timestamps = np.zeros(capacity)
+        self._data = np.full((capacity, len(self.fields)), np.nan)
+        self._lock = threading.Lock()
+        self.count = 0  # Rows appended in total, also usable as a sequence number
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, timestamp: float, values):
+        with self._lock:
+            idx = self.count % self.capacity
+            self._timestamps[idx] = timestamp
+            self._data[idx] = values
+            self.count += 1
+
+    def _order(self, n: int) -> np.ndarray:
+        return np.arange(self.count - n, self.count) % self.capacity
+
+    def window(self, n: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns copies of the newest n (default all) timestamps and rows, oldest first"""
+        with self._lock:
+            n = len(self) if n is None else min(n, len(self))
+            order = self._order(n)
+            return self._timestamps[order], self._data[order]
+
+    def since(self, count: int) -> Tuple[int, np.ndarray, np.ndarray]:
+        """Returns (count, timestamps, rows) appended after a previous count, for incremental consumers"""
+        with self._lock:
+            n = min(self.count - count, len(self))
+            order = self._order(n)
+            return self.count, self._timestamps[order], self._data[order]
+
+    def series(self, field: str, n: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        timestamps, data = self.window(n)
+        return timestamps, data[:, self._index[field]]
+
+
+class TelemetryService:
+    """Samples motors, IMU and battery in the background and keeps the history in a RingBuffer.
+
+    Reads go through the AsyncBot I/O thread, which sends actuator commands first, so sampling never delays the control
+    loop. With the hub helper loaded a sample is a single round trip. At most one read is in flight, if the hub cannot
+    keep up with rate_hz samples are skipped rather than queued.
+
+    Subscribers are called with every TelemetrySample from the telemetry thread. The UI should read the buffer on its
+    own timer instead of subscribing.
+    """
+
+    READ_TIMEOUT_S = 1.0
+
+    def __init__(self, bot: AsyncBot, rate_hz: float = 20, capacity: int = 6000):
+        self.bot = bot
+        self.period = 1.0 / rate_hz
+        self.buffer = RingBuffer(FIELDS, capacity)
+        self.skipped = 0
+        self.errors = 0
+
+        self._pending = None
+        self._subscribers: List[Callable[[TelemetrySample], None]] = []
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def subscribe(self, callback: Callable[[TelemetrySample], None]):
+        self._subscribers = self._subscribers + [callback]
+
+    def unsubscribe(self, callback: Callable[[TelemetrySample], None]):
+        self._subscribers = [s for s in self._subscribers if s != callback]
+
+    def latest(self) -> Optional[TelemetrySample]:
+        timestamps, data = self.buffer.window(1)
+        return TelemetrySample(float(timestamps[0]), *data[0].tolist()) if len(timestamps) else None
+
+    def _to_sample(self, timestamp: float, reading) -> TelemetrySample:
+        steer, drive, accelerometer, gyroscope, battery_mv = reading
+        commanded = self.bot.commanded
+        return TelemetrySample(timestamp, steer[1], steer[0], steer[3], drive[1], drive[0], drive[3],
+                               commanded.get(AsyncBot.STEER, np.nan), commanded.get(AsyncBot.SPEED, np.nan),
+                               *accelerometer, *gyroscope, battery_mv)
+
+    def _sample(self):
+        if self._pending is not None and not self._pending.done():
+            # The previous read timed out and is still queued on the hub
+            self.skipped += 1
+            return
+        requested = time.monotonic()
+        self._pending = future = self.bot.read_telemetry()
+        try:
+            reading = future.result(self.READ_TIMEOUT_S)
+        except TimeoutError:
+            self.skipped += 1
+            return
+        except Exception as e:
+            self.errors += 1
+            log.debug(f"Telemetry read failed: {e}")
+            return
+
+        # Midway between request and reply is the best estimate of when the hub took the reading
+        sample = self._to_sample((requested + time.monotonic()) / 2, reading)
+        self.buffer.append(sample.timestamp, sample[1:])
+        for callback in self._subscribers:
+            try:
+                callback(sample)
+            except Exception as e:
+                log.error(f"Error in telemetry subscriber: {e}")
+
+    def _run(self):
+        deadline = time.monotonic()
+        while not self._stop_event.is_set():
+            self._sample()
+            deadline += self.period
+            remaining = deadline - time.monotonic()
+            if remaining < 0:
+                # Behind schedule, the hub is slower than the requested rate
+                self.skipped += int(-remaining / self.period)
+                deadline = time.monotonic()
+                continue
+            self._stop_event.wait(remaining)
+
+    def stats(self) -> dict:
+        return {"samples": self.buffer.count, "skipped": self.skipped, "errors": self.errors}
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread.is_alive() and threading.current_thread() is not self._thread:
+            self._thread.join(self.READ_TIMEOUT_S * 2)
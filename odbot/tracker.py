@@ -0,0 +1,306 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from PySide6.QtCore import QThread, Signal
+
+from odbot.batch_scheduler import FrameDetections
+from odbot.frame_buffer import FrameBuffer
+from odbot.metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+TRACKER_STEP_TIME = METRICS.histogram("odbot_tracker_step_seconds", "Per-frame box propagation and association time")
+TRACKER_FRAMES = METRICS.counter("odbot_tracker_frames_total", "Frames the tracker propagated boxes to")
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Intersection over union of every xyxy box in a with every xyxy box in b"""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:4], b[None, :, 2:4])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:4] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:4] - b[:, :2], axis=1)
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+def xyxy_to_cxcywh(boxes: np.ndarray) -> np.ndarray:
+    return np.concatenate([(boxes[..., :2] + boxes[..., 2:4]) / 2, boxes[..., 2:4] - boxes[..., :2]], axis=-1)
+
+
+def cxcywh_to_xyxy(boxes: np.ndarray) -> np.ndarray:
+    return np.concatenate([boxes[..., :2] - boxes[..., 2:4] / 2, boxes[..., :2] + boxes[..., 2:4] / 2], axis=-1)
+
+
+class KalmanBox:
+    """Constant velocity Kalman filter on a box's (cx, cy, w, h), with velocities in pixels per second.
+
+    Noise scales with the box height, so near and far objects are filtered alike.
+    """
+
+    PROCESS_POSITION_STD = 0.1  # Box heights per sqrt(second)
+    PROCESS_VELOCITY_STD = 1.0  # Box heights per second per sqrt(second)
+    INITIAL_VELOCITY_STD = 1.0  # Box heights per second
+
+    _H = np.hstack([np.eye(4), np.zeros((4, 4))])
+
+    def __init__(self, box: np.ndarray):
+        self.x = np.concatenate([xyxy_to_cxcywh(np.asarray(box[:4], dtype=float)), np.zeros(4)])
+        height = max(self.x[3], 1.0)
+        self.P = np.diag([(0.1 * height)**2] * 4 + [(self.INITIAL_VELOCITY_STD * height)**2] * 4)
+
+    @property
+    def box(self) -> np.ndarray:
+        return cxcywh_to_xyxy(self.x[:4])
+
+    def predict(self, dt: float):
+        if dt <= 0:
+            return
+        F = np.eye(8)
+        F[range(4), range(4, 8)] = dt
+        height = max(self.x[3], 1.0)
+        Q = np.diag([(self.PROCESS_POSITION_STD * height)**2] * 4 + [(self.PROCESS_VELOCITY_STD * height)**2] * 4)
+        self.x = F @ self.x
+        self.x[2:4] = np.maximum(self.x[2:4], 1.0)
+        self.P = F @ self.P @ F.T + Q * dt
+
+    def update(self, box: np.ndarray, std: float):
+        """Corrects the state with a measured xyxy box whose error is std box heights"""
+        z = xyxy_to_cxcywh(np.asarray(box[:4], dtype=float))
+        R = np.eye(4) * (std * max(z[3], 1.0))**2
+        S = self._H @ self.P @ self._H.T + R
+        K = self.P @ self._H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ (z - self._H @ self.x)
+        self.x[2:4] = np.maximum(self.x[2:4], 1.0)
+        self.P = (np.eye(8) - K @ self._H) @ self.P
+
+
+class Track:
+
+    def __init__(self, track_id: int, detection: np.ndarray):
+        self.id = track_id
+        self.kalman = KalmanBox(detection)
+        self.conf = float(detection[4])
+        self.cls = int(detection[5])
+        self.hits = 1
+        self.misses = 0
+
+
+class Tracker:
+    """Keeps stable IDs and per-frame box estimates for objects between low-rate detections.
+
+    Every frame, the boxes are moved with sparse optical flow on a downscaled gray image and filtered with a Kalman
+    filter per track, which also carries tracks through frames where flow fails. Detections arrive late, for a frame
+    that is already a few frames old, so each one is first moved by flow through the frames since its own, and then
+    matched to the tracks by IoU.
+    """
+
+    FLOW_WIDTH = 320  # Optical flow runs on frames downscaled to this width
+    GRID = 4  # Flow points per box side
+    MIN_FLOW_POINTS = 4
+    FORWARD_BACKWARD_MAX_PX = 1.0  # Points that do not track back to where they started are dropped
+    FLOW_STD = 0.02  # Measurement noise of flow boxes, in box heights
+    DETECTION_STD = 0.03  # Measurement noise of detected boxes, in box heights
+    IOU_THRESHOLD = 0.3
+    MAX_MISSES = 2  # Detections in a row that may miss a track before it is dropped
+    HISTORY = 32  # Frames kept to move late detections forward
+
+    def __init__(self):
+        self.tracks: List[Track] = []
+        self._next_id = 1
+        self._frames: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self._scale = 1.0
+        self._frame_size = None
+        self._gray = None
+        self._timestamp = None
+        self.seq = 0
+
+    def _prepare(self, frame: np.ndarray) -> np.ndarray:
+        height, width = frame.shape[:2]
+        self._frame_size = (width, height)
+        self._scale = min(1.0, self.FLOW_WIDTH / width)
+        small = cv2.resize(frame, (int(width * self._scale), int(height * self._scale)), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+    def _flow(self, src: np.ndarray, dst: np.ndarray, boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Moves xyxy boxes from gray frame src to dst. Returns the moved boxes and which moves were reliable"""
+        if len(boxes) == 0 or src.shape != dst.shape:
+            return boxes, np.zeros(len(boxes), dtype=bool)
+
+        # A grid of points inside each box, shrunk so the points are mostly on the object
+        steps = (np.arange(self.GRID) + 0.5) / self.GRID * 0.6 + 0.2
+        small = boxes[:, :4] * self._scale
+        xs = small[:, 0, None] + (small[:, 2] - small[:, 0])[:, None] * steps
+        ys = small[:, 1, None] + (small[:, 3] - small[:, 1])[:, None] * steps
+        points = np.stack([np.repeat(xs, self.GRID, axis=1), np.tile(ys, self.GRID)], axis=2).astype(np.float32)
+        points = points.reshape(-1, 1, 2)
+
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(src, dst, points, None, winSize=(15, 15), maxLevel=3)
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(dst, src, moved, None, winSize=(15, 15), maxLevel=3)
+        good = (status[:, 0] == 1) & (back_status[:, 0] == 1)
+        good &= np.linalg.norm(back - points, axis=2)[:, 0] < self.FORWARD_BACKWARD_MAX_PX
+
+        n = self.GRID * self.GRID
+        points, moved, good = points.reshape(-1, n, 2), moved.reshape(-1, n, 2), good.reshape(-1, n)
+        result = boxes.copy()
+        valid = np.zeros(len(boxes), dtype=bool)
+        for i in range(len(boxes)):
+            if good[i].sum() < self.MIN_FLOW_POINTS:
+                continue
+            before, after = points[i][good[i]], moved[i][good[i]]
+            shift = np.median(after - before, axis=0) / self._scale
+            spread_before = np.median(np.linalg.norm(before - before.mean(axis=0), axis=1))
+            spread_after = np.median(np.linalg.norm(after - after.mean(axis=0), axis=1))
+            scale = np.clip(spread_after / spread_before, 0.8, 1.25) if spread_before > 1e-3 else 1.0
+            centre, size = xyxy_to_cxcywh(boxes[i, :4])[:2] + shift, xyxy_to_cxcywh(boxes[i, :4])[2:] * scale
+            result[i, :4] = cxcywh_to_xyxy(np.concatenate([centre, size]))
+            valid[i] = True
+        return result, valid
+
+    def _catch_up(self, seq: int, boxes: np.ndarray) -> np.ndarray:
+        """Moves boxes detected in frame seq to the newest frame, one frame at a time so each flow step stays small"""
+        if seq not in self._frames or len(boxes) == 0:
+            return boxes
+        boxes = boxes.copy()
+        seqs = [frame_seq for frame_seq in self._frames if frame_seq >= seq]
+        for src, dst in zip(seqs, seqs[1:]):
+            boxes[:, :4] = self._flow(self._frames[src], self._frames[dst], boxes)[0][:, :4]
+        return boxes
+
+    def _associate(self, detections: np.ndarray):
+        """Updates tracks with detections already moved to the current frame, and starts tracks for new objects"""
+        unmatched = set(range(len(detections)))
+        matched_tracks = set()
+        if self.tracks and len(detections):
+            ious = iou_matrix(np.array([track.kalman.box for track in self.tracks]), detections[:, :4])
+            same_class = np.array([track.cls for track in self.tracks])[:, None] == detections[:, 5].astype(int)
+            ious[~same_class] = 0
+            # Greedy matching, best overlap first
+            for flat in np.argsort(-ious, axis=None):
+                t, d = np.unravel_index(flat, ious.shape)
+                if ious[t, d] < self.IOU_THRESHOLD:
+                    break
+                if t in matched_tracks or d not in unmatched:
+                    continue
+                track = self.tracks[t]
+                track.kalman.update(detections[d], self.DETECTION_STD)
+                track.conf = float(detections[d, 4])
+                track.hits += 1
+                track.misses = 0
+                matched_tracks.add(t)
+                unmatched.discard(d)
+
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+        for d in sorted(unmatched):
+            self.tracks.append(Track(self._next_id, detections[d]))
+            self._next_id += 1
+
+    def _prune(self):
+        width, height = self._frame_size
+        keep = []
+        for track in self.tracks:
+            x1, y1, x2, y2 = track.kalman.box
+            visible = max(0.0, min(x2, width) - max(x1, 0)) * max(0.0, min(y2, height) - max(y1, 0))
+            if track.misses <= self.MAX_MISSES and visible >= 0.2 * (x2 - x1) * (y2 - y1):
+                keep.append(track)
+        self.tracks = keep
+
+    def step(self, seq: int, timestamp: float, frame: np.ndarray,
+             detections: Sequence[FrameDetections] = ()) -> np.ndarray:
+        """Propagates the tracks to frame seq and folds in detections of this or earlier frames, see boxes()"""
+        gray = self._prepare(frame)
+        if self._timestamp is not None and self.tracks:
+            # Flow starts from where the boxes were in the previous frame, before the prediction moves them
+            moved, valid = self._flow(self._gray, gray, np.array([track.kalman.box for track in self.tracks]))
+            for track, box, ok in zip(self.tracks, moved, valid):
+                track.kalman.predict(timestamp - self._timestamp)
+                if ok:
+                    track.kalman.update(box, self.FLOW_STD)
+
+        self._frames[seq] = gray
+        while len(self._frames) > self.HISTORY:
+            self._frames.popitem(last=False)
+
+        for result in sorted(detections, key=lambda result: result.seq):
+            predictions = np.asarray(result.predictions, dtype=np.float32).reshape(-1, 6)
+            self._associate(self._catch_up(result.seq, predictions))
+
+        self._prune()
+        self._gray, self._timestamp, self.seq = gray, timestamp, seq
+        return self.boxes()
+
+    def boxes(self) -> np.ndarray:
+        """Current tracks as (xmin, ymin, xmax, ymax, conf, class, track_id) rows, like model predictions plus an ID"""
+        if not self.tracks:
+            return np.zeros((0, 7), dtype=np.float32)
+        return np.array([[*track.kalman.box, track.conf, track.cls, track.id] for track in self.tracks],
+                        dtype=np.float32)
+
+    def reset(self):
+        self.tracks = []
+        self._frames.clear()
+        self._gray = self._timestamp = None
+
+
+class TrackerThread(QThread):
+    """Runs a Tracker on every new frame of a FrameBuffer, fed with OdThread detections.
+
+    Connect OdThread.detections_ready to add_detections with Qt.DirectConnection. The newest per-frame boxes are
+    published in predictions, with their frame in predictions_seq, the same way OdThread publishes detections.
+    """
+
+    tracks_updated = Signal(int, object)  # (frame seq, boxes as in Tracker.boxes)
+
+    WAIT_TIMEOUT_S = 0.5
+
+    def __init__(self, frame_buffer: FrameBuffer, tracker: Optional[Tracker] = None, parent=None):
+        super().__init__(parent)
+        self.frame_buffer = frame_buffer
+        self.tracker = Tracker() if tracker is None else tracker
+        self._lock = threading.Lock()
+        self._pending: List[FrameDetections] = []
+        self._run_flag = True
+        self.predictions = None
+        self.predictions_seq = 0
+
+    def add_detections(self, results: List[FrameDetections]):
+        with self._lock:
+            self._pending.extend(results)
+
+    def run(self):
+        seq = 0
+        while self._run_flag:
+            new_seq = self.frame_buffer.wait(seq, timeout=self.WAIT_TIMEOUT_S)
+            if new_seq <= seq or not self._run_flag:
+                continue
+
+            # Not marked as read, so the frame buffer's drop count still reflects the display and the detector
+            with self.frame_buffer.latest(mark_read=False) as (seq, stamp, img):
+                if img is None:
+                    continue
+                start = time.perf_counter()
+                with self._lock:
+                    pending, self._pending = self._pending, []
+                boxes = self.tracker.step(seq, stamp, img, pending)
+            TRACKER_STEP_TIME.observe(time.perf_counter() - start)
+            TRACKER_FRAMES.inc()
+
+            self.predictions, self.predictions_seq = boxes, seq
+            self.tracks_updated.emit(seq, boxes)
+
+    def start(self):
+        self._run_flag = True
+        super().start()
+
+    def stop(self):
+        self._run_flag = False
+        self.wait()
+        self.predictions = None
+        self.predictions_seq = 0
+        self.tracker.reset()
@@ -1,47 +1,106 @@
 import logging
-from typing import Union
+import threading
+import time
+from typing import Callable, Optional, Union
 
 import cv2
 import numpy as np
 from PySide6 import QtGui
-from PySide6.QtCore import QObject, Qt, QThread, Signal, Slot
+from PySide6.QtCore import QObject, Qt, QThread, QTimer, Signal, Slot
 from PySide6.QtGui import QPixmap
 from PySide6.QtWidgets import QLabel
 
-from odbot.models.yolov5 import YoloV5Model
+from odbot.batch_scheduler import BatchScheduler, FrameDetections
+from odbot.frame_buffer import FrameBuffer
+from odbot.inference_scheduler import InferenceScheduler
+from odbot.metrics import METRICS
+from odbot.models.factory import DEFAULT_BACKEND, OUT_OF_PROCESS, create_model
+from odbot.network_stream import is_network_source, open_capture
+from odbot.tracker import TrackerThread
 
 log = logging.getLogger(__name__)
 
+FRAMES_CAPTURED = METRICS.counter("odbot_frames_captured_total", "Frames decoded into the frame buffer")
+FRAMES_DROPPED = METRICS.counter("odbot_frames_dropped_total", "Captured frames replaced before anyone read them")
+FRAMES_DISPLAYED = METRICS.counter("odbot_frames_displayed_total", "Frames converted and shown in the video label")
+CONVERT_TIME = METRICS.histogram("odbot_display_convert_seconds", "Frame to pixmap conversion time, with overlays")
+INFERENCE_TIME = METRICS.histogram("odbot_inference_seconds", "Object detection time per model call")
+DETECTION_FRAMES = METRICS.counter("odbot_detection_frames_total", "Frames run through object detection")
+DETECTION_SKIPPED = METRICS.counter("odbot_detection_skipped_frames_total",
+                                    "Frames superseded before object detection reached them")
+
 
 class VideoWorker(QObject):
-    change_pixmap_signal = Signal(np.ndarray)
     stream_stopped_signal = Signal()
+    stream_reconnecting_signal = Signal(bool)
+
+    RECONNECT_MIN_S = 0.5
+    RECONNECT_MAX_S = 8.0
 
-    def __init__(self, device: Union[int, str]):
+    def __init__(self, device: Union[int, str], frame_buffer: FrameBuffer, capture_fps: float = 0):
         super().__init__()
         self._device = device
         self._run_flag = True
+        self._stop_event = threading.Event()
+        self.frame_buffer = frame_buffer
+        self.capture_fps = capture_fps
+        self.reconnects = 0
+
+    def _reconnect(self, cap, backoff: float):
+        """Reopens a dropped network stream after waiting backoff seconds"""
+        log.warning(f"Lost video stream {self._device}, reconnecting in {backoff:.1f}s")
+        cap.release()
+        self.stream_reconnecting_signal.emit(True)
+        self._stop_event.wait(backoff)
+        self.reconnects += 1
+        return open_capture(self._device)
 
     def run(self):
         # capture from web cam
         log.debug(f"Starting video thread for device {self._device}")
-        cap = cv2.VideoCapture(self._device)
+        cap = open_capture(self._device)
 
         if cap is None or not cap.isOpened():
             log.debug(f"Stopping video thread for device {self._device}")
             self._run_flag = False
             self.stream_stopped_signal.emit()
 
+        network = is_network_source(self._device)
+        backoff = 0.0
+        last_commit = 0.0
         while self._run_flag:
-            ret, cv_img = cap.read()
+            # Above the capture rate only grab, which keeps the device queue drained without decoding
+            if self.capture_fps and time.monotonic() - last_commit < 1.0 / self.capture_fps:
+                cap.grab()
+                continue
+
+            # Read straight into a free preallocated slot when there is one
+            slot = self.frame_buffer.acquire()
+            ret, cv_img = cap.read() if slot is None else cap.read(slot)
             if ret:
-                self.change_pixmap_signal.emit(cv_img)
+                dropped = self.frame_buffer.dropped
+                self.frame_buffer.commit(cv_img)
+                FRAMES_CAPTURED.inc()
+                FRAMES_DROPPED.inc(self.frame_buffer.dropped - dropped)
+                last_commit = time.monotonic()
+                if backoff:
+                    log.info(f"Reconnected to video stream {self._device}")
+                    self.stream_reconnecting_signal.emit(False)
+                    backoff = 0.0
+            elif network:
+                backoff = min(max(backoff * 2, self.RECONNECT_MIN_S), self.RECONNECT_MAX_S)
+                cap = self._reconnect(cap, backoff)
         # shut down capture system
         cap.release()
 
+    def set_capture_fps(self, capture_fps: float):
+        """Limits how many frames per second are decoded into the buffer. A value of 0 decodes every frame"""
+        self.capture_fps = capture_fps
+
     def stop(self):
         """Sets run flag to False and waits for thread to finish"""
         self._run_flag = False
+        self._stop_event.set()
 
     def is_running(self):
         return self._run_flag
@@ -49,31 +108,63 @@ class VideoWorker(QObject):
 
 class VideoStream(QObject):
     stream_stopped_signal = Signal()
+    stream_reconnecting_signal = Signal(bool)
     od_started_signal = Signal()
 
-    def __init__(self, pixmap_label: QLabel, device: Union[int, str] = 0):
+    LABEL_FONT_SCALE = 0.5
+    DEFAULT_DISPLAY_FPS = 30
+
+    def __init__(self,
+                 pixmap_label: QLabel,
+                 device: Union[int, str] = 0,
+                 capture_fps: float = 0,
+                 display_fps: float = DEFAULT_DISPLAY_FPS,
+                 detection_fps: float = None,
+                 tracking: bool = True,
+                 adaptive_inference: bool = True):
         super().__init__()
         self.label = pixmap_label
         self.display_width, self.display_height = self.label.width(), self.label.height()
-        self.worker = VideoWorker(device=device)
-        self.worker.change_pixmap_signal.connect(self.update_image)
+        self.frame_buffer = FrameBuffer()
+        self.worker = VideoWorker(device=device, frame_buffer=self.frame_buffer, capture_fps=capture_fps)
         self.worker.stream_stopped_signal.connect(self.handle_stream_stopped)
+        self.worker.stream_reconnecting_signal.connect(self.stream_reconnecting_signal)
         self.thread = QThread()
         self.worker.moveToThread(self.thread)
         self.thread.started.connect(self.worker.run)
 
+        # The display pulls the newest frame on its own clock, independent of capture and detection rates
+        self.display_timer = QTimer(self)
+        self.display_timer.timeout.connect(self.update_image)
+        self.set_display_fps(display_fps)
+        self.detection_fps = OdThread.DEFAULT_TARGET_FPS if detection_fps is None else detection_fps
+
         self.od_thread = None
-        self.cv_img = None
+        # Moves the detected boxes along with every frame between detections, and gives them stable IDs
+        self.tracking = tracking
+        self.tracker_thread = None
+        # Detects around the tracked objects between full-frame detections, at a size that fits the latency budget
+        self.adaptive_inference = adaptive_inference
+        self.recorder = None
+        self._display_img = None
+        self._display_qimg = None
+        self._display_key = None
+        self._pixmap = QPixmap()
 
         log.info(f"Created stream with device {self.label}")
 
     def start(self):
         self.thread.start()
+        self.display_timer.start()
 
     def stop(self):
+        self.display_timer.stop()
         if self.od_thread is not None:
             self.od_thread.stop()
+        if self.tracker_thread is not None:
+            self.tracker_thread.stop()
         self.worker.stop()
+        self.frame_buffer.close()
         self.thread.terminate()
         self.thread.wait()
 
@@ -81,79 +172,253 @@ class VideoStream(QObject):
         self.stream_stopped_signal.emit()
         self.stop()
 
-    def set_object_detection(self, enabled: bool):
+    def set_object_detection(self,
+                             enabled: bool,
+                             backend: str = DEFAULT_BACKEND,
+                             on_initialised: Optional[Callable[[], None]] = None,
+                             on_load_failed: Optional[Callable[[str], None]] = None):
+        """Starts or stops object detection. The callbacks are connected before the OdThread starts, a cached model
+        can finish loading straight away"""
         if enabled:
-            self.od_thread = OdThread(video_stream=self)
+            scheduler = InferenceScheduler(tracks=self._tracked_boxes) if self.adaptive_inference else None
+            self.od_thread = OdThread(video_stream=self,
+                                      backend=backend,
+                                      target_fps=self.detection_fps,
+                                      scheduler=scheduler)
+            if self.recorder is not None:
+                self.od_thread.detections_ready.connect(self.recorder.record_detections)
+            if self.tracking:
+                self.tracker_thread = TrackerThread(self.frame_buffer)
+                self.od_thread.detections_ready.connect(self.tracker_thread.add_detections, Qt.DirectConnection)
+                self.tracker_thread.start()
+            if on_initialised is not None:
+                self.od_thread.initialised.connect(on_initialised)
+            if on_load_failed is not None:
+                self.od_thread.load_failed.connect(on_load_failed)
             self.od_thread.start()
         else:
             self.od_thread.stop()
+            if self.tracker_thread is not None:
+                self.tracker_thread.stop()
+                self.tracker_thread = None
+
+    def set_recorder(self, recorder):
+        """Records frames and detections with a SessionRecorder, or stops feeding the current one when None"""
+        if self.recorder is not None and self.od_thread is not None:
+            self.od_thread.detections_ready.disconnect(self.recorder.record_detections)
+        self.recorder = recorder
+        if recorder is not None:
+            recorder.attach_frames(self.frame_buffer)
+            if self.od_thread is not None:
+                self.od_thread.detections_ready.connect(recorder.record_detections)
+
+    def set_capture_fps(self, fps: float):
+        self.worker.set_capture_fps(fps)
+
+    def set_display_fps(self, fps: float):
+        """Sets how often the label is repainted. Unlike capture and detection, the display has no unlimited rate"""
+        if fps <= 0:
+            raise ValueError(f"Display fps must be positive, got {fps}")
+        self.display_timer.setInterval(int(1000 / fps))
+
+    def set_detection_fps(self, fps: float):
+        self.detection_fps = fps
+        if self.od_thread is not None:
+            self.od_thread.set_target_fps(fps)
+
+    @Slot()
+    def update_image(self):
+        """Updates the image_label with the newest frame in the buffer"""
+        if not self.label.isVisible() or self.label.window().isMinimized():
+            return
 
-    @Slot(np.ndarray)
-    def update_image(self, cv_img: np.ndarray):
-        """Updates the image_label with a new opencv image"""
-        self.cv_img = cv_img
-        qt_img = self.convert_cv_qt(cv_img)
+        self.display_width, self.display_height = self.label.width(), self.label.height()
+        predictions_seq = self._overlay_source().predictions_seq if self.od_thread is not None else 0
+        with self.frame_buffer.latest() as (seq, _, cv_img):
+            # Keep the cached pixmap if neither the frame, the overlay nor the label size changed
+            key = (seq, predictions_seq, self.display_width, self.display_height)
+            if cv_img is None or key == self._display_key:
+                return
+            self._display_key = key
+            start = time.perf_counter()
+            qt_img = self.convert_cv_qt(cv_img)
         self.label.setPixmap(qt_img)
+        CONVERT_TIME.observe(time.perf_counter() - start)
+        FRAMES_DISPLAYED.inc()
 
     def get_img(self):
-        return self.cv_img
+        return self.frame_buffer.copy_latest()[1]
+
+    def _tracked_boxes(self):
+        return self.tracker_thread.predictions if self.tracker_thread is not None else None
+
+    def _overlay_source(self):
+        """The tracker once it has boxes, since they follow every frame, otherwise the latest detections"""
+        if self.tracker_thread is not None and self.tracker_thread.predictions is not None:
+            return self.tracker_thread
+        return self.od_thread
 
-    def _print_detections(self, img: np.ndarray):
-        if self.od_thread is None or self.od_thread.predictions is None:
+    def _print_detections(self, img: np.ndarray, scale: float = 1.0):
+        """Draws the latest detections onto img, whose size is the source frame size times scale"""
+        source = self._overlay_source() if self.od_thread is not None else None
+        if source is None or source.predictions is None:
             return img
 
-        for pred in self.od_thread.predictions:
+        for pred in source.predictions:
             # convert pred to int
-            xmin, ymin, xmax, ymax, conf, object_class = pred
-            xmin, ymin, xmax, ymax = int(xmin), int(ymin), int(xmax), int(ymax)
-            object_class = self.od_thread.model.names[int(object_class)]
+            xmin, ymin, xmax, ymax, conf, object_class = pred[:6]
+            xmin, ymin, xmax, ymax = int(xmin * scale), int(ymin * scale), int(xmax * scale), int(ymax * scale)
+            label = f"{self.od_thread.model.names[int(object_class)]} {conf:.2f}"
+            if len(pred) > 6:
+                label = f"#{int(pred[6])} {label}"
 
             img = cv2.rectangle(img, (xmin, ymin), (xmax, ymax), (0, 255, 0), 2)
-            img = cv2.putText(img, f"{object_class} {conf:.2f}", (xmin, ymin), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0),
-                              2)
+            img = cv2.putText(img, label, (xmin, ymin), cv2.FONT_HERSHEY_SIMPLEX, self.LABEL_FONT_SCALE, (0, 255, 0),
+                              1)
 
         return img
 
+    def _get_display_buffer(self, width: int, height: int):
+        """Returns the reused BGR display buffer and the QImage wrapping its memory, reallocating on size changes"""
+        if self._display_img is None or self._display_img.shape[:2] != (height, width):
+            self._display_img = np.empty((height, width, 3), dtype=np.uint8)
+            self._display_qimg = QtGui.QImage(self._display_img.data, width, height, 3 * width,
+                                              QtGui.QImage.Format.Format_BGR888)
+        return self._display_img
+
     def convert_cv_qt(self, cv_img: np.ndarray):
         """Convert from an opencv image to QPixmap"""
-        det_img = self._print_detections(cv_img)
-        rgb_image = cv2.cvtColor(det_img, cv2.COLOR_BGR2RGB)
-        h, w, ch = rgb_image.shape
-        bytes_per_line = ch * w
-        convert_to_Qt_format = QtGui.QImage(rgb_image.data, w, h, bytes_per_line, QtGui.QImage.Format.Format_RGB888)
-        p = convert_to_Qt_format.scaled(self.display_width, self.display_height, Qt.AspectRatioMode.KeepAspectRatio)
-        return QPixmap.fromImage(p)
+        h, w = cv_img.shape[:2]
+        scale = min(self.display_width / w, self.display_height / h)
+        width, height = max(1, int(w * scale)), max(1, int(h * scale))
+
+        # Resize once, straight into the display buffer, and draw overlays there instead of on the source frame
+        display_img = self._get_display_buffer(width, height)
+        cv2.resize(cv_img, (width, height), dst=display_img, interpolation=cv2.INTER_LINEAR)
+        self._print_detections(display_img, scale)
+
+        self._pixmap.convertFromImage(self._display_qimg)
+        return self._pixmap
 
 
 class OdThread(QThread):
     initialised = Signal()
-
-    def __init__(self, video_stream: VideoStream, parent=None) -> None:
+    load_failed = Signal(str)
+    detections_ready = Signal(list)
+
+    DEFAULT_TARGET_FPS = 10
+    WAIT_TIMEOUT_S = 0.5  # Upper bound on how long a stop request can go unnoticed
+
+    def __init__(self,
+                 video_stream: VideoStream,
+                 backend: str = DEFAULT_BACKEND,
+                 target_fps: float = DEFAULT_TARGET_FPS,
+                 batch_size: int = 1,
+                 batch_timeout_ms: int = 50,
+                 scheduler: InferenceScheduler = None,
+                 out_of_process: bool = OUT_OF_PROCESS,
+                 parent=None) -> None:
         super().__init__(parent)
         self.video_stream = video_stream
+        self.frame_buffer = video_stream.frame_buffer
+        self.backend = backend
+        self.target_fps = target_fps
+        self.batch_size = batch_size
+        self.batch_timeout_ms = batch_timeout_ms
+        # Only used for single frames, batches always run on the whole frames
+        self.scheduler = scheduler
+        self.out_of_process = out_of_process
         self._run_flag = True
+        self._stop_event = threading.Event()
         self.predictions = None
+        self.predictions_seq = 0
+        self.skipped_frames = 0
 
     def load_model(self):
-        self.model = YoloV5Model()
+        try:
+            self.model = create_model(self.backend, out_of_process=self.out_of_process)
+        except Exception as e:
+            log.error(f"Error loading {self.backend} model: {e}")
+            self.load_failed.emit(str(e))
+            return False
+
         self.initialised.emit()
+        return True
+
+    def set_target_fps(self, target_fps: float):
+        """Sets the maximum detection rate. A value of 0 runs inference on every new frame"""
+        self.target_fps = target_fps
+
+    def _throttle(self, start: float, frames: int = 1):
+        if self.target_fps:
+            remaining = frames / self.target_fps - (time.monotonic() - start)
+            if remaining > 0:
+                self._stop_event.wait(remaining)
+
+    def _run_batched(self):
+        scheduler = BatchScheduler([self.frame_buffer], self.batch_size, self.batch_timeout_ms)
+        while self._run_flag:
+            start = time.monotonic()
+            batch = scheduler.collect(lambda: self._run_flag)
+            inference_start = time.perf_counter()
+            results = scheduler.run_batch(self.model, batch)
+            if not results:
+                continue
+            INFERENCE_TIME.observe(time.perf_counter() - inference_start)
+            DETECTION_FRAMES.inc(len(results))
+
+            newest = results[-1]
+            if self.predictions_seq:
+                skipped = newest.seq - self.predictions_seq - len(results)
+                self.skipped_frames += skipped
+                DETECTION_SKIPPED.inc(max(skipped, 0))
+            self.predictions, self.predictions_seq = newest.predictions, newest.seq
+            self.detections_ready.emit(results)
+            self._throttle(start, len(results))
 
     def run(self):
-        self.load_model()
+        if not self.load_model():
+            return
+
+        if self.batch_size > 1:
+            self._run_batched()
+            return
+
         while self._run_flag:
-            img = self.video_stream.get_img()
-            if img is None:
+            # Block until the capture thread publishes a frame we have not inferred yet
+            seq = self.frame_buffer.wait(self.predictions_seq, timeout=self.WAIT_TIMEOUT_S)
+            if seq <= self.predictions_seq or not self._run_flag:
                 continue
 
-            self.predictions = self.model.get_predictions(img)
+            start = time.monotonic()
+            with self.frame_buffer.latest() as (seq, stamp, img):
+                if img is None:
+                    continue
+                inference_start = time.perf_counter()
+                if self.scheduler is not None:
+                    predictions = self.scheduler.detect(self.model, img)
+                else:
+                    predictions = self.model.get_predictions(img)
+                INFERENCE_TIME.observe(time.perf_counter() - inference_start)
+            DETECTION_FRAMES.inc()
+
+            if self.predictions_seq:
+                self.skipped_frames += seq - self.predictions_seq - 1
+                DETECTION_SKIPPED.inc(seq - self.predictions_seq - 1)
+            self.predictions, self.predictions_seq = predictions, seq
+            self.detections_ready.emit([FrameDetections(0, seq, stamp, predictions)])
+            self._throttle(start)
 
     def start(self):
         """Start the thread"""
         self._run_flag = True
+        self._stop_event.clear()
         super().start()
 
     def stop(self):
         """Sets run flag to False and waits for thread to finish"""
         self._run_flag = False
+        self._stop_event.set()
         self.wait()
         self.predictions = None
+        self.predictions_seq = 0
@@ -0,0 +1,68 @@
+import threading
+import time
+
+from odbot.async_bot import AsyncBot
+from odbot.bot import Bot
+from odbot.fake_hub import FakeHub
+from odbot.hub_pool import HubPool
+
+
+def create_bot(latency_s: float = 0.0) -> AsyncBot:
+    return AsyncBot(Bot(None, "B", "A", hub_factory=lambda device=None: FakeHub(device, latency_s),
+                        hub_pool=HubPool()))
+
+
+def wait_until(condition, timeout_s: float = 2.0):
+    deadline = time.monotonic() + timeout_s
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_only_the_latest_targets_are_sent():
+    bot = create_bot()
+    release = threading.Event()
+    blocker = bot.call(release.wait)  # Keeps the I/O thread busy while the targets pile up
+    wait_until(blocker.running)
+
+    for position in (10, 20, 30):
+        bot.steer(position)
+    bot.accelerate(40)
+    bot.accelerate(50)
+    assert bot.coalesced == 3
+    assert bot.pending() == 2
+
+    release.set()
+    wait_until(lambda: bot.pending() == 0 and bot.commanded == {AsyncBot.STEER: 30, AsyncBot.SPEED: 50})
+    wait_until(lambda: abs(bot.get_steer_position().result(1.0) - 30) <= 1)
+    bot.disconnect_hub()
+
+
+def test_drive_calls_do_not_wait_for_the_hub():
+    bot = create_bot(latency_s=0.2)
+    start = time.perf_counter()
+    for i in range(100):
+        bot.steer(i % 60)
+        bot.accelerate(i)
+    assert time.perf_counter() - start < 0.1
+
+    wait_until(lambda: bot.pending() == 0)
+    assert bot.commanded == {AsyncBot.STEER: 99 % 60, AsyncBot.SPEED: 99}
+    bot.disconnect_hub()
+
+
+def test_a_busy_hub_is_released_once_its_call_returns():
+    bot = create_bot()
+    release = threading.Event()
+    closed = []
+    bot.bot.disconnect_hub = lambda: closed.append(True)
+    blocker = bot.call(release.wait)
+    wait_until(blocker.running)
+
+    bot.disconnect_hub(timeout=0.05)
+    assert not closed
+
+    release.set()
+    wait_until(lambda: closed == [True])
+    bot.disconnect_hub()
+    assert closed == [True]
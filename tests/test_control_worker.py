@@ -0,0 +1,51 @@
+import threading
+import time
+
+from PySide6.QtCore import Qt
+
+from odbot.calibration import CalibrationStore
+from odbot.control_worker import ControlWorker, ControlWorkerSignalValues
+from odbot.fake_hub import FakeHub
+from odbot.hub_pool import HUB_POOL
+from odbot.input_thread import ScriptedJoystickSource
+
+
+def create_worker(device: str, tmp_path) -> ControlWorker:
+    return ControlWorker(device,
+                         "B",
+                         "A",
+                         0,
+                         hub_factory=FakeHub,
+                         controller_source=ScriptedJoystickSource([], realtime=False),
+                         calibration_store=CalibrationStore(str(tmp_path / "calibration.json")))
+
+
+def test_stop_during_calibration_releases_everything_without_starting_telemetry(tmp_path):
+    device = "TEST-STOP-CALIBRATION"
+    worker = create_worker(device, tmp_path)
+    finished = threading.Event()
+    worker.finished.connect(finished.set, Qt.DirectConnection)
+
+    stop_times = []
+
+    def stop_when_connected(value: int):
+        if value == ControlWorkerSignalValues.CONNECTED:
+            start = time.perf_counter()
+            worker.stop()
+            stop_times.append(time.perf_counter() - start)
+
+    worker.signals.connection.connect(stop_when_connected, Qt.DirectConnection)
+    try:
+        thread = threading.Thread(target=worker.run)
+        thread.start()
+        thread.join(10)
+    finally:
+        worker.signals.connection.disconnect(stop_when_connected)
+
+    assert not thread.is_alive()
+    assert len(stop_times) == 1 and stop_times[0] < 0.05
+    assert finished.is_set()
+    assert worker.telemetry is None
+    assert not worker.controller.input_thread._thread.is_alive()
+    assert not HUB_POOL.in_use(device)
+    HUB_POOL.discard(device)
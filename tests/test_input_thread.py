@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pygame
+
+from odbot.input_thread import InputThread, ScriptedJoystickSource
+
+SCRIPT = [
+    ScriptedJoystickSource.axis(0.0, 0, 0.5),
+    ScriptedJoystickSource.button(0.0, 3),
+    ScriptedJoystickSource.hat(0.0, 0, (1, 0)),
+    ScriptedJoystickSource.button(0.0, 3, pressed=False),
+    ScriptedJoystickSource.removed(0.0),
+]
+
+
+def wait_until(condition, timeout_s: float = 2.0):
+    deadline = time.monotonic() + timeout_s
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_events_update_state_and_call_on_change():
+    source = ScriptedJoystickSource(SCRIPT, realtime=False)
+    states = []
+    thread = InputThread(source, on_change=states.append)
+    wait_until(source.finished)
+    thread.stop()
+
+    assert [state.seq for state in states] == [1, 2, 3, 4]
+    assert states[0].axes[0] == 0.5
+    assert states[1].buttons[3] == 1
+    assert states[2].hats[0] == (1, 0)
+    assert thread.state.buttons[3] == 0
+    assert thread.state.axes[0] == 0.5
+
+
+def test_drain_events_keeps_every_edge_in_order():
+    source = ScriptedJoystickSource(SCRIPT, realtime=False)
+    thread = InputThread(source)
+    wait_until(source.finished)
+    wait_until(lambda: thread.events.qsize() == len(SCRIPT))
+    thread.stop()
+
+    events = thread.drain_events()
+    assert [event.event.type for event in events] == [step[1] for step in SCRIPT]
+    assert [event.timestamp for event in events] == sorted(event.timestamp for event in events)
+    # The button went down and up again, both edges are there even though the state shows neither
+    assert pygame.JOYBUTTONDOWN in [event.event.type for event in events]
+    assert thread.drain_events() == []
+
+
+def test_realtime_script_waits_for_step_delays():
+    source = ScriptedJoystickSource([ScriptedJoystickSource.axis(0.3, 1, -1.0)])
+    changed = threading.Event()
+    start = time.monotonic()
+    thread = InputThread(source, on_change=lambda state: changed.set())
+    assert changed.wait(2.0)
+    elapsed = time.monotonic() - start
+    thread.stop()
+
+    assert elapsed >= 0.25
+    assert thread.state.axes[1] == -1.0
+
+
+class RecordingSource(ScriptedJoystickSource):
+    """Fails the test if close() is called while the input thread is inside wait_event()"""
+
+    def __init__(self):
+        super().__init__([])
+        self.waiting = 0
+        self.closed_while_waiting = False
+
+    def wait_event(self, timeout_s: float):
+        self.waiting += 1
+        try:
+            time.sleep(timeout_s)
+            return None
+        finally:
+            self.waiting -= 1
+
+    def close(self):
+        self.closed_while_waiting = self.waiting > 0
+        super().close()
+
+
+def test_stop_closes_source_after_the_thread_has_stopped():
+    source = RecordingSource()
+    thread = InputThread(source)
+    wait_until(lambda: source.waiting)
+    thread.stop()
+
+    assert not thread._thread.is_alive()
+    assert source._closed.is_set()
+    assert not source.closed_while_waiting
+
+
+def test_stop_from_on_change_does_not_deadlock():
+    # Delayed, so the thread is stored in holder before on_change runs
+    source = ScriptedJoystickSource([ScriptedJoystickSource.axis(0.1, 0, 1.0)])
+    holder = {}
+    stopped = threading.Event()
+
+    def on_change(state):
+        holder["thread"].stop()
+        stopped.set()
+
+    holder["thread"] = thread = InputThread(source, on_change=on_change)
+    assert stopped.wait(2.0)
+    wait_until(lambda: not thread._thread.is_alive())
+    assert source._closed.is_set()
@@ -0,0 +1,28 @@
+from odbot.loop_scheduler import LoopScheduler
+
+
+def test_stats_without_measurable_intervals():
+    scheduler = LoopScheduler(50, clock=lambda: 0.0)
+    runs = []
+    scheduler.add_stage("input", 50, lambda: runs.append(1))
+    deadline = scheduler.tick(0.0)
+    scheduler.tick(deadline)
+
+    stats = scheduler.stats()
+    assert stats["ticks"] == 2
+    assert stats["overruns"] == 0
+    assert "duration_p95_ms" in stats
+    assert "jitter_p95_ms" not in stats
+
+
+def test_stats_measure_jitter_against_the_period():
+    now = [0.0]
+    scheduler = LoopScheduler(50, clock=lambda: now[0])
+    deadline = 0.0
+    for interval in (0.02, 0.02, 0.03, 0.02):
+        deadline = scheduler.tick(deadline)
+        now[0] += interval
+
+    stats = scheduler.stats()
+    assert stats["ticks"] == 4
+    assert abs(stats["jitter_max_ms"] - 10.0) < 1e-6
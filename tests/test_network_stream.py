@@ -0,0 +1,47 @@
+import struct
+
+import cv2
+import numpy as np
+
+from odbot.network_stream import MjpegParser
+
+
+def jpeg_with_thumbnail(value: int) -> bytes:
+    """A JPEG carrying a smaller JPEG in an EXIF segment, like many phone camera frames"""
+    _, image = cv2.imencode(".jpg", np.full((48, 64, 3), value, dtype=np.uint8))
+    _, thumbnail = cv2.imencode(".jpg", np.full((12, 16, 3), 255 - value, dtype=np.uint8))
+    exif = b"Exif\0\0" + thumbnail.tobytes()
+    app1 = b"\xff\xe1" + struct.pack(">H", len(exif) + 2) + exif
+    image = image.tobytes()
+    return image[:2] + app1 + image[2:]
+
+
+def part(jpeg: bytes, content_length: bool = True) -> bytes:
+    headers = b"--frame\r\nContent-Type: image/jpeg\r\n"
+    if content_length:
+        headers += b"Content-Length: %d\r\n" % len(jpeg)
+    return headers + b"\r\n" + jpeg + b"\r\n"
+
+
+def feed_in_chunks(parser: MjpegParser, stream: bytes, size: int) -> list:
+    jpegs = []
+    for start in range(0, len(stream), size):
+        jpegs.extend(parser.feed(stream[start:start + size]))
+    return jpegs
+
+
+def test_parts_are_cut_by_content_length():
+    frames = [jpeg_with_thumbnail(value) for value in (40, 120, 200)]
+    stream = b"".join(part(frame) for frame in frames)
+
+    for size in (7, 1000, len(stream)):
+        jpegs = feed_in_chunks(MjpegParser(), stream, size)
+        assert jpegs == frames
+        assert cv2.imdecode(np.frombuffer(jpegs[-1], dtype=np.uint8), cv2.IMREAD_COLOR).shape == (48, 64, 3)
+
+
+def test_parts_without_content_length_fall_back_to_markers():
+    _, frame = cv2.imencode(".jpg", np.zeros((48, 64, 3), dtype=np.uint8))
+    stream = part(frame.tobytes(), content_length=False)
+
+    assert MjpegParser().feed(stream) == [frame.tobytes()]
@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pygame
+
+from odbot.input_thread import InputEvent, ScriptedJoystickSource
+from odbot.replay import Replay, ReplayFrame, ReplaySource
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "tests", "fixtures")
+
+
+class SyntheticSource(ReplaySource):
+
+    def __init__(self, steps, duration: float = 1.0):
+        super().__init__("synthetic", [InputEvent(t, pygame.event.Event(event_type, attributes))
+                                       for t, event_type, attributes in steps])
+        self.duration = duration
+
+    def frames(self):
+        for seq in range(1, 11):
+            yield ReplayFrame((seq - 1) / 10, seq, np.zeros((24, 32, 3), dtype=np.uint8))
+
+
+def test_recorded_session_replays_to_the_expected_trace():
+    """The fixture was recorded with a trigger, stick, A button and hat; regenerate session_trace.json with --trace
+    when a behaviour change is intended"""
+    command = [
+        sys.executable, "-m", "odbot.replay",
+        os.path.join(FIXTURES, "session.odrec"), "--backend", "recorded", "--runs", "2", "--expect",
+        os.path.join(FIXTURES, "session_trace.json")
+    ]
+    result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+
+    stats = json.loads(result.stdout[result.stdout.index("{"):])
+    assert stats["input_events"] == 8
+    assert stats["sounds"] == ["/extra_files/Hi"]
+
+
+def test_button_and_device_events_reach_the_control_worker():
+    source = SyntheticSource([
+        ScriptedJoystickSource.axis(0.1, 5, 1.0),
+        ScriptedJoystickSource.button(0.2, 0),
+        ScriptedJoystickSource.button(0.25, 0, pressed=False),
+        ScriptedJoystickSource.removed(0.5),
+        ScriptedJoystickSource.axis(0.7, 5, 0.0),
+    ])
+    result = Replay(source).run()
+
+    assert result.stats["sounds"] == ["/extra_files/Hi"]
+    assert result.stats["controller_stopped"]
+    assert result.stats["input_events"] == 4
+    assert all(t <= 0.5 for t, _, _ in result.trace.commands)